@@ -0,0 +1,164 @@
+"""
+メンバー × 日 × 1440分 の空き状況行列 (NumPy) による一括空き時間検索。
+
+「全員が空いている」「N人中K人以上が空いている」「参加可能人数の多い順のスロット」を
+Pythonのループではなく行列のリダクションで求める。大人数のグループ向け。
+"""
+from typing import Dict, List, Iterable, Sequence, Tuple, Any
+from datetime import date, time
+
+import numpy as np
+
+from free_slots import MINUTES_PER_DAY, time_to_start_minute, time_to_end_minute, minute_to_hhmm
+from event_store import EventStore
+
+
+class AvailabilityMatrix:
+    """
+    busy[m, d, t] が True のとき、members[m] は dates[d] の t 分 (0時起点) に予定が入っている。
+    """
+
+    def __init__(self, members: Sequence[str], dates: Sequence[date], busy: np.ndarray):
+        self.members = list(members)
+        self.dates = list(dates)
+        self.busy = busy
+
+    @classmethod
+    def from_events(cls, events: Iterable, members: Sequence[str], dates: Sequence[date]) -> "AvailabilityMatrix":
+        """
+        イベント (name, event_date, start_time, end_time 属性を持つもの) から行列を作る。
+        Pythonのループはイベントから (メンバー, 日, 開始分, 終了分) を取り出す部分だけで、塗りつぶしはベクトル化している。
+        """
+        member_index = {name: i for i, name in enumerate(members)}
+        date_index = {d: i for i, d in enumerate(dates)}
+
+        rows: List[Tuple[int, int, int, int]] = []
+        for event in events:
+            m = member_index.get(event.name)
+            d = date_index.get(event.event_date)
+            if m is None or d is None:
+                continue
+            start = time_to_start_minute(event.start_time)
+            end = min(time_to_end_minute(event.end_time), MINUTES_PER_DAY)
+            if start < end:
+                rows.append((m, d, start, end))
+
+        if rows:
+            return cls._filled(members, dates, *np.array(rows, dtype=np.int64).T)
+        return cls._filled(members, dates, *(np.zeros(0, dtype=np.int64),) * 4)
+
+    @classmethod
+    def from_store(cls, store: EventStore, members: Sequence[str], dates: Sequence[date]) -> "AvailabilityMatrix":
+        """EventStore から作る。メンバー・日付の対応付けも配列の添字の変換で行い、Pythonのループを通らない。"""
+        # store のメンバーID -> 行列の行 (対象外は -1)
+        member_rows = np.full(len(store.members), -1, dtype=np.int64)
+        wanted = {name: i for i, name in enumerate(members)}
+        for store_id, name in enumerate(store.members):
+            member_rows[store_id] = wanted.get(name, -1)
+        ordinals = np.array([d.toordinal() for d in dates], dtype=np.int64)
+        first = int(ordinals.min()) if len(ordinals) else 0
+        date_rows = np.full(int(ordinals.max()) - first + 1 if len(ordinals) else 0, -1, dtype=np.int64)
+        date_rows[ordinals - first] = np.arange(len(dates))
+
+        m_idx = member_rows[store.member]
+        day = store.day.astype(np.int64) - first
+        in_range = (day >= 0) & (day < len(date_rows))
+        d_idx = np.full(len(store), -1, dtype=np.int64)
+        d_idx[in_range] = date_rows[day[in_range]]
+        keep = (m_idx >= 0) & (d_idx >= 0)
+        return cls._filled(
+            members, dates, m_idx[keep], d_idx[keep],
+            store.start[keep].astype(np.int64), store.end[keep].astype(np.int64),
+        )
+
+    @classmethod
+    def _filled(cls, members, dates, m_idx: np.ndarray, d_idx: np.ndarray, starts: np.ndarray, ends: np.ndarray):
+        busy = np.zeros((len(members), len(dates), MINUTES_PER_DAY), dtype=bool)
+        if len(m_idx):
+            # 各イベントが占める分の平坦化インデックスを np.repeat で一括生成して塗りつぶす
+            lengths = ends - starts
+            offsets = np.repeat(np.cumsum(lengths) - lengths, lengths)
+            base = (m_idx * len(dates) + d_idx) * MINUTES_PER_DAY + starts
+            busy.reshape(-1)[np.repeat(base, lengths) + np.arange(lengths.sum()) - offsets] = True
+        return cls(members, dates, busy)
+
+    def packed(self) -> np.ndarray:
+        """分単位の軸をビットパックした行列 (保存・転送用)。元の1/8のサイズになる。"""
+        return np.packbits(self.busy, axis=2)
+
+    def slot_starts(self, duration_minutes: int, work_start: time, work_end: time) -> np.ndarray:
+        """業務開始時刻から duration 分刻みで並べたスロットの開始分 (/free_slots/ と同じ区切り方)"""
+        if duration_minutes <= 0:
+            raise ValueError("最小持続時間は1分以上を指定してください。")
+        start = time_to_start_minute(work_start)
+        end = time_to_end_minute(work_end)
+        count = max((end - start) // duration_minutes, 0)
+        return start + duration_minutes * np.arange(count, dtype=np.int32)
+
+    def busy_slots(self, duration_minutes: int, work_start: time, work_end: time) -> np.ndarray:
+        """(メンバー, 日, スロット) のブール行列。スロット内に1分でも予定があれば True。"""
+        starts = self.slot_starts(duration_minutes, work_start, work_end)
+        m, d = self.busy.shape[:2]
+        if len(starts) == 0:
+            return np.zeros((m, d, 0), dtype=bool)
+        window = self.busy[:, :, starts[0]:starts[0] + len(starts) * duration_minutes]
+        return window.reshape(m, d, len(starts), duration_minutes).any(axis=3)
+
+    def attendee_counts(self, duration_minutes: int, work_start: time, work_end: time) -> np.ndarray:
+        """(日, スロット) ごとの参加可能人数"""
+        busy_slots = self.busy_slots(duration_minutes, work_start, work_end)
+        return len(self.members) - busy_slots.sum(axis=0, dtype=np.int32)
+
+    def everyone_free(self, duration_minutes: int, work_start: time, work_end: time) -> np.ndarray:
+        """(日, スロット) ごとに全員が空いているかどうか"""
+        return self.at_least_free(len(self.members), duration_minutes, work_start, work_end)
+
+    def at_least_free(self, min_attendees: int, duration_minutes: int, work_start: time, work_end: time) -> np.ndarray:
+        """(日, スロット) ごとに min_attendees 人以上が空いているかどうか"""
+        return self.attendee_counts(duration_minutes, work_start, work_end) >= min_attendees
+
+    def search(
+        self,
+        duration_minutes: int,
+        work_start: time,
+        work_end: time,
+        min_attendees: int,
+        limit: int = 10,
+    ) -> Dict[str, Any]:
+        """
+        min_attendees 人以上が参加できるスロットを日付ごとにまとめ、
+        参加可能人数の多い順 (同数なら日時の早い順) に上位 limit 件を best として返す。
+        """
+        starts = self.slot_starts(duration_minutes, work_start, work_end)
+        busy_slots = self.busy_slots(duration_minutes, work_start, work_end)
+        counts = len(self.members) - busy_slots.sum(axis=0, dtype=np.int32)
+        ok = counts >= min_attendees
+
+        slots_by_date: Dict[str, List[Dict[str, Any]]] = {}
+        day_idx, slot_idx = np.nonzero(ok)
+        for d, s in zip(day_idx.tolist(), slot_idx.tolist()):
+            start = int(starts[s])
+            slots_by_date.setdefault(self.dates[d].isoformat(), []).append({
+                "start": minute_to_hhmm(start),
+                "end": minute_to_hhmm(start + duration_minutes),
+                "attendees": int(counts[d, s]),
+            })
+
+        best: List[Dict[str, Any]] = []
+        if limit > 0 and ok.any():
+            flat_counts = np.where(ok, counts, -1).ravel()
+            order = np.argsort(-flat_counts, kind="stable")[:limit]
+            for flat in order.tolist():
+                if flat_counts[flat] < 0:
+                    break
+                d, s = divmod(flat, counts.shape[1])
+                start = int(starts[s])
+                best.append({
+                    "date": self.dates[d].isoformat(),
+                    "start": minute_to_hhmm(start),
+                    "end": minute_to_hhmm(start + duration_minutes),
+                    "attendees": int(counts[d, s]),
+                    "absent": [self.members[m] for m in np.nonzero(busy_slots[:, d, s])[0].tolist()],
+                })
+
+        return {"members": self.members, "slots": slots_by_date, "best": best}
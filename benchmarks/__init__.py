@@ -0,0 +1,12 @@
+"""
+ベンチマーク。
+
+- synthetic: 再現可能な合成カレンダー (メンバー数・1人あたりの予定数・繰り返し予定の割合・月数を指定) の生成
+- suite: 主要なエンドポイント (TestClient 経由) と crud / 空き時間の関数を計測し、結果を JSON に保存する
+- compare: 2回分の結果の JSON を比べて、遅くなったケースを表示する
+
+    python -m benchmarks.suite --output before.json
+    python -m benchmarks.suite --output after.json --compare before.json
+
+bench_*.py は個別の変更の効果を確かめるための単独のスクリプト。
+"""
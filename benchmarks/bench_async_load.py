@@ -0,0 +1,163 @@
+"""
+混在したリクエストを同時に流したときのレイテンシ (p50/p99) を測る負荷テスト。
+
+アプリを httpx の ASGITransport で同じイベントループ上に載せ、--concurrency 本のクライアントから
+/events/, /free_slots/, /availability/, /schedule/, /events/delete_by_date_name/ を混ぜて送る。
+AIの呼び出しは --llm-ms ミリ秒待つだけのスタブに置き換える。
+async def のエンドポイントが同期的にDBを読むとイベントループ全体が止まり、
+他のリクエストのレイテンシ (特に p99) に表れる。
+
+DBは一時ファイルのSQLite (DATABASE_URL) を使い、--events 件の予定を事前に登録する。
+変更前の実装と比べる場合は、別のチェックアウトを --repo に指定して同じ条件で実行する。
+
+    git worktree add /tmp/before <比較したいコミット>
+    python benchmarks/bench_async_load.py --repo /tmp/before
+    python benchmarks/bench_async_load.py
+"""
+import argparse
+import asyncio
+import os
+import pathlib
+import random
+import statistics
+import sys
+import tempfile
+import time as time_module
+from datetime import date, time, timedelta
+
+YEAR, MONTH = 2025, 5
+
+
+def load_app(repo: pathlib.Path, db_path: str):
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+    os.environ.setdefault("GEMINI_API_KEY", "bench")
+    os.chdir(repo)  # frontend/ など、アプリが相対パスで参照するものに合わせる
+    sys.path.insert(0, str(repo))
+    import logging
+    logging.disable(logging.INFO)
+    import main  # noqa: E402
+    return main
+
+
+def seed(main, events: int, members: int):
+    import crud
+    import schemas
+    rng = random.Random(0)
+    first = date(YEAR, MONTH, 1)
+    batch = []
+    for _ in range(events):
+        start = rng.randrange(8, 20)
+        batch.append(schemas.EventCreate(
+            name=f"member{rng.randrange(members)}",
+            event_date=first + timedelta(days=rng.randrange(28)),
+            start_time=time(start),
+            end_time=time(start + 1),
+        ))
+    db = main.SessionLocal()
+    crud.create_events_bulk(db, batch)
+    db.close()
+
+
+def install_llm_stub(llm_ms: float):
+    import gemini
+    import schemas
+
+    async def fake_llm(name, schedule_text=None, image_data_list=None, image_mime_type_list=None, prepare_images=None):
+        await asyncio.sleep(llm_ms / 1000)
+        day = random.randrange(1, 29)
+        return {"name": name, "events": [
+            schemas.EventDetailProcessed(event_date=date(YEAR, MONTH, day), start_time=time(9), end_time=time(10)),
+        ]}
+
+    gemini.process_schedule_input_with_gemini = fake_llm
+
+
+def make_requests(members: int):
+    """(ラベル, 重み, リクエストを送る関数) のリスト"""
+    def events(client):
+        return client.get("/events/", params={"year": YEAR, "month": MONTH})
+
+    def free(client):
+        return client.get("/free_slots/", params={"year": YEAR, "month": MONTH, "duration_minutes": 60})
+
+    def avail(client):
+        return client.get("/availability/", params={"year": YEAR, "month": MONTH, "min_attendees": 1, "limit": 5})
+
+    def schedule(client):
+        return client.post("/schedule/", data={
+            "name": f"member{random.randrange(members)}", "schedule_text": "bench",
+            "target_year": YEAR, "target_month": MONTH,
+        })
+
+    def delete(client):
+        return client.request("DELETE", "/events/delete_by_date_name/", json={
+            "event_date": date(YEAR, MONTH, random.randrange(1, 29)).isoformat(),
+            "name": f"member{random.randrange(members)}",
+        })
+
+    return [("events", 4, events), ("free_slots", 4, free), ("availability", 1, avail),
+            ("schedule", 2, schedule), ("delete", 1, delete)]
+
+
+async def run_load(app, requests, total: int, concurrency: int):
+    import httpx
+    labels = [label for label, weight, _ in requests for _ in range(weight)]
+    senders = {label: send for label, _, send in requests}
+    latencies = {label: [] for label, _, _ in requests}
+    errors = []
+    queue = asyncio.Queue()
+    for _ in range(total):
+        queue.put_nowait(random.choice(labels))
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        async def worker():
+            while not queue.empty():
+                label = queue.get_nowait()
+                t0 = time_module.perf_counter()
+                response = await senders[label](client)
+                latencies[label].append(time_module.perf_counter() - t0)
+                if response.status_code >= 500:
+                    errors.append((label, response.status_code))
+
+        t0 = time_module.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time_module.perf_counter() - t0
+    return latencies, errors, elapsed
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repo", default=str(pathlib.Path(__file__).resolve().parent.parent), help="計測するアプリのディレクトリ")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--events", type=int, default=500, help="事前に登録する予定の件数")
+    parser.add_argument("--members", type=int, default=40)
+    parser.add_argument("--llm-ms", type=float, default=50.0)
+    args = parser.parse_args()
+
+    random.seed(1)
+    with tempfile.TemporaryDirectory() as tmp:
+        app_module = load_app(pathlib.Path(args.repo).resolve(), f"{tmp}/bench.db")
+        seed(app_module, args.events, args.members)
+        install_llm_stub(args.llm_ms)
+        latencies, errors, elapsed = asyncio.run(
+            run_load(app_module.app, make_requests(args.members), args.requests, args.concurrency)
+        )
+
+    print(f"repo={args.repo} requests={args.requests} concurrency={args.concurrency} "
+          f"throughput={args.requests / elapsed:.1f} req/s errors={len(errors)}")
+    everything = [v for values in latencies.values() for v in values]
+    for label, values in list(latencies.items()) + [("all", everything)]:
+        if values:
+            print(f"  {label:12s} n={len(values):5d} p50={statistics.median(values) * 1000:7.1f} ms "
+                  f"p99={percentile(values, 0.99) * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
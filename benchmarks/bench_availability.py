@@ -0,0 +1,66 @@
+"""
+/availability/ の空き状況行列のベンチマーク。
+
+500人 × 1か月分のイベントから行列を作り、全員/K人以上/参加人数順の検索にかかる時間を測る。
+全員が空いているスロットは free_slots モジュールの結果と一致することも確認する。
+
+    python benchmarks/bench_availability.py --members 500 --events-per-member 40
+"""
+import argparse
+import pathlib
+import sys
+import time as time_module
+from datetime import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+import availability  # noqa: E402
+import free_slots  # noqa: E402
+from bench_free_slots import generate_events, timed  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, default=500)
+    parser.add_argument("--events-per-member", type=int, default=40)
+    parser.add_argument("--duration", type=int, default=60)
+    parser.add_argument("--min-attendees", type=int, default=None)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    events, members, target_dates = generate_events(args.members, args.events_per_member, 2025, 5, args.seed)
+    work_start, work_end = time(7, 0), time(22, 0)
+    min_attendees = args.min_attendees or int(len(members) * 0.9)
+    print(f"members={args.members} events={len(events)} days={len(target_dates)} "
+          f"duration={args.duration} min_attendees={min_attendees}")
+
+    build_s, matrix = timed(lambda: availability.AvailabilityMatrix.from_events(events, members, target_dates), args.repeat)
+    print(f"build matrix      : {build_s * 1000:8.2f} ms  ({matrix.busy.nbytes / 1e6:.1f} MB bool, "
+          f"{matrix.packed().nbytes / 1e6:.1f} MB packed)")
+
+    search_s, _ = timed(lambda: matrix.search(args.duration, work_start, work_end, min_attendees), args.repeat)
+    print(f"search (>= K)     : {search_s * 1000:8.2f} ms")
+    print(f"build + search    : {(build_s + search_s) * 1000:8.2f} ms")
+
+    everyone_s, everyone = timed(lambda: matrix.everyone_free(args.duration, work_start, work_end), args.repeat)
+    print(f"everyone free     : {everyone_s * 1000:8.2f} ms")
+
+    t0 = time_module.perf_counter()
+    expected = free_slots.find_common_free_slots(events, members, target_dates, args.duration, work_start, work_end)
+    print(f"sweep (everyone)  : {(time_module.perf_counter() - t0) * 1000:8.2f} ms")
+    starts = matrix.slot_starts(args.duration, work_start, work_end)
+    actual = {}
+    for d, s in zip(*everyone.nonzero()):
+        start = int(starts[s])
+        actual.setdefault(target_dates[d].isoformat(), []).append({
+            "start": free_slots.minute_to_hhmm(start),
+            "end": free_slots.minute_to_hhmm(start + args.duration),
+        })
+    if actual != expected:
+        raise SystemExit("全員が空いているスロットが free_slots の結果と一致しません")
+    print("everyone-free slots match free_slots")
+
+
+if __name__ == "__main__":
+    main()
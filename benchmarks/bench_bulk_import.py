@@ -0,0 +1,134 @@
+"""
+複数メンバーの一括登録 (/schedule/bulk/) のベンチマーク。
+
+OpenAI互換の応答を返すスタブサーバーをローカルに立て、--members 人分の予定テキストを
+- /schedule/ を1人ずつ順に呼ぶ (従来のオンボーディング)
+- /schedule/bulk/ を1回呼ぶ
+の2通りで登録し、所要時間・モデル呼び出し回数・コミット回数を比較する。
+スタブは複数人をまとめたプロンプトには全員分の応答を返し、応答の遅延は
+--delay 秒 + 1人あたり --per-member-delay 秒 (出力トークン数に比例する分) とする。
+DBは一時ファイルのSQLiteを使い、登録された予定の件数が両方式で一致することも確認する。
+
+    python benchmarks/bench_bulk_import.py --members 50 --delay 1.0
+"""
+import argparse
+import asyncio
+import json
+import os
+import pathlib
+import re
+import sys
+import tempfile
+import threading
+import time as time_module
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+MEMBER_EVENTS = [{"day_of_week": "Monday", "start": "09:00", "end": "10:30"},
+                 {"date": "2025-05-20", "start": "14:00", "end": "16:00"}]
+
+
+def start_stub_server(delay: float, per_member_delay: float):
+    stats = {"requests": 0, "members": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            system_prompt = request["messages"][0]["content"]
+            user_text = request["messages"][1]["content"][0]["text"]
+            names = re.findall(r"氏名: (.+)", user_text)
+            if '"members"' in system_prompt:
+                content = {"members": [{"name": name, "events": MEMBER_EVENTS} for name in names]}
+            else:
+                content = {"name": names[0], "events": MEMBER_EVENTS}
+            with lock:
+                stats["requests"] += 1
+                stats["members"] += len(names)
+            time_module.sleep(delay + per_member_delay * len(names))
+            body = json.dumps({
+                "id": "stub", "object": "chat.completion", "created": 0, "model": "stub",
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": json.dumps(content, ensure_ascii=False)}}],
+                "usage": {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20},
+            }).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, stats
+
+
+async def run(members: int):
+    import httpx
+    from sqlalchemy import event
+    import main
+
+    commits = [0]
+    event.listen(main.async_engine.sync_engine, "commit", lambda conn: commits.__setitem__(0, commits[0] + 1))
+    texts = {i: f"毎週月曜 9:00-10:30、5月20日 14:00-16:00 (member {i})" for i in range(members)}
+    results = {}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench", timeout=None) as client:
+        commits[0] = 0
+        t0 = time_module.perf_counter()
+        for i, text in texts.items():
+            response = await client.post("/schedule/", data={
+                "name": f"seq{i}", "schedule_text": text, "target_year": 2025, "target_month": 5,
+            })
+            response.raise_for_status()
+        results["sequential"] = (time_module.perf_counter() - t0, commits[0])
+
+        commits[0] = 0
+        t0 = time_module.perf_counter()
+        response = await client.post("/schedule/bulk/", json={
+            "target_year": 2025, "target_month": 5,
+            "entries": [{"name": f"bulk{i}", "schedule_text": text} for i, text in texts.items()],
+        })
+        response.raise_for_status()
+        results["bulk"] = (time_module.perf_counter() - t0, commits[0])
+        assert response.json()["failed_members"] == 0, response.json()["members"]
+
+        events = (await client.get("/events/", params={"year": 2025, "month": 5})).json()
+        counts = {prefix: sum(1 for e in events if e["name"].startswith(prefix)) for prefix in ("seq", "bulk")}
+        await main.gemini.close_client()
+    return results, counts
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, default=50)
+    parser.add_argument("--delay", type=float, default=1.0, help="スタブサーバーの1リクエストあたりの応答遅延 (秒)")
+    parser.add_argument("--per-member-delay", type=float, default=0.05, help="まとめたプロンプトの1人あたりの追加遅延 (秒)")
+    args = parser.parse_args()
+
+    server, stats = start_stub_server(args.delay, args.per_member_delay)
+    tmp = tempfile.TemporaryDirectory()
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp.name}/bench.db"
+    os.environ["GEMINI_API_KEY"] = "stub"
+    os.environ["GEMINI_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}/"
+
+    import logging
+    logging.disable(logging.WARNING)
+
+    requests_before = stats["requests"]
+    results, counts = asyncio.run(run(args.members))
+    server.shutdown()
+
+    for mode, (elapsed, commits) in results.items():
+        print(f"{mode:10s}: {args.members} members in {elapsed:6.2f} s, commits={commits}")
+    print(f"model requests: {stats['requests'] - requests_before} total (sequential uses one per member)")
+    print(f"events created: {counts}")
+    assert counts["seq"] == counts["bulk"], "一括登録と1人ずつの登録で予定の件数が一致しない"
+    tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main_cli()
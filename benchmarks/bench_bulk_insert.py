@@ -0,0 +1,77 @@
+"""
+/schedule/ の登録部分のベンチマーク。
+
+5日 × 6コマの時間割を crud.expand_recurring_event_for_month で1か月分に展開し、
+crud.create_event を1件ずつ呼ぶ旧方式と crud.create_events_bulk を比較する。
+一時ファイルのSQLiteを使うので、コミットごとの fsync も含めた時間になる。
+
+    python benchmarks/bench_bulk_insert.py --repeat 5
+"""
+import argparse
+import pathlib
+import statistics
+import sys
+import tempfile
+import time as time_module
+from datetime import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import create_engine, event  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+import crud  # noqa: E402
+import models  # noqa: E402
+
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
+PERIODS = [(time(8, 40), time(9, 55)), (time(10, 10), time(11, 25)), (time(12, 15), time(13, 30)),
+           (time(13, 45), time(15, 0)), (time(15, 15), time(16, 30)), (time(16, 45), time(18, 0))]
+
+
+def timetable_events(name: str, year: int, month: int):
+    events = []
+    for weekday in WEEKDAYS:
+        for start, end in PERIODS:
+            events.extend(crud.expand_recurring_event_for_month(name, weekday, start, end, year, month))
+    return events
+
+
+def run(mode: str, repeat: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{tmp}/bench.db", connect_args={"check_same_thread": False})
+        models.Base.metadata.create_all(bind=engine)
+        SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        commits = [0]
+        event.listen(engine, "commit", lambda conn: commits.__setitem__(0, commits[0] + 1))
+
+        latencies = []
+        rows = 0
+        for i in range(repeat):
+            events = timetable_events(f"member{i}", 2025, 5)
+            rows = len(events)
+            db = SessionLocal()
+            t0 = time_module.perf_counter()
+            if mode == "per-event":
+                for e in events:
+                    crud.create_event(db=db, event=e)
+            else:
+                crud.create_events_bulk(db=db, events=events)
+            latencies.append(time_module.perf_counter() - t0)
+            db.close()
+        engine.dispose()
+        return rows, commits[0] / repeat, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for mode in ("per-event", "bulk"):
+        rows, commits, latencies = run(mode, args.repeat)
+        print(f"{mode:9s}: rows/request={rows} commits/request={commits:.0f} "
+              f"median={statistics.median(latencies) * 1000:.1f} ms max={max(latencies) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
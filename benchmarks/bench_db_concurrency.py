@@ -0,0 +1,130 @@
+"""
+読み書きが同時に発生したときのDBの負荷テスト。
+
+一時ファイルのSQLiteに対して、読み取りスレッド (crud.get_events_by_month) と
+書き込みスレッド (crud.create_events_bulk) を --seconds 秒間同時に動かし、
+database.make_engine のプロファイルごとにスループットとレイテンシ、エラー数を比較する。
+"plain" は従来の create_engine の既定値 (rollback ジャーナル、synchronous=FULL)。
+
+    python benchmarks/bench_db_concurrency.py --readers 8 --writers 2 --seconds 5
+
+PostgreSQL で試す場合は --url で接続先を指定する (テーブルは作成されるが、登録したデータは残る)。
+"""
+import argparse
+import pathlib
+import statistics
+import sys
+import tempfile
+import threading
+import time as time_module
+from datetime import date, time, timedelta
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+import crud  # noqa: E402
+import database  # noqa: E402
+import models  # noqa: E402
+import schemas  # noqa: E402
+
+YEAR, MONTH = 2025, 5
+
+
+def write_batch(writer_id: int, i: int, month: int = MONTH + 1):
+    """読み取り対象の件数が書き込み量で変わらないよう、既定では翌月に書き込む"""
+    first = date(YEAR, month, 1)
+    return [
+        schemas.EventCreate(
+            name=f"writer{writer_id}",
+            event_date=first + timedelta(days=(i + k) % 28),
+            start_time=time(9 + k % 8),
+            end_time=time(10 + k % 8),
+        )
+        for k in range(20)
+    ]
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run(url: str, profile: str, readers: int, writers: int, seconds: float):
+    engine = database.make_engine(url, profile)
+    models.Base.metadata.create_all(bind=engine)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    # 読み取り対象の月に初期データを入れておく
+    with SessionLocal() as db:
+        crud.create_events_bulk(db, [e for i in range(50) for e in write_batch(99, i, MONTH)])
+
+    deadline = time_module.perf_counter() + seconds
+    read_latencies, write_latencies, errors = [], [], []
+    lock = threading.Lock()
+
+    def reader():
+        local = []
+        while time_module.perf_counter() < deadline:
+            t0 = time_module.perf_counter()
+            try:
+                with SessionLocal() as db:
+                    crud.get_events_by_month(db, YEAR, MONTH)
+                local.append(time_module.perf_counter() - t0)
+            except Exception as e:
+                with lock:
+                    errors.append(repr(e))
+        with lock:
+            read_latencies.extend(local)
+
+    def writer(writer_id: int):
+        local = []
+        i = 0
+        while time_module.perf_counter() < deadline:
+            t0 = time_module.perf_counter()
+            try:
+                with SessionLocal() as db:
+                    crud.create_events_bulk(db, write_batch(writer_id, i))
+                local.append(time_module.perf_counter() - t0)
+            except Exception as e:
+                with lock:
+                    errors.append(repr(e))
+            i += 1
+        with lock:
+            write_latencies.extend(local)
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=writer, args=(w,)) for w in range(writers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    engine.dispose()
+    return read_latencies, write_latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--url", help="既定は一時ファイルのSQLite (プロファイルごとに作り直す)")
+    parser.add_argument("--profiles", default="plain,sqlite")
+    args = parser.parse_args()
+
+    for profile in args.profiles.split(","):
+        with tempfile.TemporaryDirectory() as tmp:
+            url = args.url or f"sqlite:///{tmp}/bench.db"
+            reads, writes, errors = run(url, profile, args.readers, args.writers, args.seconds)
+        print(f"{profile:7s}: reads={len(reads) / args.seconds:7.1f}/s "
+              f"p50={statistics.median(reads or [0]) * 1000:6.1f} ms p99={percentile(reads, 0.99) * 1000:6.1f} ms | "
+              f"writes={len(writes) / args.seconds:6.1f}/s "
+              f"p50={statistics.median(writes or [0]) * 1000:6.1f} ms p99={percentile(writes, 0.99) * 1000:6.1f} ms | "
+              f"errors={len(errors)}")
+        for message in sorted(set(errors))[:3]:
+            print(f"    {message}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+削除処理のベンチマーク。
+
+一時ファイルのSQLiteに --rows 件のイベントを登録し、
+- /all_delete の旧方式 (全行をORMで読み込んで db.delete を1件ずつ) と crud.delete_all_events
+- (氏名, 期間) の組を1件ずつコミットして削除する方式と crud.delete_events_batch
+を比較する。削除後に行が残っていないことも確認する。
+
+    python benchmarks/bench_delete.py --rows 100000
+"""
+import argparse
+import pathlib
+import random
+import sys
+import tempfile
+import time as time_module
+import uuid
+from datetime import date, time, timedelta
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import create_engine, func, insert, select  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+import crud  # noqa: E402
+import models  # noqa: E402
+
+START = date(2025, 1, 1)
+DAYS = 365
+
+
+def populate(SessionLocal, rows: int, members: int, seed: int = 0):
+    rng = random.Random(seed)
+    data = []
+    for _ in range(rows):
+        start_minute = rng.randrange(8 * 60, 20 * 60)
+        data.append({
+            "id": str(uuid.uuid4()),
+            "name": f"member{rng.randrange(members)}",
+            "event_date": START + timedelta(days=rng.randrange(DAYS)),
+            "start_time": time(start_minute // 60, start_minute % 60),
+            "end_time": time(min(start_minute + 60, 23 * 60) // 60, min(start_minute + 60, 23 * 60) % 60),
+        })
+    with SessionLocal() as db:
+        db.execute(insert(models.Event), data)
+        db.commit()
+
+
+def count_rows(SessionLocal) -> int:
+    with SessionLocal() as db:
+        return db.execute(select(func.count()).select_from(models.Event)).scalar_one()
+
+
+def legacy_delete_all(db):
+    for event in crud.get_all_events(db):
+        db.delete(event)
+    db.commit()
+
+
+def batch_items(members: int, weeks: int):
+    """メンバーごとに weeks 週分の期間を削除対象にする"""
+    return [
+        (f"member{m}", START + timedelta(weeks=w), START + timedelta(weeks=w, days=6))
+        for m in range(members)
+        for w in range(0, weeks * 2, 2)
+    ]
+
+
+def run(mode: str, rows: int, members: int, weeks: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{tmp}/bench.db", connect_args={"check_same_thread": False})
+        models.Base.metadata.create_all(bind=engine)
+        SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        populate(SessionLocal, rows, members)
+
+        db = SessionLocal()
+        t0 = time_module.perf_counter()
+        if mode == "all/orm-loop":
+            legacy_delete_all(db)
+        elif mode == "all/set-based":
+            crud.delete_all_events(db)
+        elif mode == "range/per-item":
+            for name, start_date, end_date in batch_items(members, weeks):
+                crud.delete_events_by_date_and_name(db, start_date, name)
+                for offset in range(1, (end_date - start_date).days + 1):
+                    crud.delete_events_by_date_and_name(db, start_date + timedelta(days=offset), name)
+        else:
+            crud.delete_events_batch(db, batch_items(members, weeks))
+        elapsed = time_module.perf_counter() - t0
+        db.close()
+        remaining = count_rows(SessionLocal)
+        engine.dispose()
+        return elapsed, remaining
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--members", type=int, default=50)
+    parser.add_argument("--weeks", type=int, default=10, help="バッチ削除でメンバーごとに削除する週の数")
+    args = parser.parse_args()
+
+    results = {}
+    for mode in ("all/orm-loop", "all/set-based", "range/per-item", "range/batch"):
+        elapsed, remaining = run(mode, args.rows, args.members, args.weeks)
+        results[mode] = remaining
+        print(f"{mode:15s}: {elapsed * 1000:9.1f} ms  remaining rows={remaining}")
+
+    assert results["all/orm-loop"] == results["all/set-based"] == 0
+    assert results["range/per-item"] == results["range/batch"], "バッチ削除の結果が1件ずつの削除と一致しない"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+EventStore (整数の列による予定の表現) と ORMオブジェクトの経路の比較。
+
+一時ファイルの SQLite に benchmarks.synthetic で1か月分の予定 (既定 1000人 × 100件 = 10万件) を登録し、
+- 保持しているメモリ (tracemalloc): crud.get_events_by_month の ORMオブジェクトのリスト / EventStore
+- 読み込み: crud.get_events_by_month / crud.get_event_rows_in_range + EventStore.from_rows
+- 空き時間: free_slots.find_common_free_slots (ORMオブジェクト) / EventStore.free_slot_minutes
+- /free_slots/ の計算 (busy_cache のメンバーごとの区間から): free_slots.common_busy_by_date + compute_free_slot_minutes /
+  EventStore.from_intervals + free_slot_minutes (一部を読み直した月) / 月全体の EventStore を対象メンバーで絞る (読み込んだままの月)
+- メンバーごとの区間 (busy_cache の形): メンバーごとに busy_intervals_by_date / EventStore.member_busy_by_date
+の時間を --repeat 回の中央値で比べ、結果が一致することも確認する。
+
+    python benchmarks/bench_event_store.py --members 1000 --events-per-member 100
+"""
+import argparse
+import gc
+import logging
+import os
+import pathlib
+import statistics
+import sys
+import tempfile
+import time as time_module
+import tracemalloc
+from datetime import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+WORK_START, WORK_END = time(7, 0), time(22, 0)
+
+
+def measure(func, repeat: int) -> float:
+    durations = []
+    for _ in range(repeat):
+        t0 = time_module.perf_counter()
+        func()
+        durations.append(time_module.perf_counter() - t0)
+    return statistics.median(durations)
+
+
+def retained_bytes(func) -> int:
+    """func の返り値を保持している間に増えたメモリ (返り値が参照しているものの合計)"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    value = func()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del value
+    return after - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, default=1000)
+    parser.add_argument("--events-per-member", type=int, default=100)
+    parser.add_argument("--recurring-share", type=float, default=0.2)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp.name}/bench.db"
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+    logging.disable(logging.INFO)
+
+    from benchmarks import synthetic
+    import crud
+    import free_slots
+    import migrations
+    from database import SessionLocal, engine
+    from event_store import EventStore
+
+    migrations.run_migrations(engine)
+    spec = synthetic.CalendarSpec(
+        members=args.members, events_per_member=args.events_per_member, recurring_share=args.recurring_share, months=1,
+    )
+    db = SessionLocal()
+    counts = synthetic.load(db, spec)
+    year, month = spec.month_list()[0]
+    first, last = crud.month_range(year, month)
+    members = spec.member_names()
+    target_dates = [first.fromordinal(ordinal) for ordinal in range(first.toordinal(), last.toordinal() + 1)]
+
+    def load_orm():
+        db.expunge_all()
+        return crud.get_events_by_month(db, year, month)
+
+    def load_store():
+        return EventStore.from_rows(crud.get_event_rows_in_range(db, first, last))
+
+    events = load_orm()
+    store = load_store()
+    print(f"spec={spec.to_dict()} loaded={counts} events_in_month={len(events)} store_rows={len(store)}")
+
+    # 結果の一致を確認する
+    expected = free_slots.compute_free_slot_minutes(
+        free_slots.busy_intervals_by_date(events, members), target_dates, 60, WORK_START, WORK_END)
+    assert store.free_slot_minutes(members, target_dates, 60, WORK_START, WORK_END) == expected, "空き時間が一致しない"
+    by_member = {}
+    for event in events:
+        by_member.setdefault(event.name, []).append(event)
+    expected_member = {name: free_slots.busy_intervals_by_date(member_events) for name, member_events in by_member.items()}
+    assert store.member_busy_by_date() == expected_member, "メンバーごとの区間が一致しない"
+    assert EventStore.from_intervals(expected_member, members).free_slot_minutes(
+        None, target_dates, 60, WORK_START, WORK_END) == expected, "区間から作った EventStore の空き時間が一致しない"
+
+    def cached_intervals_dict():
+        return free_slots.compute_free_slot_minutes(
+            free_slots.common_busy_by_date(expected_member, members), target_dates, 60, WORK_START, WORK_END)
+
+    def cached_intervals_store():
+        return EventStore.from_intervals(expected_member, members).free_slot_minutes(None, target_dates, 60, WORK_START, WORK_END)
+
+    print("memory (retained):")
+    orm_bytes = retained_bytes(load_orm)
+    store_bytes = retained_bytes(load_store)
+    print(f"  ORM objects      : {orm_bytes / 1024 / 1024:8.1f} MiB")
+    print(f"  EventStore       : {store_bytes / 1024 / 1024:8.1f} MiB (columns {store.nbytes / 1024 / 1024:.1f} MiB, {orm_bytes / store_bytes:.0f}x smaller)")
+
+    rows = [
+        ("load", lambda: load_orm(), load_store),
+        ("free slots", lambda: free_slots.find_common_free_slots(events, members, target_dates, 60, WORK_START, WORK_END),
+         lambda: free_slots.format_free_slots(store.free_slot_minutes(members, target_dates, 60, WORK_START, WORK_END))),
+        ("member intervals", lambda: {name: free_slots.busy_intervals_by_date(member_events)
+                                      for name, member_events in by_member.items()}, store.member_busy_by_date),
+        ("/free_slots/ (refreshed)", cached_intervals_dict, cached_intervals_store),
+        ("/free_slots/ (loaded)", cached_intervals_dict,
+         lambda: store.free_slot_minutes(members, target_dates, 60, WORK_START, WORK_END)),
+    ]
+    print(f"time (median of {args.repeat}):              dict path  EventStore")
+    for label, orm_func, store_func in rows:
+        orm_seconds = measure(orm_func, args.repeat)
+        store_seconds = measure(store_func, args.repeat)
+        print(f"  {label:24s} {orm_seconds * 1000:10.1f} ms {store_seconds * 1000:10.1f} ms ({orm_seconds / store_seconds:.1f}x)")
+    db.close()
+    tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
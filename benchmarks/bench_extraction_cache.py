@@ -0,0 +1,100 @@
+"""
+AI抽出結果キャッシュのベンチマーク。
+
+gemini.get_client を一定時間待ってから固定の応答を返すスタブに差し替え、
+同じ入力を繰り返し送ったときに2回目以降がモデルを呼ばずにミリ秒で返ることを確認する。
+画像はスマホの写真 (12MP の JPEG) を合成し、/schedule/ と同じく前処理 (image_processing) を渡して呼ぶ。
+キャッシュに当たった場合は前処理もしないので、2回目以降には前処理の時間も含まれない。
+--db を指定すると SQLite への永続化も有効にし、メモリ上のキャッシュを消した状態からの読み出しも測る。
+
+    python benchmarks/bench_extraction_cache.py --delay 0.5 --db /tmp/extraction_cache.db
+"""
+import argparse
+import asyncio
+import json
+import os
+import pathlib
+import sys
+import time as time_module
+from types import SimpleNamespace
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+STUB_CONTENT = json.dumps({
+    "name": "stub",
+    "events": [{"day_of_week": day, "start": "09:00", "end": "10:30"}
+               for day in ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday")],
+})
+
+
+class StubCompletions:
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.calls = 0
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        message = SimpleNamespace(content=STUB_CONTENT)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+async def run(delay: float, repeat: int):
+    import gemini
+    import extraction_cache
+
+    completions = StubCompletions(delay)
+    stub_client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    gemini.get_client = lambda: stub_client
+    gemini._semaphore = asyncio.Semaphore(gemini.LLM_MAX_CONCURRENCY)
+
+    import image_processing
+    from benchmarks.bench_image_preprocessing import sample_images
+
+    _, image, mime_type = sample_images()[1] # 4032x3024 の写真
+    timings = []
+    for _ in range(repeat):
+        t0 = time_module.perf_counter()
+        result = await gemini.process_schedule_input_with_gemini(
+            name="member", schedule_text="時間割", image_data_list=[image], image_mime_type_list=[mime_type],
+            prepare_images=image_processing.preprocess_images)
+        timings.append(time_module.perf_counter() - t0)
+
+    persisted = None
+    if extraction_cache.cache.stats()["persistent"]:
+        extraction_cache.cache._entries.clear() # メモリ上だけ消して SQLite から読む
+        t0 = time_module.perf_counter()
+        await gemini.process_schedule_input_with_gemini(
+            name="member", schedule_text="時間割", image_data_list=[image], image_mime_type_list=[mime_type],
+            prepare_images=image_processing.preprocess_images)
+        persisted = time_module.perf_counter() - t0
+
+    return timings, persisted, completions.calls, len(result["events"]), extraction_cache.cache.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--delay", type=float, default=0.5, help="スタブのモデル応答時間 (秒)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--db", default=None, help="永続化用の SQLite ファイル")
+    args = parser.parse_args()
+
+    os.environ["GEMINI_API_KEY"] = "stub"
+    if args.db:
+        os.environ["EXTRACTION_CACHE_DB"] = args.db
+        if os.path.exists(args.db):
+            os.remove(args.db)
+    import logging
+    logging.disable(logging.INFO)
+
+    timings, persisted, calls, events, stats = asyncio.run(run(args.delay, args.repeat))
+    print(f"first call (miss): {timings[0] * 1000:8.2f} ms")
+    for i, t in enumerate(timings[1:], start=2):
+        print(f"call {i} (hit)     : {t * 1000:8.2f} ms")
+    if persisted is not None:
+        print(f"sqlite hit        : {persisted * 1000:8.2f} ms")
+    print(f"model calls={calls} events={events} stats={stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+/free_slots/ の計算部分のベンチマーク。
+
+旧実装 (日 × スロット × メンバー × 月内の全イベント の多重ループ) と
+free_slots モジュールのソート＆スイープ実装を同じデータで比較し、結果が一致することも確認する。
+
+    python benchmarks/bench_free_slots.py --members 300 --events-per-member 40
+"""
+import argparse
+import pathlib
+import random
+import sys
+import time as time_module
+from datetime import date, datetime, time, timedelta
+from types import SimpleNamespace
+from typing import Dict, List
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+import free_slots  # noqa: E402
+
+
+def legacy_free_slots(events, target_members, target_dates, duration_minutes, work_start_t, work_end_t):
+    """main.get_free_slots の旧ループ実装をそのまま切り出したもの"""
+    free_slots_by_date: Dict[str, List[Dict[str, str]]] = {}
+    slot_duration = timedelta(minutes=duration_minutes)
+    for target_date_obj in target_dates:
+        daily_free_slots_for_all_members: List[Dict[str, str]] = []
+        current_slot_start_dt = datetime.combine(target_date_obj, work_start_t)
+        work_end_dt_for_day = datetime.combine(target_date_obj, work_end_t)
+        while current_slot_start_dt + slot_duration <= work_end_dt_for_day:
+            current_slot_end_dt = current_slot_start_dt + slot_duration
+            slot_is_free_for_all = True
+            for member_name in target_members:
+                member_is_busy_in_slot = False
+                for event in events:
+                    if event.name == member_name and event.event_date == target_date_obj:
+                        event_start_dt = datetime.combine(event.event_date, event.start_time)
+                        event_end_dt = datetime.combine(event.event_date, event.end_time)
+                        if max(current_slot_start_dt, event_start_dt) < min(current_slot_end_dt, event_end_dt):
+                            member_is_busy_in_slot = True
+                            break
+                if member_is_busy_in_slot:
+                    slot_is_free_for_all = False
+                    break
+            if slot_is_free_for_all:
+                daily_free_slots_for_all_members.append({
+                    "start": current_slot_start_dt.time().strftime("%H:%M"),
+                    "end": current_slot_end_dt.time().strftime("%H:%M")
+                })
+            current_slot_start_dt = current_slot_end_dt
+        if daily_free_slots_for_all_members:
+            free_slots_by_date[target_date_obj.isoformat()] = daily_free_slots_for_all_members
+    return free_slots_by_date
+
+
+def generate_events(members: int, events_per_member: int, year: int, month: int, seed: int):
+    rng = random.Random(seed)
+    first = date(year, month, 1)
+    days = ((first.replace(day=28) + timedelta(days=4)).replace(day=1) - first).days
+    events = []
+    for m in range(members):
+        name = f"member{m:04d}"
+        for _ in range(events_per_member):
+            start = rng.randrange(6 * 60, 22 * 60, 15)
+            end = min(start + rng.choice([30, 60, 90, 120, 180]), 23 * 60 + 59)
+            events.append(SimpleNamespace(
+                name=name,
+                event_date=first + timedelta(days=rng.randrange(days)),
+                start_time=time(start // 60, start % 60),
+                end_time=time(end // 60, end % 60),
+            ))
+    target_dates = [first + timedelta(days=i) for i in range(days)]
+    return events, [f"member{m:04d}" for m in range(members)], target_dates
+
+
+def timed(fn, repeat: int):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        t0 = time_module.perf_counter()
+        result = fn()
+        best = min(best, time_module.perf_counter() - t0)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, default=50)
+    parser.add_argument("--events-per-member", type=int, default=20)
+    parser.add_argument("--duration", type=int, default=60)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--skip-legacy", action="store_true", help="旧実装を実行しない (メンバー数が多い場合用)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    events, members, target_dates = generate_events(args.members, args.events_per_member, 2025, 5, args.seed)
+    work_start, work_end = time(7, 0), time(22, 0)
+    print(f"members={args.members} events={len(events)} days={len(target_dates)} duration={args.duration}")
+
+    new_s, new_result = timed(lambda: free_slots.find_common_free_slots(
+        events, members, target_dates, args.duration, work_start, work_end), args.repeat)
+    print(f"sweep : {new_s * 1000:10.2f} ms")
+
+    if not args.skip_legacy:
+        old_s, old_result = timed(lambda: legacy_free_slots(
+            events, members, target_dates, args.duration, work_start, work_end), args.repeat)
+        print(f"legacy: {old_s * 1000:10.2f} ms  (x{old_s / new_s:.1f})")
+        if old_result != new_result:
+            raise SystemExit("結果が旧実装と一致しません")
+        print("results match")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+画像前処理のベンチマーク。
+
+時間割のスクリーンショット (PNG) とスマホで撮った時間割の写真 (EXIF付き JPEG) を合成して用意し、
+前処理の前後で、画像サイズ、base64 にしたモデルへのリクエストサイズ、処理時間を比較する。
+送信時間は --mbps の帯域を仮定した推定値 (リクエストサイズ / 帯域)。
+
+    python benchmarks/bench_image_preprocessing.py --mbps 20
+"""
+import argparse
+import asyncio
+import io
+import pathlib
+import random
+import sys
+import time as time_module
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from PIL import Image, ImageDraw  # noqa: E402
+
+import gemini  # noqa: E402
+import image_processing  # noqa: E402
+
+
+def timetable_image(width: int, height: int, noise: bool, seed: int) -> Image.Image:
+    rng = random.Random(seed)
+    img = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(img)
+    cols, rows = 6, 7
+    cw, rh = width // cols, height // rows
+    for c in range(cols + 1):
+        draw.line([(c * cw, 0), (c * cw, height)], fill="gray", width=max(2, width // 500))
+    for r in range(rows + 1):
+        draw.line([(0, r * rh), (width, r * rh)], fill="gray", width=max(2, width // 500))
+    for c in range(1, cols):
+        for r in range(1, rows):
+            if rng.random() < 0.6:
+                color = tuple(rng.randrange(150, 255) for _ in range(3))
+                draw.rectangle([c * cw + 6, r * rh + 6, (c + 1) * cw - 6, (r + 1) * rh - 6], fill=color)
+                draw.text((c * cw + 12, r * rh + 12), f"Lecture {c}-{r}", fill="black")
+    if noise:
+        # 写真らしさを出すためのノイズ (圧縮しにくくなる)
+        noise_layer = Image.effect_noise((width, height), 24).convert("RGB")
+        img = Image.blend(img, noise_layer, 0.15)
+    return img
+
+
+def sample_images():
+    samples = []
+    screenshot = io.BytesIO()
+    timetable_image(1170, 2532, noise=False, seed=1).save(screenshot, format="PNG")
+    samples.append(("screenshot.png", screenshot.getvalue(), "image/png"))
+    for i in range(3):
+        photo = io.BytesIO()
+        exif = Image.Exif()
+        exif[0x0112] = 6 # Orientation: 90度回転
+        exif[0x010F] = "PhoneMaker"
+        timetable_image(4032, 3024, noise=True, seed=10 + i).save(photo, format="JPEG", quality=95, exif=exif)
+        samples.append((f"photo{i}.jpg", photo.getvalue(), "image/jpeg"))
+    return samples
+
+
+def payload_bytes(images, mime_types):
+    return sum(len(gemini.image_to_base64_data_url(data, mime)) for data, mime in zip(images, mime_types))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mbps", type=float, default=20.0, help="上り回線の帯域 (Mbps)")
+    args = parser.parse_args()
+
+    samples = sample_images()
+    datas = [data for _, data, _ in samples]
+    mimes = [mime for _, _, mime in samples]
+
+    for name, data, mime in samples:
+        t0 = time_module.perf_counter()
+        processed, processed_mime = image_processing.preprocess_image(data, mime)
+        elapsed = time_module.perf_counter() - t0
+        with Image.open(io.BytesIO(processed)) as img:
+            size, has_exif = img.size, bool(img.getexif())
+        print(f"{name:15s} {len(data) / 1e6:7.2f} MB -> {len(processed) / 1e6:6.2f} MB "
+              f"({processed_mime}, {size[0]}x{size[1]}, exif={has_exif}) {elapsed * 1000:7.1f} ms")
+
+    t0 = time_module.perf_counter()
+    serial = [image_processing.preprocess_image(d, m) for d, m in zip(datas, mimes)]
+    serial_s = time_module.perf_counter() - t0
+    t0 = time_module.perf_counter()
+    processed, processed_mimes = asyncio.run(image_processing.preprocess_images(datas, mimes))
+    parallel_s = time_module.perf_counter() - t0
+    assert [d for d, _ in serial] == processed
+
+    before = payload_bytes(datas, mimes)
+    after = payload_bytes(processed, processed_mimes)
+    bytes_per_s = args.mbps * 1e6 / 8
+    print(f"preprocess {len(samples)} images: serial {serial_s * 1000:.0f} ms, thread pool {parallel_s * 1000:.0f} ms "
+          f"({image_processing.IMAGE_WORKERS} workers)")
+    print(f"model request payload: {before / 1e6:.2f} MB -> {after / 1e6:.2f} MB "
+          f"(saved {(before - after) / 1e6:.2f} MB, {100 * (1 - after / before):.0f}%)")
+    print(f"estimated upload + preprocess at {args.mbps:.0f} Mbps: before {before / bytes_per_s:.2f} s, "
+          f"after {parallel_s + after / bytes_per_s:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
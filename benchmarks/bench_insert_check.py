@@ -0,0 +1,119 @@
+"""
+登録時の重複・重なりの検出 (interval_index.plan_inserts) のベンチマーク。
+
+既存の予定 n 件がある状態で、その半分と完全に一致する予定を含む n 件を登録するとして、
+- interval_index.plan_inserts (bisect による (メンバー, 日付) ごとの索引)
+- 総当たり (同じメンバー・日付の全ての予定と比べる)
+の時間を比べ、結果が一致することを確認する。n を倍々にしたときの伸び方で O(n log n) 程度かを見る。
+--db を付けると、一時ファイルの SQLite で crud.create_events_checked と crud.create_events_bulk の時間も比べる。
+
+    python benchmarks/bench_insert_check.py --sizes 1000 4000 16000 64000 --db
+"""
+import argparse
+import logging
+import os
+import pathlib
+import random
+import sys
+import tempfile
+import time as time_module
+from datetime import date, time, timedelta
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+import interval_index  # noqa: E402
+import schemas  # noqa: E402
+
+
+def generate(n: int, members: int, seed: int):
+    """(既存の行, 登録する予定)。登録する予定の半分は既存の予定と同じもの。"""
+    rng = random.Random(seed)
+    first = date(2025, 5, 1)
+
+    def random_event():
+        start = rng.randrange(7 * 60, 21 * 60, 15)
+        end = min(start + rng.choice((30, 60, 90, 120)), 23 * 60 + 59)
+        return schemas.EventCreate(
+            name=f"member{rng.randrange(members):04d}", event_date=first + timedelta(days=rng.randrange(31)),
+            start_time=time(start // 60, start % 60), end_time=time(end // 60, end % 60),
+        )
+
+    existing = [random_event() for _ in range(n)]
+    stored = [(f"id{i}", e.name, e.event_date, e.start_time, e.end_time) for i, e in enumerate(existing)]
+    incoming = rng.sample(existing, n // 2) + [random_event() for _ in range(n - n // 2)]
+    rng.shuffle(incoming)
+    return stored, incoming
+
+
+def brute_force(stored, incoming):
+    """同じメンバー・日付の全ての予定 (既存 + それまでに登録した予定) と1件ずつ比べる"""
+    rows = [(name, d, s, e) for _, name, d, s, e in stored]
+    inserted, duplicates, conflicts = [], 0, 0
+    for event in incoming:
+        same_day = [row for row in rows if row[0] == event.name and row[1] == event.event_date]
+        if any(row[2] == event.start_time and row[3] == event.end_time for row in same_day):
+            duplicates += 1
+            continue
+        conflicts += sum(1 for row in same_day if row[2] < event.end_time and event.start_time < row[3])
+        rows.append((event.name, event.event_date, event.start_time, event.end_time))
+        inserted.append(event)
+    return inserted, duplicates, conflicts
+
+
+def timed(func):
+    t0 = time_module.perf_counter()
+    value = func()
+    return time_module.perf_counter() - t0, value
+
+
+def bench_db(n: int, members: int, seed: int) -> None:
+    tmp = tempfile.TemporaryDirectory()
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp.name}/bench.db"
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+    import crud
+    import migrations
+    from database import SessionLocal, engine
+
+    migrations.run_migrations(engine)
+    stored, incoming = generate(n, members, seed)
+    db = SessionLocal()
+    crud.create_events_bulk(db, [schemas.EventCreate(name=r[1], event_date=r[2], start_time=r[3], end_time=r[4]) for r in stored])
+    unchecked, _ = timed(lambda: crud.create_events_bulk(db, incoming, commit=False))
+    db.rollback()
+    checked, (created, plan) = timed(lambda: crud.create_events_checked(db, incoming, commit=False))
+    db.rollback()
+    print(f"db n={n}: create_events_bulk {unchecked * 1000:8.1f} ms, create_events_checked {checked * 1000:8.1f} ms "
+          f"({len(created)} inserted, {len(plan.duplicates)} duplicates, {len(plan.conflicts)} conflicts)")
+    db.close()
+    tmp.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 4000, 16000, 64000])
+    parser.add_argument("--members", type=int, default=200)
+    parser.add_argument("--brute-force-max", type=int, default=16000, help="総当たりを実行する最大の件数")
+    parser.add_argument("--db", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    previous = None
+    for n in args.sizes:
+        stored, incoming = generate(n, args.members, args.seed)
+        seconds, plan = timed(lambda: interval_index.plan_inserts(stored, [], incoming))
+        growth = f" (x{seconds / previous:.1f} for x{n / prev_n:.0f} events)" if previous else ""
+        line = f"n={n:6d} plan_inserts {seconds * 1000:8.1f} ms{growth}"
+        if n <= args.brute_force_max:
+            brute_seconds, (inserted, duplicates, conflicts) = timed(lambda: brute_force(stored, incoming))
+            assert inserted == plan.events and duplicates == len(plan.duplicates) and conflicts == len(plan.conflicts)
+            line += f", brute force {brute_seconds * 1000:10.1f} ms (x{brute_seconds / seconds:.0f}), results match"
+        print(line + f"  [{len(plan.events)} inserted, {len(plan.duplicates)} duplicates, {len(plan.conflicts)} conflicts]")
+        previous, prev_n = seconds, n
+
+    if args.db:
+        bench_db(args.sizes[-1], args.members, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+AIによる予定抽出の実行中に、他のリクエストが待たされないことを確認するベンチマーク。
+
+OpenAI互換の応答を一定時間遅らせて返すスタブサーバーをローカルに立て、
+/schedule/ を N 件同時に送っている間の /events/ のレイテンシを、抽出なしの場合と比較する。
+同期クライアントでモデルを呼んでいた頃は、抽出1件ごとにイベントループが止まり /events/ も待たされていた。
+
+    python benchmarks/bench_llm_concurrency.py --extractions 8 --delay 1.0
+"""
+import argparse
+import asyncio
+import json
+import os
+import pathlib
+import statistics
+import sys
+import threading
+import time as time_module
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+STUB_CONTENT = json.dumps({
+    "name": "stub",
+    "events": [{"day_of_week": "Monday", "start": "09:00", "end": "10:30"},
+               {"date": "2025-05-20", "start": "14:00", "end": "16:00"}],
+})
+
+
+def start_stub_server(delay: float) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time_module.sleep(delay)
+            body = json.dumps({
+                "id": "stub", "object": "chat.completion", "created": 0, "model": "stub",
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": STUB_CONTENT}}],
+                "usage": {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20},
+            }).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def measure_events_latency(client, stop: asyncio.Event, samples: list):
+    while not stop.is_set():
+        t0 = time_module.perf_counter()
+        response = await client.get("/events/", params={"year": 2025, "month": 5})
+        response.raise_for_status()
+        samples.append(time_module.perf_counter() - t0)
+        await asyncio.sleep(0.01)
+
+
+async def run(extractions: int, duration: float):
+    import httpx
+    import main
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench") as client:
+        # 抽出なしでの /events/ のレイテンシ
+        idle: list = []
+        stop = asyncio.Event()
+        task = asyncio.create_task(measure_events_latency(client, stop, idle))
+        await asyncio.sleep(duration)
+        stop.set()
+        await task
+
+        # 抽出を N 件実行中の /events/ のレイテンシ
+        busy: list = []
+        stop = asyncio.Event()
+        task = asyncio.create_task(measure_events_latency(client, stop, busy))
+        t0 = time_module.perf_counter()
+        responses = await asyncio.gather(*[
+            client.post("/schedule/", data={"name": f"member{i}", "schedule_text": "毎週月曜 9:00-10:30",
+                                            "target_year": 2025, "target_month": 5})
+            for i in range(extractions)
+        ])
+        extraction_wall = time_module.perf_counter() - t0
+        stop.set()
+        await task
+        await main.gemini.close_client()
+
+    statuses = sorted({r.status_code for r in responses})
+    return idle, busy, extraction_wall, statuses
+
+
+def describe(samples):
+    samples = sorted(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    return f"n={len(samples):4d} p50={statistics.median(samples) * 1000:7.1f} ms p99={p99 * 1000:7.1f} ms max={samples[-1] * 1000:7.1f} ms"
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--extractions", type=int, default=8)
+    parser.add_argument("--delay", type=float, default=1.0, help="スタブサーバーの応答遅延 (秒)")
+    args = parser.parse_args()
+
+    server = start_stub_server(args.delay)
+    os.environ["GEMINI_API_KEY"] = "stub"
+    os.environ["GEMINI_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}/"
+
+    import logging
+    logging.disable(logging.INFO)
+
+    idle, busy, extraction_wall, statuses = asyncio.run(run(args.extractions, args.delay))
+    server.shutdown()
+
+    print(f"/events/ idle                       : {describe(idle)}")
+    print(f"/events/ with {args.extractions:2d} extractions in flight: {describe(busy)}")
+    print(f"{args.extractions} extractions (stub delay {args.delay:.1f}s) took {extraction_wall:.2f} s, statuses={statuses}")
+
+
+if __name__ == "__main__":
+    main_cli()
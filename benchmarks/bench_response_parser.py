@@ -0,0 +1,147 @@
+"""
+モデルの応答の解析 (response_parser) のマイクロベンチマーク。
+
+--events 件 (既定 10000) の予定を含む応答を作り、
+- 従来の解析 (json.loads + GeminiResponseEvent による検証 + 1件ずつ strptime/split して EventDetailProcessed を検証付きで作成)
+- response_parser.parse_extraction (orjson があれば orjson、正規表現とキャッシュによる時刻・日付の解析)
+- 途中で切れた応答からの復元 (response_parser が読める部分だけを使う経路)
+- ストリーミングの断片 (--chunk-chars 文字ずつ) を IncrementalExtractionParser で読み進める経路
+の所要時間を --repeat 回の中央値で比較する。従来の解析と結果が一致することも確認する。
+
+    python benchmarks/bench_response_parser.py --events 10000
+"""
+import argparse
+import json
+import logging
+import pathlib
+import random
+import statistics
+import sys
+import time as time_module
+from datetime import date, time, timedelta, datetime as dt
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+import response_parser  # noqa: E402
+from schemas import GeminiResponseEvent, EventDetailProcessed  # noqa: E402
+
+
+def make_response(events: int) -> str:
+    rng = random.Random(0)
+    first = date(2025, 5, 1)
+    items = []
+    for i in range(events):
+        start = rng.randrange(7, 21)
+        item = {"start": f"{start:02d}:{rng.choice((0, 15, 30, 45)):02d}", "end": f"{start + 1:02d}:00"}
+        if i % 5 == 0:
+            item["day_of_week"] = response_parser.WEEKDAY_NAMES[rng.randrange(7)]
+        else:
+            item["date"] = (first + timedelta(days=rng.randrange(61))).isoformat()
+        items.append(item)
+    return json.dumps({"name": "bench", "events": items}, ensure_ascii=False)
+
+
+def legacy_parse(raw_response_content: str):
+    """変更前の gemini.py の解析処理 (ログ出力を除く)"""
+    cleaned = raw_response_content.strip()
+    if cleaned.startswith("```json"):
+        cleaned = cleaned[7:]
+    if cleaned.endswith("```"):
+        cleaned = cleaned[:-3]
+    shell = GeminiResponseEvent.model_validate(json.loads(cleaned.strip()))
+
+    def parse_time_str(time_str):
+        if not isinstance(time_str, str):
+            return None
+        try:
+            parts = time_str.split(':')
+            return time(int(parts[0]), int(parts[1]), int(parts[2]) if len(parts) > 2 else 0)
+        except (ValueError, IndexError, TypeError):
+            return None
+
+    def parse_date_str(date_str):
+        if not isinstance(date_str, str):
+            return None
+        try:
+            return dt.strptime(date_str, "%Y-%m-%d").date()
+        except (ValueError, TypeError):
+            return None
+
+    processed = []
+    for event_dict in shell.events:
+        if not isinstance(event_dict, dict):
+            continue
+        start_time_obj = parse_time_str(event_dict.get("start"))
+        end_time_obj = parse_time_str(event_dict.get("end"))
+        if not start_time_obj or not end_time_obj:
+            continue
+        date_str = event_dict.get("date")
+        day_of_week_str = event_dict.get("day_of_week")
+        processed.append(EventDetailProcessed(
+            event_date=parse_date_str(date_str) if date_str else None,
+            day_of_week=day_of_week_str if isinstance(day_of_week_str, str) else None,
+            start_time=start_time_obj,
+            end_time=end_time_obj,
+        ))
+    return {"name": shell.name, "events": processed}
+
+
+def measure(func, repeat: int) -> float:
+    durations = []
+    for _ in range(repeat):
+        t0 = time_module.perf_counter()
+        func()
+        durations.append(time_module.perf_counter() - t0)
+    return statistics.median(durations)
+
+
+def as_tuples(result):
+    return [(e.event_date, e.day_of_week, e.start_time, e.end_time) for e in result["events"]]
+
+
+def parse_incremental(raw: str, chunk_chars: int):
+    """断片ごとに IncrementalExtractionParser に渡し、閉じた予定をその都度変換する"""
+    incremental = response_parser.IncrementalExtractionParser()
+    events = []
+    for i in range(0, len(raw), chunk_chars):
+        items = incremental.feed(raw[i:i + chunk_chars])
+        if items:
+            events.extend(response_parser.parse_events(items))
+    return {"name": incremental.name, "events": events}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--chunk-chars", type=int, default=24, help="ストリーミングの1断片の文字数")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    raw = make_response(args.events)
+    truncated = raw[: len(raw) * 9 // 10]  # 出力トークンの上限で切れた応答を想定
+
+    legacy = legacy_parse(raw)
+    current, was_truncated = response_parser.parse_extraction(raw)
+    assert not was_truncated
+    assert legacy["name"] == current["name"] and as_tuples(legacy) == as_tuples(current), "従来の解析と結果が一致しない"
+    recovered, was_truncated = response_parser.parse_extraction(truncated)
+    assert was_truncated and as_tuples(recovered) == as_tuples(current)[:len(recovered["events"])]
+    streamed = parse_incremental(raw, args.chunk_chars)
+    assert streamed["name"] == current["name"] and as_tuples(streamed) == as_tuples(current), "ストリーミングの解析と結果が一致しない"
+
+    print(f"events={args.events} response={len(raw) / 1024:.0f} KiB json_backend={'orjson' if response_parser.orjson else 'json'}")
+    legacy_seconds = measure(lambda: legacy_parse(raw), args.repeat)
+    print(f"  legacy           : {legacy_seconds * 1000:8.1f} ms")
+    response_parser._parse_time.cache_clear()
+    response_parser._parse_date.cache_clear()
+    current_seconds = measure(lambda: response_parser.parse_extraction(raw), args.repeat)
+    print(f"  response_parser  : {current_seconds * 1000:8.1f} ms ({legacy_seconds / current_seconds:.1f}x)")
+    truncated_seconds = measure(lambda: response_parser.parse_extraction(truncated), args.repeat)
+    print(f"  truncated (90%)  : {truncated_seconds * 1000:8.1f} ms, recovered {len(recovered['events'])}/{args.events} events")
+    incremental_seconds = measure(lambda: parse_incremental(raw, args.chunk_chars), args.repeat)
+    print(f"  incremental      : {incremental_seconds * 1000:8.1f} ms ({-(-len(raw) // args.chunk_chars)} chunks of {args.chunk_chars} chars)")
+
+
+if __name__ == "__main__":
+    main()
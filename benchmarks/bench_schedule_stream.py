@@ -0,0 +1,196 @@
+"""
+ストリーミング登録 (/schedule/stream) で、最初の予定が登録されてクライアントに届くまでの時間を測るベンチマーク。
+
+OpenAI互換のスタブサーバーをローカルに立て、決まった応答 (--events 件の予定) を --chunk-chars 文字ずつ
+--chunk-ms ミリ秒おきに SSE で返す (最初の断片までは --first-chunk-ms ミリ秒待つ)。
+ストリーミングでない呼び出しには、同じ応答を全部生成し終えたのと同じ時間だけ待ってから返す。
+アプリは uvicorn で実際に起動し (ASGITransport は応答の本文をまとめて返すため)、
+- /schedule/ : 応答が返るまで (全ての予定の抽出と登録が終わるまで)
+- /schedule/stream : 最初の event: events が届くまでと、event: done が届くまで
+を比べ、どちらも同じ予定が登録されることを確認する。
+
+    python benchmarks/bench_schedule_stream.py --events 300 --chunk-ms 10
+"""
+import argparse
+import json
+import os
+import pathlib
+import socket
+import sys
+import tempfile
+import threading
+import time as time_module
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+YEAR, MONTH = 2025, 5
+
+
+def canned_content(events: int) -> str:
+    first = date(YEAR, MONTH, 1)
+    return json.dumps({
+        "name": "stub",
+        "events": [
+            {"date": (first + timedelta(days=i % 31)).isoformat(), "start": f"{7 + i // 31 % 14:02d}:00", "end": f"{7 + i // 31 % 14:02d}:45"}
+            for i in range(events)
+        ],
+    }, indent=1)
+
+
+def start_stub_server(content: str, chunk_chars: int, chunk_ms: float, first_chunk_ms: float) -> ThreadingHTTPServer:
+    chunks = [content[i:i + chunk_chars] for i in range(0, len(content), chunk_chars)]
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            time_module.sleep(first_chunk_ms / 1000)
+            if not request.get("stream"):
+                time_module.sleep(len(chunks) * chunk_ms / 1000)
+                body = json.dumps({
+                    "id": "stub", "object": "chat.completion", "created": 0, "model": "stub",
+                    "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+                    "usage": {"prompt_tokens": 10, "completion_tokens": len(chunks), "total_tokens": 10 + len(chunks)},
+                }).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i, piece in enumerate(chunks):
+                if i:
+                    time_module.sleep(chunk_ms / 1000)
+                self._send_event({
+                    "id": "stub", "object": "chat.completion.chunk", "created": 0, "model": "stub",
+                    "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+                })
+            self._send_event({
+                "id": "stub", "object": "chat.completion.chunk", "created": 0, "model": "stub",
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 10, "completion_tokens": len(chunks), "total_tokens": 10 + len(chunks)},
+            })
+            self._send_raw(b"data: [DONE]\n\n")
+            self._send_raw(b"")
+
+        def _send_event(self, payload):
+            self._send_raw(b"data: " + json.dumps(payload).encode() + b"\n\n")
+
+        def _send_raw(self, data: bytes):
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_app():
+    import uvicorn
+    import main
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time_module.sleep(0.01)
+    return server, f"http://127.0.0.1:{port}"
+
+
+def registered_events(client):
+    return sorted((e["name"], e["event_date"], e["start_time"], e["end_time"])
+                  for e in client.get("/events/", params={"year": YEAR, "month": MONTH}).json())
+
+
+def run_plain(client, form):
+    t0 = time_module.perf_counter()
+    response = client.post("/schedule/", data=form)
+    response.raise_for_status()
+    return {"total": time_module.perf_counter() - t0, "created": len(response.json())}
+
+
+def run_stream(client, form):
+    t0 = time_module.perf_counter()
+    result = {"batches": 0, "created": 0}
+    event = None
+    with client.stream("POST", "/schedule/stream", data=form) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                data = json.loads(line[len("data: "):])
+                if event == "events":
+                    result.setdefault("first_event", time_module.perf_counter() - t0)
+                    result["batches"] += 1
+                    result["created"] += len(data["events"])
+                elif event == "error":
+                    raise RuntimeError(data)
+                elif event == "done":
+                    result["total"] = time_module.perf_counter() - t0
+                    result["server_timings"] = data["timings"]
+    return result
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=300)
+    parser.add_argument("--chunk-chars", type=int, default=24, help="スタブが1回に返す文字数 (トークン数個分)")
+    parser.add_argument("--chunk-ms", type=float, default=10.0, help="スタブが断片を返す間隔 (ミリ秒)")
+    parser.add_argument("--first-chunk-ms", type=float, default=500.0, help="スタブが最初の断片を返すまでの時間 (ミリ秒)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    content = canned_content(args.events)
+    stub = start_stub_server(content, args.chunk_chars, args.chunk_ms, args.first_chunk_ms)
+    tmp = tempfile.TemporaryDirectory()
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp.name}/bench.db"
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+    os.environ["GEMINI_API_KEY"] = "stub"
+    os.environ["GEMINI_BASE_URL"] = f"http://127.0.0.1:{stub.server_address[1]}/"
+    os.chdir(pathlib.Path(__file__).resolve().parent.parent)
+
+    import logging
+    logging.disable(logging.INFO)
+    import httpx
+    import extraction_cache
+
+    app_server, base_url = start_app()
+    form = {"name": "stub", "schedule_text": "時間割", "target_year": YEAR, "target_month": MONTH}
+    print(f"stub: {args.events} events, {len(content)} chars in {-(-len(content) // args.chunk_chars)} chunks "
+          f"every {args.chunk_ms:.0f} ms after {args.first_chunk_ms:.0f} ms")
+    with httpx.Client(base_url=base_url, timeout=120) as client:
+        expected = None
+        for i in range(args.repeat):
+            for label, run in (("/schedule/", run_plain), ("/schedule/stream", run_stream)):
+                client.get("/all_delete").raise_for_status()
+                extraction_cache.cache.clear()
+                result = run(client, form)
+                events = registered_events(client)
+                expected = expected or events
+                assert events == expected and len(events) == args.events, (label, len(events))
+                first = f"first events {result['first_event'] * 1000:7.1f} ms, " if "first_event" in result else " " * 27
+                batches = f" in {result['batches']} batches" if "batches" in result else ""
+                print(f"  #{i} {label:17s} {first}all {result['total'] * 1000:7.1f} ms ({result['created']} events{batches})")
+                if "server_timings" in result:
+                    print("      server: " + ", ".join(f"{k} {v * 1000:.1f} ms" for k, v in result["server_timings"].items()))
+    print("registered events match")
+    app_server.should_exit = True
+    stub.shutdown()
+    tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main_cli()
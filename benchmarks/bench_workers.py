@@ -0,0 +1,230 @@
+"""
+serve.py で起動したワーカー数ごとのスループット (req/s, p50/p99) と、ワーカー間のキャッシュの整合性を測るベンチマーク。
+
+一時ファイルのSQLiteに合成カレンダー (synthetic.CalendarSpec) を登録し、--workers の各ワーカー数で
+`python serve.py --workers N` を実際に起動して、/events/, /free_slots/, /calendar/, /availability/ を混ぜた
+読み取りリクエストを --concurrency 本のクライアントから --duration 秒間送る。
+
+その後、全てのワーカーのキャッシュを温めてから予定を1件削除し、新しい接続 (ワーカーは毎回カーネルが選ぶ) で
+/events/ を --stale-checks 回読んで、削除した予定がまだ返ってくる回数を数える。
+--shared-cache none (ワーカーごとのキャッシュだけ) と比べると、共有ストアの変更ログによる無効化の効果が分かる。
+ワーカー数を増やして速くなるのはCPUが複数ある場合だけなので、os.cpu_count() も合わせて表示する。
+
+    python benchmarks/bench_workers.py --workers 1 2 4
+    python benchmarks/bench_workers.py --workers 2 --shared-cache none
+"""
+import argparse
+import asyncio
+import os
+import pathlib
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time as time_module
+
+REPO = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO))
+
+
+def seed(spec) -> dict:
+    """DATABASE_URL のDBに spec のデータを登録する"""
+    import database
+    import migrations
+    from benchmarks import synthetic
+
+    migrations.run_migrations(database.engine)
+    db = database.SessionLocal()
+    try:
+        return synthetic.load(db, spec)
+    finally:
+        db.close()
+        database.engine.dispose()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workers: int, shared_cache: str, db_path: str, cache_dir: str):
+    import httpx
+
+    port = free_port()
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{db_path}",
+        GEMINI_API_KEY="bench",
+        SHARED_CACHE_BACKEND=shared_cache,
+        SHARED_CACHE_PATH=os.path.join(cache_dir, f"shared-{shared_cache}-{workers}.db"),
+    )
+    env.pop("ASYNC_DATABASE_URL", None)
+    # ワーカーのログ (main の INFO) は結果の表示に混ざらないようファイルに書く
+    log_path = os.path.join(cache_dir, f"serve-{shared_cache}-{workers}.log")
+    with open(log_path, "w") as log_file:
+        process = subprocess.Popen(
+            [sys.executable, "serve.py", "--workers", str(workers), "--host", "127.0.0.1", "--port", str(port),
+             "--shared-cache", shared_cache, "--log-level", "warning"],
+            cwd=REPO, env=env, stdout=log_file, stderr=subprocess.STDOUT,
+        )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time_module.monotonic() + 60
+    while time_module.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"serve.py exited with {process.returncode}: see {log_path}")
+        try:
+            httpx.get(f"{base_url}/cache/stats", timeout=1).raise_for_status()
+            # 全てのワーカーが読み込みを終えるまで待つ (最初の1つだけが応答している場合がある)
+            time_module.sleep(1.0 + 0.5 * workers)
+            return process, base_url
+        except httpx.HTTPError:
+            time_module.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("serve.py did not start")
+
+
+def stop_server(process) -> None:
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def make_requests(spec):
+    """(ラベル, 重み, パス, クエリ) を選ぶ関数のリスト"""
+    months = spec.month_list()
+    members = spec.member_names()
+
+    def events(rng):
+        year, month = rng.choice(months)
+        return "/events/", {"year": year, "month": month}
+
+    def free_slots(rng):
+        year, month = rng.choice(months)
+        return "/free_slots/", {"year": year, "month": month, "members": rng.sample(members, min(5, len(members)))}
+
+    def calendar(rng):
+        year, month = rng.choice(months)
+        return f"/calendar/{year}/{month}", {}
+
+    def availability(rng):
+        year, month = rng.choice(months)
+        return "/availability/", {"year": year, "month": month, "members": rng.sample(members, min(10, len(members))), "min_attendees": 5}
+
+    return [("events", 4, events), ("free_slots", 3, free_slots), ("calendar", 3, calendar), ("availability", 1, availability)]
+
+
+async def run_load(base_url: str, spec, concurrency: int, duration: float, seed_value: int = 0) -> dict:
+    import httpx
+
+    requests = make_requests(spec)
+    labels = [label for label, _, _ in requests]
+    weights = [weight for _, weight, _ in requests]
+    latencies = {label: [] for label in labels}
+    errors = 0
+    deadline = time_module.perf_counter() + duration
+
+    async def client_loop(i: int):
+        nonlocal errors
+        rng = random.Random(seed_value * 1000 + i)
+        # 接続ごとに受け付けるワーカーが決まるので、クライアントごとに別の接続を使う
+        async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+            while time_module.perf_counter() < deadline:
+                index = rng.choices(range(len(requests)), weights)[0]
+                path, params = requests[index][2](rng)
+                t0 = time_module.perf_counter()
+                response = await client.get(path, params=params)
+                if response.status_code != 200:
+                    errors += 1
+                latencies[labels[index]].append(time_module.perf_counter() - t0)
+
+    t0 = time_module.perf_counter()
+    await asyncio.gather(*(client_loop(i) for i in range(concurrency)))
+    elapsed = time_module.perf_counter() - t0
+    everything = [v for values in latencies.values() for v in values]
+    return {
+        "requests": len(everything),
+        "errors": errors,
+        "rps": len(everything) / elapsed,
+        "p50": statistics.median(everything),
+        "p99": statistics.quantiles(everything, n=100)[98] if len(everything) >= 2 else everything[0],
+        "by_label": {label: statistics.median(values) for label, values in latencies.items() if values},
+    }
+
+
+def check_staleness(base_url: str, spec, workers: int, checks: int) -> dict:
+    """キャッシュを温めてから予定を削除し、新しい接続で読んだときに削除した予定が返ってくる回数を数える"""
+    import httpx
+
+    year, month = spec.month_list()[0]
+    params = {"year": year, "month": month}
+
+    def read_events():
+        # 接続を使い回さない (毎回カーネルがワーカーを選ぶ)
+        with httpx.Client(base_url=base_url, timeout=30) as client:
+            return client.get("/events/", params=params).json()
+
+    for _ in range(max(4, workers * 8)):
+        read_events()
+    target = read_events()[0]
+    key = (target["name"], target["event_date"])
+    with httpx.Client(base_url=base_url, timeout=30) as client:
+        client.request("DELETE", "/events/delete_by_date_name/",
+                       json={"name": target["name"], "event_date": target["event_date"]}).raise_for_status()
+    stale = sum(
+        any((e["name"], e["event_date"]) == key for e in read_events())
+        for _ in range(checks)
+    )
+    return {"checks": checks, "stale": stale}
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--shared-cache", default="shm", help="共有ストアのバックエンド (shm / sqlite / none)")
+    parser.add_argument("--members", type=int, default=50)
+    parser.add_argument("--events-per-member", type=int, default=20)
+    parser.add_argument("--months", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--stale-checks", type=int, default=40)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # 設定はモジュールの読み込み時に読まれるので、synthetic (crud, database) を読み込む前に決める
+        seed_path = os.path.join(tmp, "seed.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{seed_path}"
+        os.environ.pop("ASYNC_DATABASE_URL", None)
+        os.environ["SHARED_CACHE_BACKEND"] = "none"
+        import logging
+        logging.disable(logging.INFO)
+        from benchmarks import synthetic
+
+        spec = synthetic.CalendarSpec(members=args.members, events_per_member=args.events_per_member, months=args.months)
+        print(f"cpus: {os.cpu_count()}, shared cache: {args.shared_cache}, concurrency {args.concurrency}, {args.duration:.0f} s per run")
+        counts = seed(spec)
+        for workers in args.workers:
+            # 削除で DB が変わるので、ワーカー数ごとに同じデータから始める
+            db_path = os.path.join(tmp, f"bench-{workers}.db")
+            shutil.copyfile(seed_path, db_path)
+            process, base_url = start_server(workers, args.shared_cache, db_path, tmp)
+            try:
+                result = asyncio.run(run_load(base_url, spec, args.concurrency, args.duration))
+                stale = check_staleness(base_url, spec, workers, args.stale_checks)
+            finally:
+                stop_server(process)
+            by_label = ", ".join(f"{label} {value * 1000:.1f}" for label, value in result["by_label"].items())
+            print(f"  workers={workers}: {result['rps']:7.1f} req/s, p50 {result['p50'] * 1000:6.1f} ms, "
+                  f"p99 {result['p99'] * 1000:6.1f} ms, errors {result['errors']} "
+                  f"({result['requests']} requests, {counts['events']} events + {counts['rules']} rules)")
+            print(f"      p50 by endpoint (ms): {by_label}")
+            print(f"      stale reads after delete: {stale['stale']}/{stale['checks']}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,68 @@
+"""
+ベンチマークの結果 (benchmarks.suite が書き出した JSON) を2回分比べる。
+
+ケースごとに中央値の比 (今回 / 基準) を表示し、--threshold (既定 0.2 = 20%) を超えて遅くなったケースを
+REGRESSION として示す。--fail-on-regression を付けると、該当があれば終了コード 1 で終わる。
+
+    python -m benchmarks.compare before.json after.json
+"""
+from typing import Any, Dict, List, Tuple
+import argparse
+import json
+import sys
+
+DEFAULT_THRESHOLD = 0.2
+
+
+def load(path: str) -> Dict[str, Any]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare(
+    baseline: Dict[str, Any], current: Dict[str, Any], threshold: float = DEFAULT_THRESHOLD, include_missing: bool = True,
+) -> Tuple[List[str], List[str]]:
+    """比較結果の表の行と、遅くなったケースの名前のリストを返す。include_missing なら今回ないケースも表示する。"""
+    lines = []
+    regressions = []
+    if baseline.get("meta", {}).get("spec") != current.get("meta", {}).get("spec"):
+        lines.append("warning: データの条件 (spec) が異なるため、比較は参考値です")
+    lines.append(f"{'case':40s} {'base ms':>10s} {'now ms':>10s} {'ratio':>7s}")
+    base_results = baseline.get("results", {})
+    for case, result in current.get("results", {}).items():
+        base = base_results.get(case)
+        if base is None:
+            lines.append(f"{case:40s} {'-':>10s} {result['median_ms']:10.2f} {'new':>7s}")
+            continue
+        ratio = result["median_ms"] / base["median_ms"] if base["median_ms"] else float("inf")
+        mark = ""
+        if ratio > 1 + threshold:
+            mark = "  REGRESSION"
+            regressions.append(case)
+        elif ratio < 1 - threshold:
+            mark = "  faster"
+        lines.append(f"{case:40s} {base['median_ms']:10.2f} {result['median_ms']:10.2f} {ratio:6.2f}x{mark}")
+    missing = base_results.keys() - current.get("results", {}).keys() if include_missing else ()
+    for case in sorted(missing):
+        lines.append(f"{case:40s} {base_results[case]['median_ms']:10.2f} {'-':>10s} {'gone':>7s}")
+    return lines, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    lines, regressions = compare(load(args.baseline), load(args.current), args.threshold)
+    print("\n".join(lines))
+    if regressions:
+        print(f"{len(regressions)} case(s) slower than {1 + args.threshold:.2f}x baseline: {', '.join(regressions)}")
+        if args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
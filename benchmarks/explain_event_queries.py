@@ -0,0 +1,81 @@
+"""
+events テーブルの主要クエリの実行計画を確認する。
+
+旧スキーマ (id, name の単独インデックスのみ) のSQLiteファイルを作り、migrations.run_migrations で
+アップグレードしたあと、crud の月検索・名前+日付削除が発行するSQLを EXPLAIN QUERY PLAN にかけ、
+テーブルのフルスキャンではなくインデックスの範囲検索になっていることを確認する。
+
+    python benchmarks/explain_event_queries.py
+"""
+import pathlib
+import sys
+import tempfile
+from datetime import date
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import create_engine, event, text  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+import crud  # noqa: E402
+import migrations  # noqa: E402
+
+LEGACY_SCHEMA = [
+    "CREATE TABLE events (id VARCHAR NOT NULL, name VARCHAR NOT NULL, event_date DATE NOT NULL, "
+    "start_time TIME NOT NULL, end_time TIME NOT NULL, PRIMARY KEY (id))",
+    "CREATE INDEX ix_events_id ON events (id)",
+    "CREATE INDEX ix_events_name ON events (name)",
+]
+
+
+def capture_statements(engine):
+    captured = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "DELETE")) and "events" in statement:
+            captured.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    return captured
+
+
+def query_plan(engine, statement, parameters):
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+    return [row[-1] for row in rows]
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{tmp}/legacy.db")
+        with engine.begin() as conn:
+            for ddl in LEGACY_SCHEMA:
+                conn.execute(text(ddl))
+
+        applied = migrations.run_migrations(engine)
+        print(f"applied migrations: {applied}")
+
+        captured = capture_statements(engine)
+        SessionLocal = sessionmaker(bind=engine)
+        db = SessionLocal()
+        crud.get_events_by_month(db, year=2025, month=5)
+        crud.delete_events_by_date_and_name(db, event_date=date(2025, 5, 1), name="member")
+        db.close()
+
+        failed = False
+        for statement, parameters in captured:
+            plan = query_plan(engine, statement, parameters)
+            print(" ".join(statement.split()))
+            for line in plan:
+                print(f"    {line}")
+            if not any(line.startswith("SEARCH") and "USING INDEX" in line for line in plan):
+                print("    -> インデックスの範囲検索になっていません")
+                failed = True
+        engine.dispose()
+
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
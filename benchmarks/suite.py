@@ -0,0 +1,260 @@
+"""
+再現可能なベンチマークスイート。
+
+一時ファイルの SQLite に benchmarks.synthetic で作った合成カレンダーを登録し、
+- crud / 空き時間の計算の関数を直接呼んだ時間
+- 主要なエンドポイントを FastAPI の TestClient 経由で呼んだ時間 (アプリと同じプロセス内)
+をケースごとに --repeat 回計測する (最初の1回はウォームアップとして捨てる)。
+結果 (最小・中央値・p95・平均, ミリ秒) と実行条件を JSON に書き出し、--compare で前回の結果と比べられる。
+
+    python -m benchmarks.suite --members 50 --events-per-member 20 --recurring-share 0.2 --months 3 --output before.json
+    (変更を加える)
+    python -m benchmarks.suite ... --output after.json --compare before.json
+"""
+from typing import Any, Callable, Dict, List, Optional
+import argparse
+import datetime as datetime_module
+import json
+import logging
+import os
+import pathlib
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time as time_module
+from datetime import time
+
+REPO_DIR = pathlib.Path(__file__).resolve().parent.parent
+RESULTS_DIR = pathlib.Path(__file__).resolve().parent / "results"
+if str(REPO_DIR) not in sys.path:
+    sys.path.insert(0, str(REPO_DIR))
+
+from benchmarks import compare as compare_module  # noqa: E402
+
+WORK_START, WORK_END = time(7, 0), time(22, 0)
+
+
+class Case:
+    """計測する処理1つ。setup は毎回の計測の前に (計測の外で) 呼ばれる。"""
+
+    def __init__(self, name: str, func: Callable[[], Any], setup: Optional[Callable[[], None]] = None):
+        self.name = name
+        self.func = func
+        self.setup = setup
+
+    def run(self, repeat: int) -> Dict[str, Any]:
+        durations = []
+        size = None
+        for i in range(repeat + 1):
+            if self.setup is not None:
+                self.setup()
+            t0 = time_module.perf_counter()
+            value = self.func()
+            elapsed = time_module.perf_counter() - t0
+            if i == 0:
+                continue # ウォームアップ
+            durations.append(elapsed * 1000)
+            size = _size_of(value)
+        ordered = sorted(durations)
+        return {
+            "repeat": repeat,
+            "min_ms": round(ordered[0], 3),
+            "median_ms": round(statistics.median(ordered), 3),
+            "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+            "mean_ms": round(statistics.fmean(ordered), 3),
+            "size": size,
+        }
+
+
+def _size_of(value: Any) -> Optional[int]:
+    """返り値の件数 (結果の大きさが実行ごとに変わっていないかの確認用)"""
+    if hasattr(value, "status_code"):
+        if value.status_code >= 400:
+            raise RuntimeError(f"{value.request.url} returned {value.status_code}: {value.text[:200]}")
+        return len(value.content)
+    try:
+        return len(value)
+    except TypeError:
+        return None
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_cases(spec) -> List[Case]:
+    """DB にデータを登録したあとに呼ぶ (モジュールは DATABASE_URL の設定後に読み込む)"""
+    from fastapi.testclient import TestClient
+
+    import availability
+    import busy_cache
+    import calendar_snapshot
+    import crud
+    import free_slots
+    import main
+    import response_cache
+    from event_store import EventStore
+
+    year, month = spec.month_list()[0]
+    first, last = spec.date_range()
+    month_first, month_last = crud.month_range(year, month)
+    target_dates = main._month_target_dates(year, month)
+    members = spec.member_names()
+
+    db = main.SessionLocal()
+    month_events = crud.get_events_by_month(db, year, month)
+    rules = crud.get_recurring_rules_in_range(db, first, last)
+    store = EventStore.from_rows(crud.get_event_rows_in_range(db, month_first, month_last))
+    db.close()
+
+    def with_db(func):
+        def run():
+            session = main.SessionLocal()
+            try:
+                return func(session)
+            finally:
+                session.close()
+        return run
+
+    def expand_legacy():
+        weekday_names = {index: name for name, index in crud.DAY_OF_WEEK_MAP.items()}
+        return [
+            event for rule in rules
+            for event in crud.expand_recurring_event_for_month(
+                rule.name, weekday_names[rule.weekday], rule.start_time, rule.end_time, year, month)
+        ]
+
+    def availability_search():
+        matrix = availability.AvailabilityMatrix.from_events(month_events, members, target_dates)
+        return matrix.search(60, WORK_START, WORK_END, max(1, len(members) // 2), 10)
+
+    def clear_caches():
+        busy_cache.cache.clear()
+        response_cache.cache.clear()
+        calendar_snapshot.snapshots.clear()
+
+    def page_load_two_requests():
+        # /calendar/ 以前のカレンダー画面の表示 (予定と空き時間を別々に取得する)
+        client.get("/events/", params={**params, "format": "columnar"})
+        return client.get("/free_slots/", params={**params, "format": "columnar"})
+
+    client = TestClient(main.app)
+    params = {"year": year, "month": month}
+    cases = [
+        Case("crud.get_events_by_month", with_db(lambda db: crud.get_events_by_month(db, year, month))),
+        Case("crud.get_recurring_occurrences", with_db(lambda db: crud.get_recurring_occurrences(db, first, last))),
+        Case("crud.expand_recurring_event_for_month", expand_legacy),
+        Case("crud.expand_recurring_rules", lambda: crud.expand_recurring_rules(rules, month_first, month_last)),
+        Case("crud.iter_events_in_range", with_db(lambda db: list(crud.iter_events_in_range(db, first, last)))),
+        Case("free_slots.find_common_free_slots", lambda: free_slots.find_common_free_slots(
+            month_events, members, target_dates, 60, WORK_START, WORK_END)),
+        Case("availability.search", availability_search),
+        Case("crud.get_event_rows_in_range+EventStore", with_db(
+            lambda db: EventStore.from_rows(crud.get_event_rows_in_range(db, month_first, month_last)))),
+        Case("event_store.free_slot_minutes", lambda: store.free_slot_minutes(
+            members, target_dates, 60, WORK_START, WORK_END)),
+        Case("event_store.member_busy_by_date", store.member_busy_by_date),
+        Case("busy_cache.get_month.cold", with_db(lambda db: busy_cache.cache.get_month(db, year, month)),
+             setup=busy_cache.cache.clear),
+        # 名前に付加のないケースはキャッシュなしの時間 (以前の結果と比べられるように)
+        Case("GET /events/", lambda: client.get("/events/", params=params), setup=response_cache.cache.clear),
+        Case("GET /events/.columnar", lambda: client.get("/events/", params={**params, "format": "columnar"}),
+             setup=response_cache.cache.clear),
+        Case("GET /events/.cached", lambda: client.get("/events/", params=params)),
+        Case("GET /events/range", lambda: client.get(
+            "/events/range", params={"start_date": first.isoformat(), "end_date": last.isoformat(), "format": "json"})),
+        Case("GET /free_slots/.cold", lambda: client.get("/free_slots/", params=params), setup=clear_caches),
+        Case("GET /free_slots/.warm", lambda: client.get("/free_slots/", params=params), setup=response_cache.cache.clear),
+        Case("GET /free_slots/.columnar", lambda: client.get("/free_slots/", params={**params, "format": "columnar"}),
+             setup=response_cache.cache.clear),
+        Case("GET /free_slots/.cached", lambda: client.get("/free_slots/", params=params)),
+        Case("GET /free_slots/next.count5", lambda: client.get(
+            "/free_slots/next", params={"start_date": first.isoformat(), "count": 5, "duration_minutes": 60})),
+        Case("GET /free_slots/next.count200", lambda: client.get(
+            "/free_slots/next", params={"start_date": first.isoformat(), "count": 200, "duration_minutes": 60})),
+        Case("page load /events/+/free_slots/.cold", page_load_two_requests, setup=clear_caches),
+        Case("GET /calendar/.cold", lambda: client.get(f"/calendar/{year}/{month}"), setup=clear_caches),
+        Case("GET /calendar/.cached", lambda: client.get(f"/calendar/{year}/{month}")),
+        Case("GET /availability/", lambda: client.get(
+            "/availability/", params={**params, "min_attendees": max(1, len(members) // 2)})),
+    ]
+    return cases
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, default=50)
+    parser.add_argument("--events-per-member", type=int, default=20, help="1か月あたり、1人あたりの予定数")
+    parser.add_argument("--recurring-share", type=float, default=0.2, help="繰り返し予定にする割合 (0〜1)")
+    parser.add_argument("--months", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--cases", nargs="*", help="名前にこの文字列を含むケースだけを実行する")
+    parser.add_argument("--output", help="結果の JSON の保存先 (既定: benchmarks/results/<日時>.json)")
+    parser.add_argument("--compare", help="比較する前回の結果の JSON")
+    parser.add_argument("--threshold", type=float, default=compare_module.DEFAULT_THRESHOLD)
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp.name}/bench.db"
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+    os.environ.setdefault("GEMINI_API_KEY", "bench")
+    os.chdir(REPO_DIR)
+    logging.disable(logging.INFO)
+
+    from benchmarks import synthetic
+    import main as app_main
+
+    spec = synthetic.CalendarSpec(
+        members=args.members, events_per_member=args.events_per_member, recurring_share=args.recurring_share,
+        months=args.months, seed=args.seed,
+    )
+    db = app_main.SessionLocal()
+    counts = synthetic.load(db, spec)
+    db.close()
+    print(f"spec={spec.to_dict()} loaded={counts}")
+
+    results: Dict[str, Dict[str, Any]] = {}
+    for case in build_cases(spec):
+        if args.cases and not any(pattern in case.name for pattern in args.cases):
+            continue
+        results[case.name] = case.run(args.repeat)
+        r = results[case.name]
+        print(f"  {case.name:40s} median={r['median_ms']:9.2f} ms  p95={r['p95_ms']:9.2f} ms  min={r['min_ms']:9.2f} ms")
+
+    report = {
+        "meta": {
+            "created_at": datetime_module.datetime.now().isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "spec": spec.to_dict(),
+            "loaded": counts,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    output = pathlib.Path(args.output) if args.output else RESULTS_DIR / f"{datetime_module.datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"results written to {output}")
+    tmp.cleanup()
+
+    if args.compare:
+        lines, regressions = compare_module.compare(
+            compare_module.load(args.compare), report, args.threshold, include_missing=not args.cases)
+        print("\n".join(lines))
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+ベンチマーク用の合成カレンダーの生成。
+
+同じ CalendarSpec (と seed) からは常に同じデータができるので、実行ごとの結果を比べられる。
+各メンバーの予定のうち recurring_share の割合を毎週の繰り返し予定 (RecurringRule) とし、
+残りを対象期間の日付にばらまいた単発の予定とする。
+"""
+from typing import Dict, List, Tuple
+from dataclasses import asdict, dataclass
+from datetime import date, time, timedelta
+import random
+
+from sqlalchemy.orm import Session
+
+import crud
+import schemas
+
+
+@dataclass(frozen=True)
+class CalendarSpec:
+    members: int = 50
+    events_per_member: int = 20     # 1か月あたり、1人あたりの予定数 (繰り返し予定の展開後の回数も含む)
+    recurring_share: float = 0.2    # 予定のうち毎週の繰り返し予定にする割合
+    months: int = 3
+    start_year: int = 2025
+    start_month: int = 5
+    seed: int = 0
+
+    def month_list(self) -> List[Tuple[int, int]]:
+        """対象の (年, 月) のリスト"""
+        result = []
+        year, month = self.start_year, self.start_month
+        for _ in range(self.months):
+            result.append((year, month))
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        return result
+
+    def date_range(self) -> Tuple[date, date]:
+        months = self.month_list()
+        return crud.month_range(*months[0])[0], crud.month_range(*months[-1])[1]
+
+    def member_names(self) -> List[str]:
+        return [f"member{i:04d}" for i in range(self.members)]
+
+    def to_dict(self) -> Dict[str, object]:
+        return asdict(self)
+
+
+def _random_span(rng: random.Random) -> Tuple[time, time]:
+    """7:00〜21:00 の間で、15分刻みに始まる30分〜3時間の予定"""
+    start = rng.randrange(7 * 60, 21 * 60, 15)
+    end = min(start + rng.choice((30, 60, 90, 120, 180)), 23 * 60 + 59)
+    return time(start // 60, start % 60), time(end // 60, end % 60)
+
+
+def generate(spec: CalendarSpec) -> Tuple[List[schemas.EventCreate], List[schemas.RecurringRuleCreate]]:
+    """spec に従って単発の予定と繰り返しルールを作る"""
+    rng = random.Random(spec.seed)
+    first, last = spec.date_range()
+    days = (last - first).days + 1
+    # 1つの繰り返しルールは1か月に約4回展開される
+    rules_per_member = round(spec.events_per_member * spec.recurring_share / 4)
+    single_per_member = max(0, spec.events_per_member - rules_per_member * 4) * spec.months
+
+    events: List[schemas.EventCreate] = []
+    rules: List[schemas.RecurringRuleCreate] = []
+    for name in spec.member_names():
+        for _ in range(rules_per_member):
+            start_time, end_time = _random_span(rng)
+            rules.append(schemas.RecurringRuleCreate(
+                name=name, weekday=rng.randrange(5), start_time=start_time, end_time=end_time, valid_from=first,
+            ))
+        for _ in range(single_per_member):
+            start_time, end_time = _random_span(rng)
+            events.append(schemas.EventCreate(
+                name=name, event_date=first + timedelta(days=rng.randrange(days)), start_time=start_time, end_time=end_time,
+            ))
+    return events, rules
+
+
+def load(db: Session, spec: CalendarSpec) -> Dict[str, int]:
+    """spec のデータを DB に登録し、登録した件数を返す"""
+    events, rules = generate(spec)
+    crud.create_recurring_rules(db, rules, commit=False)
+    crud.create_events_bulk(db, events)
+    return {"events": len(events), "rules": len(rules)}
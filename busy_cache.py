@@ -0,0 +1,329 @@
+"""
+メンバー・日付ごとの「埋まっている区間」のキャッシュ。
+
+/free_slots/ は毎回その月の全イベントを読み直していたが、書き込みは読み取りに比べてまれなので、
+マージ済みの区間を (メンバー, 日付) 単位でプロセス内に保持する。
+無効化は change_tracker のコミット通知で行い、変更された (メンバー, 日付) だけを次回の読み取り時に読み直す。
+繰り返しルールが変わったメンバーは、読み込み済みの月ごとにそのメンバーの分だけを読み直す。
+duration_minutes や業務時間が違う検索も、読み込み済みの月であればDBに触れずに計算できる。
+共有ストア (shared_cache) があれば、月全体を読み込んだ結果を月のバージョン付きで保存し、
+他のワーカーはその月を初めて読むときにDBの代わりにそれを使う (一部の読み直しの結果はワーカー内だけで使う)。
+保持する月の数は BUSY_CACHE_MAX_MONTHS までで、超えたら最も長く読まれていない月から捨てる。
+同じ月の読み込みが重なった場合は、後に始まった読み込みの結果を残す (先に始まった読み込みが後から終わっても上書きしない)。
+"""
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+import asyncio
+import os
+import threading
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import change_tracker
+import crud
+import response_cache
+import response_parser
+import shared_cache
+from event_store import EventStore
+from free_slots import Interval, busy_intervals_by_date, common_busy_on_date
+
+# メンバー -> 日付 -> マージ済みの区間
+MemberIntervals = Dict[str, Dict[date, List[Interval]]]
+
+_NAMESPACE = "busy_intervals"
+# 保持する月の数 (超えたら最も長く読まれていない月から捨てる)
+BUSY_CACHE_MAX_MONTHS = int(os.getenv("BUSY_CACHE_MAX_MONTHS", "36"))
+
+
+@dataclass
+class _Load:
+    """読み込み1回分。番号が大きいほど後に始まった読み込み"""
+    number: int
+    full: bool
+    dirty_keys: Set[Tuple[str, date]]
+    dirty_members: Set[str]
+    version: Optional[str] = None
+
+
+@dataclass
+class _MonthState:
+    intervals: MemberIntervals = field(default_factory=dict)
+    dirty_keys: Set[Tuple[str, date]] = field(default_factory=set) # 読み直しが必要な (メンバー, 日付)
+    dirty_members: Set[str] = field(default_factory=set)           # 月全体を読み直しが必要なメンバー
+    loaded: bool = False
+    store: Optional[EventStore] = None # 月全体を読み込んだときの配列 (一部を読み直したら捨てる)
+    loads: int = 0        # 始めた読み込みの数 (次の読み込みの番号)
+    stored_load: int = 0  # 最後に保存した読み込みの番号
+    in_flight: Dict[int, _Load] = field(default_factory=dict) # 終わっていない読み込み
+
+
+@dataclass
+class MonthBusy:
+    """ある月の区間のスナップショット"""
+    intervals: MemberIntervals
+    store: Optional[EventStore] = None # intervals と同じ内容の月全体の EventStore (あれば)
+
+    @property
+    def members(self) -> List[str]:
+        """その月に予定があるメンバー"""
+        return sorted(self.intervals)
+
+
+def _month_days(month_busy: MonthBusy, members: Sequence[str], first: date, last: date) -> Iterator[Tuple[date, List[Interval]]]:
+    """first〜last (同じ月の中) の各日について、members 全員のマージ済みの区間を返す"""
+    # その月に予定のないメンバーは区間の計算に関係しない
+    present = [member for member in members if member in month_busy.intervals]
+    current = first
+    while current <= last:
+        yield current, common_busy_on_date(month_busy.intervals, present, current)
+        current += timedelta(days=1)
+
+
+def _encode(intervals: MemberIntervals) -> bytes:
+    return response_cache.dumps({
+        name: {str(d.toordinal()): day_intervals for d, day_intervals in by_date.items()}
+        for name, by_date in intervals.items()
+    })
+
+
+def _decode(raw: bytes) -> MemberIntervals:
+    return {
+        name: {date.fromordinal(int(d)): [tuple(interval) for interval in day_intervals] for d, day_intervals in by_date.items()}
+        for name, by_date in response_parser.loads(raw).items()
+    }
+
+
+def _month_spans(start_date: date, end_date: date) -> Iterator[Tuple[int, int, date, date]]:
+    """start_date〜end_date を月ごとに区切り、(年, 月, その月の開始日, 終了日) を返す"""
+    current = start_date
+    while current <= end_date:
+        month_end = crud.month_range(current.year, current.month)[1]
+        yield current.year, current.month, current, min(month_end, end_date)
+        current = month_end + timedelta(days=1)
+
+
+class BusyIntervalCache:
+    def __init__(self, store: Optional[shared_cache.SharedStore] = None, max_months: int = BUSY_CACHE_MAX_MONTHS):
+        self.max_months = max_months
+        self._months: "OrderedDict[Tuple[int, int], _MonthState]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._store = store
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    def _begin(self, year: int, month: int) -> Tuple[_MonthState, Optional[MonthBusy], Optional[_Load]]:
+        """
+        キャッシュを確認し、ヒットした場合は (state, スナップショット, None)、読み直しが必要なら (state, None, 読み込み) を返す。
+        終わっていない読み込みが取り出した印もこの読み込みで読み直すので、後に始まった読み込みの結果は常にそれ以前の読み込みより新しい。
+        月全体を読む場合は、その時点の月のバージョンも返す。
+        """
+        key = (year, month)
+        with self._lock:
+            state = self._months.get(key)
+            if state is None:
+                state = self._months[key] = _MonthState()
+                while len(self._months) > self.max_months:
+                    self._months.popitem(last=False)
+            self._months.move_to_end(key)
+            # 読み込み中の月は、その読み込みが取り出した印の分が古いのでヒットにしない
+            if state.loaded and not state.dirty_keys and not state.dirty_members and not state.in_flight:
+                self.hits += 1
+                return state, MonthBusy(dict(state.intervals), state.store), None
+            state.loads += 1
+            load = _Load(state.loads, not state.loaded, state.dirty_keys, state.dirty_members)
+            state.dirty_keys, state.dirty_members = set(), set()
+            for other in state.in_flight.values():
+                load.dirty_keys |= other.dirty_keys
+                load.dirty_members |= other.dirty_members
+            state.in_flight[load.number] = load
+            # 印を取り出した後でバージョンを読む: これより後の変更は、印が残るので次の読み取りで読み直される
+            if load.full:
+                load.version = change_tracker.month_version(year, month)
+            return state, None, load
+
+    def _superseded(self, state: _MonthState, load: _Load) -> bool:
+        """読み込みを終えたことにし、後に始まった読み込みが既に保存されていれば True (この読み込みの結果は保存しない)"""
+        state.in_flight.pop(load.number, None)
+        if load.number < state.stored_load:
+            return True
+        state.stored_load = load.number
+        return False
+
+    def _abort(self, state: _MonthState, load: _Load) -> None:
+        """失敗・キャンセルされた読み込みの印を戻し、次の読み取りで読み直されるようにする"""
+        with self._lock:
+            state.in_flight.pop(load.number, None)
+            state.dirty_keys |= load.dirty_keys
+            state.dirty_members |= load.dirty_members
+
+    def _load_shared(self, year: int, month: int, version: str) -> Optional[MemberIntervals]:
+        """他のワーカーが同じバージョンで読み込んだ月があれば返す"""
+        if self._store is None:
+            return None
+        row = self._store.get(_NAMESPACE, f"{year:04d}-{month:02d}")
+        if row is None or row[1] != version:
+            return None
+        return _decode(row[0])
+
+    def _publish(self, year: int, month: int, version: str, loaded: MemberIntervals) -> None:
+        if self._store is not None:
+            self._store.set(_NAMESPACE, f"{year:04d}-{month:02d}", _encode(loaded), tag=version)
+
+    def _store_full(self, state: _MonthState, load: _Load, loaded: MemberIntervals, store: EventStore, from_db: bool = True) -> MonthBusy:
+        with self._lock:
+            if from_db:
+                self.misses += 1
+            else:
+                self.shared_hits += 1
+            if self._superseded(state, load):
+                return MonthBusy(dict(state.intervals), state.store)
+            state.intervals = loaded
+            state.store = store
+            state.loaded = True
+            return MonthBusy(dict(state.intervals), store)
+
+    def _store_partial(self, state: _MonthState, load: _Load, reloaded_members, reloaded_keys) -> MonthBusy:
+        with self._lock:
+            self.refreshes += 1
+            if self._superseded(state, load):
+                return MonthBusy(dict(state.intervals), state.store)
+            intervals = dict(state.intervals)
+            for name, by_date in reloaded_members.items():
+                if by_date:
+                    intervals[name] = by_date
+                else:
+                    intervals.pop(name, None)
+            for (name, d), day_intervals in reloaded_keys.items():
+                by_date = dict(intervals.get(name, {}))
+                if day_intervals is None:
+                    by_date.pop(d, None)
+                else:
+                    by_date[d] = day_intervals
+                if by_date:
+                    intervals[name] = by_date
+                else:
+                    intervals.pop(name, None)
+            state.intervals = intervals
+            state.store = None
+            return MonthBusy(dict(intervals))
+
+    def get_month(self, db: Session, year: int, month: int) -> MonthBusy:
+        state, snapshot, load = self._begin(year, month)
+        if snapshot is not None:
+            return snapshot
+        try:
+            if load.full:
+                shared = self._load_shared(year, month, load.version)
+                if shared is not None:
+                    return self._store_full(state, load, shared, EventStore.from_intervals(shared), from_db=False)
+                # 月全体は ORMオブジェクトを作らずに列だけを読み、配列上でまとめる
+                rows = crud.get_event_rows_in_range(db, *crud.month_range(year, month))
+                store = EventStore.from_rows(rows)
+                loaded = store.member_busy_by_date()
+                self._publish(year, month, load.version, loaded)
+                return self._store_full(state, load, loaded, store)
+
+            # 変更された部分だけを読み直す
+            start_date, end_date = crud.month_range(year, month)
+            reloaded_members = {
+                name: busy_intervals_by_date(crud.get_member_events_in_range(db, name, start_date, end_date))
+                for name in load.dirty_members
+            }
+            reloaded_keys = {
+                (name, d): busy_intervals_by_date(crud.get_member_events_in_range(db, name, d, d)).get(d)
+                for name, d in load.dirty_keys if name not in load.dirty_members
+            }
+            return self._store_partial(state, load, reloaded_members, reloaded_keys)
+        except BaseException:
+            self._abort(state, load)
+            raise
+
+    async def get_month_async(self, db: AsyncSession, year: int, month: int) -> MonthBusy:
+        """get_month の非同期版 (AsyncSession から読み込む)"""
+        state, snapshot, load = self._begin(year, month)
+        if snapshot is not None:
+            return snapshot
+        try:
+            if load.full:
+                # 共有ストアの読み書きはブロッキングI/Oなのでスレッドプールで行う
+                shared = await asyncio.to_thread(self._load_shared, year, month, load.version) if self._store is not None else None
+                if shared is not None:
+                    return self._store_full(state, load, shared, EventStore.from_intervals(shared), from_db=False)
+                rows = await crud.get_event_rows_in_range_async(db, *crud.month_range(year, month))
+                store = EventStore.from_rows(rows)
+                loaded = store.member_busy_by_date()
+                if self._store is not None:
+                    await asyncio.to_thread(self._publish, year, month, load.version, loaded)
+                return self._store_full(state, load, loaded, store)
+
+            start_date, end_date = crud.month_range(year, month)
+            reloaded_members = {
+                name: busy_intervals_by_date(await crud.get_member_events_in_range_async(db, name, start_date, end_date))
+                for name in load.dirty_members
+            }
+            reloaded_keys = {
+                (name, d): busy_intervals_by_date(await crud.get_member_events_in_range_async(db, name, d, d)).get(d)
+                for name, d in load.dirty_keys if name not in load.dirty_members
+            }
+            return self._store_partial(state, load, reloaded_members, reloaded_keys)
+        except BaseException:
+            self._abort(state, load)
+            raise
+
+    def iter_common_busy_days(
+        self, db: Session, members: Sequence[str], start_date: date, end_date: date
+    ) -> Iterator[Tuple[date, List[Interval]]]:
+        """
+        start_date から end_date まで1日ずつ、members 全員の埋まっている区間を返す。
+        月のデータはその月に入ったときに初めて読み込む (キャッシュ済みならDBには触れない) ので、
+        途中で止めればそれ以降の月は読まない。
+        """
+        for year, month, first, last in _month_spans(start_date, end_date):
+            yield from _month_days(self.get_month(db, year, month), members, first, last)
+
+    async def iter_common_busy_days_async(
+        self, db: AsyncSession, members: Sequence[str], start_date: date, end_date: date
+    ) -> AsyncIterator[Tuple[date, List[Interval]]]:
+        """iter_common_busy_days の非同期版"""
+        for year, month, first, last in _month_spans(start_date, end_date):
+            for day in _month_days(await self.get_month_async(db, year, month), members, first, last):
+                yield day
+
+    def invalidate(self, changes: change_tracker.ChangeSet) -> None:
+        with self._lock:
+            if changes.everything:
+                self._months.clear()
+                return
+            for name, d in changes.events:
+                state = self._months.get((d.year, d.month))
+                if state is not None:
+                    state.dirty_keys.add((name, d))
+            if changes.rule_members:
+                for state in self._months.values():
+                    state.dirty_members.update(changes.rule_members)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._months.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses + self.refreshes
+            return {
+                "months": len(self._months),
+                "size": sum(len(by_date) for state in self._months.values() for by_date in state.intervals.values()),
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "partial_refreshes": self.refreshes,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+cache = BusyIntervalCache(store=shared_cache.store)
+change_tracker.add_listener(cache.invalidate)
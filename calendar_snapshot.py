@@ -0,0 +1,294 @@
+"""
+カレンダー画面1か月分のスナップショット (/calendar/{year}/{month})。
+
+予定・日ごとの予定のあるメンバー数・既定の条件 (全員, 60分, 07:00〜22:00) の空き時間を
+1つの本文にまとめ、月ごとにシリアライズ済みのバイト列として保持する。
+データは 日付 -> メンバー -> 予定 の形で持ち、change_tracker のコミット通知で変更された
+(メンバー, 日付) だけを印を付けておき、次の読み取り時にその部分だけを読み直して、影響のある日の
+メンバー数と空き時間だけを計算し直す (busy_cache と同じ方式)。変更がなければ読み取りはDBにも計算にも触れない。
+"""
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import date, time, timedelta
+import hashlib
+import os
+import threading
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import change_tracker
+import crud
+import response_cache
+from free_slots import Interval, free_slots_for_day, merge_intervals, time_to_end_minute, time_to_start_minute
+
+# スナップショットに含める空き時間の条件 (/free_slots/ の既定値と同じ)
+DEFAULT_DURATION_MINUTES = 60
+DEFAULT_WORK_START = time(7, 0)
+DEFAULT_WORK_END = time(22, 0)
+# 保持する月の数 (超えたら最も長く読まれていない月から捨てる)
+CALENDAR_SNAPSHOT_MAX_MONTHS = int(os.getenv("CALENDAR_SNAPSHOT_MAX_MONTHS", "36"))
+
+_WORK_START_MIN = time_to_start_minute(DEFAULT_WORK_START)
+_WORK_END_MIN = time_to_end_minute(DEFAULT_WORK_END)
+_EMPTY_DAY_SLOTS = free_slots_for_day((), _WORK_START_MIN, _WORK_END_MIN, DEFAULT_DURATION_MINUTES)
+
+
+class EventRecord(NamedTuple):
+    """予定1件 (models.Event と同じ属性を持つ)"""
+    id: str
+    name: str
+    event_date: date
+    start_time: time
+    end_time: time
+
+
+DayEvents = Dict[str, List[EventRecord]] # メンバー -> その日の予定
+
+
+@dataclass
+class _Load:
+    """読み込み1回分。番号が大きいほど後に始まった読み込み"""
+    number: int
+    full: bool
+    version: str
+    dirty_keys: Set[Tuple[str, date]]
+    dirty_members: Set[str]
+
+
+@dataclass
+class _MonthState:
+    events: Dict[date, DayEvents] = field(default_factory=dict)
+    slots: Dict[date, List[Interval]] = field(default_factory=dict) # 予定のある日の空き時間
+    dirty_keys: Set[Tuple[str, date]] = field(default_factory=set)
+    dirty_members: Set[str] = field(default_factory=set)
+    loaded: bool = False
+    version: Optional[str] = None # body を作ったときの月のバージョン
+    body: Optional[bytes] = None
+    etag: Optional[str] = None
+    loads: int = 0        # 始めた読み込みの数 (次の読み込みの番号)
+    stored_load: int = 0  # 最後に保存した読み込みの番号
+    in_flight: Dict[int, _Load] = field(default_factory=dict) # 終わっていない読み込み
+
+
+def _day_slots(day_events: DayEvents) -> List[Interval]:
+    busy = merge_intervals(
+        (time_to_start_minute(r.start_time), time_to_end_minute(r.end_time))
+        for records in day_events.values() for r in records
+    )
+    return free_slots_for_day(busy, _WORK_START_MIN, _WORK_END_MIN, DEFAULT_DURATION_MINUTES)
+
+
+def _set_member_day(state: _MonthState, name: str, d: date, records: List[EventRecord]) -> None:
+    day_events = state.events.get(d)
+    if records:
+        if day_events is None:
+            day_events = state.events[d] = {}
+        day_events[name] = records
+    elif day_events is not None:
+        day_events.pop(name, None)
+        if not day_events:
+            del state.events[d]
+
+
+def _group_by_member_day(rows) -> Dict[Tuple[str, date], List[EventRecord]]:
+    grouped: Dict[Tuple[str, date], List[EventRecord]] = {}
+    for row in rows:
+        record = EventRecord(*row)
+        grouped.setdefault((record.name, record.event_date), []).append(record)
+    return grouped
+
+
+class CalendarSnapshots:
+    def __init__(self, max_months: int = CALENDAR_SNAPSHOT_MAX_MONTHS):
+        self.max_months = max_months
+        self._months: "OrderedDict[Tuple[int, int], _MonthState]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    def _begin(self, year: int, month: int) -> Tuple[_MonthState, Optional[Tuple[str, bytes]], Optional[_Load]]:
+        """
+        スナップショットを確認する。最新なら (state, (etag, body), None)、そうでなければ (state, None, 読み込み) を返す。
+        終わっていない読み込みが取り出した印もこの読み込みで読み直すので、後に始まった読み込みの結果は常にそれ以前の読み込みより新しい。
+        """
+        # バージョンはDBを読む前に取得する (本文がこのバージョンより古くならないように)
+        version = change_tracker.month_version(year, month)
+        key = (year, month)
+        with self._lock:
+            state = self._months.get(key)
+            if state is None:
+                state = self._months[key] = _MonthState()
+                while len(self._months) > self.max_months:
+                    self._months.popitem(last=False)
+            self._months.move_to_end(key)
+            if (state.loaded and not state.dirty_keys and not state.dirty_members and not state.in_flight
+                    and state.version == version):
+                self.hits += 1
+                return state, (state.etag, state.body), None
+            state.loads += 1
+            load = _Load(state.loads, not state.loaded, version, state.dirty_keys, state.dirty_members)
+            state.dirty_keys, state.dirty_members = set(), set()
+            for other in state.in_flight.values():
+                load.dirty_keys |= other.dirty_keys
+                load.dirty_members |= other.dirty_members
+            state.in_flight[load.number] = load
+            return state, None, load
+
+    def _abort(self, state: _MonthState, load: _Load) -> None:
+        """失敗・キャンセルされた読み込みの印を戻し、次の読み取りで読み直されるようにする"""
+        with self._lock:
+            state.in_flight.pop(load.number, None)
+            state.dirty_keys |= load.dirty_keys
+            state.dirty_members |= load.dirty_members
+
+    def _store(
+        self, state: _MonthState, load: _Load, year: int, month: int,
+        full_rows=None, member_rows: Optional[Dict[str, list]] = None, key_rows: Optional[Dict[Tuple[str, date], list]] = None,
+    ) -> Tuple[str, bytes]:
+        with self._lock:
+            state.in_flight.pop(load.number, None)
+            if full_rows is not None:
+                self.misses += 1
+            else:
+                self.refreshes += 1
+            if load.number < state.stored_load:
+                # 後に始まった読み込みが既に保存されている: この読み込みの結果はそれより古いので捨てる
+                return state.etag, state.body
+            state.stored_load = load.number
+            touched: Set[date] = set()
+            if full_rows is not None:
+                state.events = {}
+                for (name, d), records in _group_by_member_day(full_rows).items():
+                    _set_member_day(state, name, d, records)
+                state.slots = {}
+                touched.update(state.events)
+                state.loaded = True
+            else:
+                for name, rows in (member_rows or {}).items():
+                    # 繰り返しルールが変わったメンバーは、月の全ての日の予定を入れ替える
+                    for d in [d for d, day_events in state.events.items() if name in day_events]:
+                        _set_member_day(state, name, d, [])
+                        touched.add(d)
+                    for (_, d), records in _group_by_member_day(rows).items():
+                        _set_member_day(state, name, d, records)
+                        touched.add(d)
+                for (name, d), rows in (key_rows or {}).items():
+                    _set_member_day(state, name, d, [EventRecord(*row) for row in rows])
+                    touched.add(d)
+            for d in touched:
+                if d in state.events:
+                    state.slots[d] = _day_slots(state.events[d])
+                else:
+                    state.slots.pop(d, None)
+            state.body = self._render(state, year, month)
+            state.etag = '"' + hashlib.sha1(state.body).hexdigest() + '"'
+            state.version = load.version
+            return state.etag, state.body
+
+    @staticmethod
+    def _render(state: _MonthState, year: int, month: int) -> bytes:
+        first, last = crud.month_range(year, month)
+        dates = [first + timedelta(days=i) for i in range((last - first).days + 1)]
+        records = [
+            record
+            for d in sorted(state.events)
+            for record in sorted(
+                (r for rs in state.events[d].values() for r in rs), key=lambda r: (r.start_time, r.end_time, r.name)
+            )
+        ]
+        # /free_slots/ と同様、その月に予定のあるメンバーがいなければ空き時間は返さない
+        slots_by_date: Dict[date, List[Interval]] = {}
+        if state.events:
+            for d in dates:
+                slots = state.slots.get(d, _EMPTY_DAY_SLOTS) # 予定のない日は業務時間の全てが空き
+                if slots:
+                    slots_by_date[d] = slots
+        return response_cache.dumps({
+            "year": year,
+            "month": month,
+            "events": response_cache.columnar_events(records, year, month),
+            "member_counts": [len(state.events.get(d, ())) for d in dates],
+            "free_slots": response_cache.columnar_free_slots(slots_by_date, year, month),
+            "free_slot_params": {
+                "duration_minutes": DEFAULT_DURATION_MINUTES,
+                "work_start_time": DEFAULT_WORK_START.strftime("%H:%M"),
+                "work_end_time": DEFAULT_WORK_END.strftime("%H:%M"),
+            },
+        })
+
+    def get(self, db: Session, year: int, month: int) -> Tuple[str, bytes]:
+        """その月の (ETag, 本文) を返す。変更された部分があればそこだけを読み直してから作り直す。"""
+        state, cached, load = self._begin(year, month)
+        if cached is not None:
+            return cached
+        start_date, end_date = crud.month_range(year, month)
+        try:
+            if load.full:
+                return self._store(state, load, year, month, full_rows=crud.get_event_records_in_range(db, start_date, end_date))
+            member_rows = {name: crud.get_event_records_in_range(db, start_date, end_date, name=name) for name in load.dirty_members}
+            key_rows = {
+                (name, d): crud.get_event_records_in_range(db, d, d, name=name)
+                for name, d in load.dirty_keys if name not in load.dirty_members
+            }
+            return self._store(state, load, year, month, member_rows=member_rows, key_rows=key_rows)
+        except BaseException:
+            self._abort(state, load)
+            raise
+
+    async def get_async(self, db: AsyncSession, year: int, month: int) -> Tuple[str, bytes]:
+        """get の非同期版"""
+        state, cached, load = self._begin(year, month)
+        if cached is not None:
+            return cached
+        start_date, end_date = crud.month_range(year, month)
+        try:
+            if load.full:
+                rows = await crud.get_event_records_in_range_async(db, start_date, end_date)
+                return self._store(state, load, year, month, full_rows=rows)
+            member_rows = {
+                name: await crud.get_event_records_in_range_async(db, start_date, end_date, name=name) for name in load.dirty_members
+            }
+            key_rows = {
+                (name, d): await crud.get_event_records_in_range_async(db, d, d, name=name)
+                for name, d in load.dirty_keys if name not in load.dirty_members
+            }
+            return self._store(state, load, year, month, member_rows=member_rows, key_rows=key_rows)
+        except BaseException:
+            self._abort(state, load)
+            raise
+
+    def invalidate(self, changes: change_tracker.ChangeSet) -> None:
+        with self._lock:
+            if changes.everything:
+                self._months.clear()
+                return
+            for name, d in changes.events:
+                state = self._months.get((d.year, d.month))
+                if state is not None:
+                    state.dirty_keys.add((name, d))
+            if changes.rule_members:
+                for state in self._months.values():
+                    state.dirty_members.update(changes.rule_members)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._months.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses + self.refreshes
+            return {
+                "months": len(self._months),
+                "bytes": sum(len(state.body) for state in self._months.values() if state.body),
+                "hits": self.hits,
+                "misses": self.misses,
+                "partial_refreshes": self.refreshes,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+snapshots = CalendarSnapshots()
+change_tracker.add_listener(snapshots.invalidate)
@@ -0,0 +1,268 @@
+"""
+予定データの変更の追跡。
+
+crud の書き込み関数は、変更した (氏名, 日付) や繰り返しルールの変更をセッションに記録する。
+記録はコミットが成功した時点でまとめて反映され、月ごとの変更カウンタを進めたうえで
+登録されたリスナー (キャッシュの無効化など) に通知される。ロールバックされた変更は捨てられる。
+
+読み取り側はカウンタから ETag / Last-Modified を作り、変更のない月への再リクエストには
+DBに触れずに 304 を返せる。繰り返し予定のルールは複数の月にまたがるため、
+ルールの変更は全月共通のカウンタで表す。
+カウンタはプロセス内で保持し、起動ごとに異なるトークンを ETag に含めて再起動後の取り違えを防ぐ。
+
+複数ワーカーで動かす場合 (shared_cache.store がある場合) は、コミットされた変更を共有ストアの変更ログにも書き込み、
+各ワーカーはリクエストの最初に sync() で他のワーカーの変更を取り込んで、自分のコミットと同じようにリスナーに通知する。
+カウンタは変更ログの番号で表し、トークンは共有ストアのエポックを使うので、どのワーカーでも同じ ETag になる。
+AsyncSession (database.HookedAsyncSession) でのコミットは、共有ストアへの書き込みでイベントループを止めないよう、
+commit() の後でスレッドプールから反映する (commit() が返る前に反映は終わる)。
+"""
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from dataclasses import dataclass, field
+from datetime import date
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time as time_module
+import uuid
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+import database
+import shared_cache
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_boot_token = uuid.uuid4().hex[:12]
+_boot_time = time_module.time()
+_seq = 0 # 最後に反映した変更の番号 (共有ストアを使う場合は変更ログの番号)
+_month_versions: Dict[Tuple[int, int], int] = {} # 月 -> その月を最後に変更した番号
+_month_modified: Dict[Tuple[int, int], float] = {}
+_rules_version = 0
+_rules_modified = _boot_time
+_global_version = 0 # 全削除など、全ての月に影響する変更
+
+_shared = shared_cache.store
+_sync_lock = threading.Lock()
+_last_synced_seq = 0 # 変更ログをどこまで読んだか
+_own_seqs: Set[int] = set() # このワーカーが書き込んだ (sync で読み飛ばす) 変更の番号
+
+
+@dataclass
+class ChangeSet:
+    """1回のコミットで確定した変更"""
+    events: Set[Tuple[str, date]] = field(default_factory=set) # 変更された (氏名, 日付)
+    rule_members: Set[str] = field(default_factory=set)        # 繰り返しルールが変更された氏名
+    everything: bool = False                                   # 全データが変わった (全削除など)
+
+    def __bool__(self) -> bool:
+        return bool(self.events or self.rule_members or self.everything)
+
+
+_listeners: List[Callable[[ChangeSet], None]] = []
+
+
+def add_listener(listener: Callable[[ChangeSet], None]) -> None:
+    """コミットされた変更の通知を受け取る関数を登録する"""
+    _listeners.append(listener)
+
+
+def _pending(session: Session) -> ChangeSet:
+    return session.info.setdefault("pending_changes", ChangeSet())
+
+
+def record_event_changes(session: Session, changes: Iterable[Tuple[str, date]]) -> None:
+    """(氏名, 日付) の予定が変更されたことを記録する (コミット時に反映)"""
+    _pending(session).events.update(changes)
+
+
+def record_rule_changes(session: Session, names: Iterable[str]) -> None:
+    """氏名の繰り返しルールが変更されたことを記録する (コミット時に反映)"""
+    _pending(session).rule_members.update(names)
+
+
+def record_all_changed(session: Session) -> None:
+    """全ての予定が変更されたことを記録する (コミット時に反映)"""
+    _pending(session).everything = True
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_pending_changes(session: Session) -> None:
+    changes = session.info.pop("pending_changes", None)
+    if not changes:
+        return
+    if session.info.get("async_session"):
+        # AsyncSession のコミットはイベントループのスレッドで呼ばれるので、commit() の後で反映する
+        committed = session.info.setdefault("committed_changes", ChangeSet())
+        committed.events.update(changes.events)
+        committed.rule_members.update(changes.rule_members)
+        committed.everything = committed.everything or changes.everything
+        return
+    apply_changes(changes)
+
+
+async def _apply_committed_changes(session: Session) -> None:
+    """AsyncSession でコミットした変更を反映する。共有ストアへの書き込みはスレッドプールで行う"""
+    changes = session.info.pop("committed_changes", None)
+    if not changes:
+        return
+    if _shared is None:
+        apply_changes(changes)
+    else:
+        await asyncio.to_thread(apply_changes, changes)
+
+
+database.async_after_commit_hooks.append(_apply_committed_changes)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending_changes(session: Session) -> None:
+    session.info.pop("pending_changes", None)
+
+
+def _months_of(changes: ChangeSet) -> Set[Tuple[int, int]]:
+    return {(d.year, d.month) for _, d in changes.events}
+
+
+def _encode(changes: ChangeSet) -> str:
+    return json.dumps({
+        "events": [[name, d.isoformat()] for name, d in changes.events],
+        "rule_members": sorted(changes.rule_members),
+        "everything": changes.everything,
+    }, ensure_ascii=False)
+
+
+def _decode(payload: str) -> ChangeSet:
+    data = json.loads(payload)
+    return ChangeSet(
+        events={(name, date.fromisoformat(d)) for name, d in data["events"]},
+        rule_members=set(data["rule_members"]),
+        everything=data["everything"],
+    )
+
+
+def _version_keys(changes: ChangeSet) -> List[str]:
+    """共有ストアで進めるカウンタの名前"""
+    keys = [f"m:{year:04d}-{month:02d}" for year, month in _months_of(changes)]
+    if changes.rule_members:
+        keys.append("rules")
+    if changes.everything:
+        keys.append("global")
+    return keys
+
+
+def apply_changes(changes: ChangeSet) -> None:
+    """このワーカーでコミットされた変更を反映する (共有ストアがあれば他のワーカーにも伝える)"""
+    now = time_module.time()
+    seq = None
+    if _shared is not None:
+        try:
+            seq = _shared.publish_changes(_encode(changes), _version_keys(changes), changes.everything, now)
+            with _lock:
+                _own_seqs.add(seq)
+        except Exception:
+            # 他のワーカーには伝わらないが、このワーカーのキャッシュは無効化する
+            logger.error("Failed to publish changes to the shared store", exc_info=True)
+    _apply(changes, seq, now)
+
+
+def _apply(changes: ChangeSet, seq: Optional[int], now: float) -> None:
+    """変更カウンタを進め、リスナーに通知する。seq が None ならこのワーカーの中で番号を振る。"""
+    global _seq, _rules_version, _rules_modified, _global_version
+    with _lock:
+        if seq is None:
+            seq = _seq + 1
+        _seq = max(_seq, seq)
+        if changes.everything:
+            _global_version = seq
+            _month_versions.clear()
+            _month_modified.clear()
+            _rules_modified = now
+        if changes.rule_members:
+            _rules_version = seq
+            _rules_modified = now
+        for key in _months_of(changes):
+            _month_versions[key] = seq
+            _month_modified[key] = now
+    for listener in _listeners:
+        try:
+            listener(changes)
+        except Exception:
+            logger.error("Change listener failed", exc_info=True)
+
+
+def sync() -> None:
+    """
+    他のワーカーがコミットした変更を共有ストアの変更ログから取り込み、カウンタを進めてリスナーに通知する。
+    リクエストの最初に呼ぶ。共有ストアを使わない場合は何もしない。
+    """
+    global _last_synced_seq
+    if _shared is None:
+        return
+    with _sync_lock:
+        rows = _shared.changes_since(_last_synced_seq)
+        if not rows:
+            return
+        if rows[0][0] != _last_synced_seq + 1:
+            # 読む前にログが捨てられていた: 何が変わったか分からないので全て変わったものとして扱う
+            logger.warning(f"Change log gap after {_last_synced_seq} (next {rows[0][0]}); invalidating all caches")
+            _apply(ChangeSet(everything=True), rows[-1][0], time_module.time())
+        else:
+            for seq, payload, created_at in rows:
+                with _lock:
+                    own = seq in _own_seqs
+                    _own_seqs.discard(seq)
+                if not own:
+                    _apply(_decode(payload), seq, created_at)
+        _last_synced_seq = rows[-1][0]
+
+
+def _load_shared_versions() -> None:
+    """起動時に共有ストアからカウンタとエポックを読み、他のワーカーと同じバージョンから始める"""
+    global _boot_token, _boot_time, _seq, _rules_version, _rules_modified, _global_version, _last_synced_seq
+    epoch, epoch_time, last_seq, versions = _shared.version_snapshot()
+    with _lock:
+        _boot_token, _boot_time = epoch, epoch_time
+        _seq = _last_synced_seq = last_seq
+        _global_version = versions.get("global", (0, epoch_time))[0]
+        _rules_version, _rules_modified = versions.get("rules", (0, epoch_time))
+        for key, (seq, modified) in versions.items():
+            if key.startswith("m:"):
+                year, month = key[2:].split("-")
+                _month_versions[(int(year), int(month))] = seq
+                _month_modified[(int(year), int(month))] = modified
+
+
+if _shared is not None:
+    _load_shared_versions()
+
+
+def months_in_range(start_date: date, end_date: date) -> Iterable[Tuple[int, int]]:
+    year, month = start_date.year, start_date.month
+    while (year, month) <= (end_date.year, end_date.month):
+        yield year, month
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def month_version(year: int, month: int) -> str:
+    """月のデータのバージョン文字列。この値が変わらなければ、その月の予定も変わっていない。"""
+    with _lock:
+        return f"{_boot_token}.{_global_version}.{_rules_version}.{_month_versions.get((year, month), 0)}"
+
+
+def range_etag(start_date: date, end_date: date, variant: str = "") -> str:
+    """期間に含まれる全ての月のバージョンから ETag を作る"""
+    with _lock:
+        parts = [_boot_token, str(_global_version), str(_rules_version), variant, start_date.isoformat(), end_date.isoformat()]
+        parts.extend(str(_month_versions.get(key, 0)) for key in months_in_range(start_date, end_date))
+    return '"' + hashlib.sha1("|".join(parts).encode()).hexdigest() + '"'
+
+
+def range_last_modified(start_date: date, end_date: date) -> float:
+    """期間に含まれる月の最終更新時刻 (UNIX時刻)。更新がなければ起動時刻。"""
+    with _lock:
+        modified = [_month_modified.get(key, _boot_time) for key in months_in_range(start_date, end_date)]
+        return max(modified + [_rules_modified, _boot_time])
@@ -1,17 +1,202 @@
+from sqlalchemy import delete, insert, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-import models, schemas
+from typing import Iterator, NamedTuple, Optional
+import heapq
+import models, schemas, change_tracker, interval_index
+import uuid
 from datetime import date, timedelta, time
 
-def get_event(db: Session, event_id: str):
-    return db.query(models.Event).filter(models.Event.id == event_id).first()
+DAY_OF_WEEK_MAP = {"monday": 0, "tuesday": 1, "wednesday": 2, "thursday": 3, "friday": 4, "saturday": 5, "sunday": 6}
 
-def get_events_by_month(db: Session, year: int, month: int):
+class EventOccurrence(NamedTuple):
+    """繰り返し予定を展開した1回分の予定 (DBには保存されない)。models.Event と同じ属性を持つ。"""
+    id: str
+    name: str
+    event_date: date
+    start_time: time
+    end_time: time
+
+def month_range(year: int, month: int) -> tuple[date, date]:
+    """月の初日と最終日を返す"""
     start_date = date(year, month, 1)
     if month == 12:
         end_date = date(year + 1, 1, 1) - timedelta(days=1)
     else:
         end_date = date(year, month + 1, 1) - timedelta(days=1)
-    return db.query(models.Event).filter(models.Event.event_date >= start_date, models.Event.event_date <= end_date).all()
+    return start_date, end_date
+
+# --- SQL文の組み立て (同期版・非同期版の両方から使う) ---
+
+def _events_in_range_stmt(start_date: date, end_date: date, name: Optional[str] = None):
+    stmt = select(models.Event).where(models.Event.event_date >= start_date, models.Event.event_date <= end_date)
+    if name is not None:
+        stmt = stmt.where(models.Event.name == name)
+    return stmt
+
+def _event_rows_in_range_stmt(start_date: date, end_date: date):
+    """ORMオブジェクトを作らずに (name, event_date, start_time, end_time) の列だけを読む"""
+    return select(models.Event.name, models.Event.event_date, models.Event.start_time, models.Event.end_time).where(
+        models.Event.event_date >= start_date, models.Event.event_date <= end_date,
+    )
+
+def _event_records_in_range_stmt(start_date: date, end_date: date, name: Optional[str] = None):
+    """(id, name, event_date, start_time, end_time) の列だけを読む"""
+    stmt = select(
+        models.Event.id, models.Event.name, models.Event.event_date, models.Event.start_time, models.Event.end_time,
+    ).where(models.Event.event_date >= start_date, models.Event.event_date <= end_date)
+    if name is not None:
+        stmt = stmt.where(models.Event.name == name)
+    return stmt
+
+def _rules_in_range_stmt(start_date: date, end_date: date, name: Optional[str] = None):
+    stmt = select(models.RecurringRule).where(
+        models.RecurringRule.valid_from <= end_date,
+        or_(models.RecurringRule.valid_until.is_(None), models.RecurringRule.valid_until >= start_date),
+    )
+    if name is not None:
+        stmt = stmt.where(models.RecurringRule.name == name)
+    return stmt
+
+def _exceptions_in_range_stmt(start_date: date, end_date: date, rule_ids: Optional[list[str]] = None):
+    stmt = select(models.RecurringException.rule_id, models.RecurringException.exception_date).where(
+        models.RecurringException.exception_date >= start_date,
+        models.RecurringException.exception_date <= end_date,
+    )
+    if rule_ids is not None:
+        stmt = stmt.where(models.RecurringException.rule_id.in_(rule_ids))
+    return stmt
+
+def _open_rule_stmt(rule: schemas.RecurringRuleCreate):
+    """同じ氏名・曜日・時刻の無期限ルールを探す"""
+    return select(models.RecurringRule).where(
+        models.RecurringRule.name == rule.name,
+        models.RecurringRule.weekday == rule.weekday,
+        models.RecurringRule.start_time == rule.start_time,
+        models.RecurringRule.end_time == rule.end_time,
+        models.RecurringRule.valid_until.is_(None),
+    ).limit(1)
+
+def _member_delete_stmt(name: str, start_date: date, end_date: date):
+    return delete(models.Event).where(
+        models.Event.name == name,
+        models.Event.event_date >= start_date,
+        models.Event.event_date <= end_date,
+    )
+
+def _insert_events_stmt(dialect_name: str):
+    """
+    イベントの INSERT 文。重複は登録前に interval_index で取り除いているが、
+    同時に同じ予定が登録された場合に備え、一意制約に当たった行は ON CONFLICT DO NOTHING で読み飛ばす。
+    """
+    if dialect_name == "sqlite":
+        return sqlite.insert(models.Event).on_conflict_do_nothing()
+    if dialect_name == "postgresql":
+        return postgresql.insert(models.Event).on_conflict_do_nothing()
+    return insert(models.Event)
+
+# 読み飛ばしたかどうかを確かめるため、登録後に id を読み直すときの1文あたりの id の数
+_INSERTED_ID_CHUNK_SIZE = 500
+
+def _inserted_ids_stmts(rows: list[dict]):
+    """rows のうち実際に登録された id を読む SELECT 文 (INSERT ... RETURNING を使えない場合)"""
+    ids = [row["id"] for row in rows]
+    return [
+        select(models.Event.id).where(models.Event.id.in_(ids[i:i + _INSERTED_ID_CHUNK_SIZE]))
+        for i in range(0, len(ids), _INSERTED_ID_CHUNK_SIZE)
+    ]
+
+def _written_rows(rows: list[dict], inserted_ids) -> list[dict]:
+    inserted_ids = set(inserted_ids)
+    return [row for row in rows if row["id"] in inserted_ids]
+
+def _skips_conflicts(dialect) -> bool:
+    """_insert_events_stmt が一意制約に当たった行を読み飛ばす (エラーにしない) DB か"""
+    return dialect.name in ("sqlite", "postgresql")
+
+def _insert_event_rows(db: Session, rows: list[dict]) -> list[dict]:
+    """rows を登録し、実際に登録された行だけを返す (一意制約で読み飛ばされた行は含まない)"""
+    dialect = db.get_bind().dialect
+    stmt = _insert_events_stmt(dialect.name)
+    if not _skips_conflicts(dialect):
+        # 重複は IntegrityError になるので、成功すれば全ての行が登録されている
+        db.execute(stmt, rows)
+        return rows
+    if dialect.insert_executemany_returning:
+        return _written_rows(rows, db.execute(stmt.returning(models.Event.id), rows).scalars())
+    db.execute(stmt, rows)
+    inserted_ids = []
+    for select_stmt in _inserted_ids_stmts(rows):
+        inserted_ids.extend(db.execute(select_stmt).scalars())
+    return _written_rows(rows, inserted_ids)
+
+def _count_skipped_as_duplicates(plan: interval_index.InsertPlan, created: list[schemas.EventResponse]) -> None:
+    """
+    登録の計画にあったが一意制約で読み飛ばされた予定 (計画の後に同じ予定が別のリクエストで登録された場合など) を、
+    plan.events から plan.duplicates に移す。
+    """
+    if len(created) == len(plan.events):
+        return
+    written = {(event.name, event.event_date, event.start_time, event.end_time) for event in created}
+    skipped = [event for event in plan.events if (event.name, event.event_date, event.start_time, event.end_time) not in written]
+    plan.duplicates.extend(skipped)
+    plan.events = [event for event in plan.events if (event.name, event.event_date, event.start_time, event.end_time) in written]
+
+def _existing_events_stmt(events: list[schemas.EventCreate]):
+    """登録しようとしている予定と同じメンバー・期間の既存の予定を (id, name, event_date, start_time, end_time) で読む"""
+    return select(
+        models.Event.id, models.Event.name, models.Event.event_date, models.Event.start_time, models.Event.end_time,
+    ).where(
+        models.Event.name.in_({event.name for event in events}),
+        models.Event.event_date >= min(event.event_date for event in events),
+        models.Event.event_date <= max(event.event_date for event in events),
+    )
+
+def _member_occurrences(occurrences: list[EventOccurrence], events: list[schemas.EventCreate]) -> list[EventOccurrence]:
+    names = {event.name for event in events}
+    return [o for o in occurrences if o.name in names]
+
+def _event_rows(events: list[schemas.EventCreate]) -> list[dict]:
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "name": event.name,
+            "event_date": event.event_date,
+            "start_time": event.start_time,
+            "end_time": event.end_time,
+        }
+        for event in events
+    ]
+
+def _exception_rows(rules, start_date: date, end_date: date, existing: set) -> list[dict]:
+    """期間内の繰り返し予定のうち、まだ除外されていない日付を除外日の行にする"""
+    return [
+        {"rule_id": rule.id, "exception_date": occurrence.event_date}
+        for rule in rules
+        for occurrence in expand_recurring_rules([rule], start_date, end_date, existing)
+    ]
+
+def _all_dates(start_date: date, end_date: date) -> list[date]:
+    return [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+
+# --- 読み取り ---
+
+def get_event(db: Session, event_id: str):
+    return db.query(models.Event).filter(models.Event.id == event_id).first()
+
+def get_events_by_month(db: Session, year: int, month: int):
+    """指定された月のイベントを返す。繰り返し予定はこの月の分だけ展開して含める。"""
+    start_date, end_date = month_range(year, month)
+    events = list(db.execute(_events_in_range_stmt(start_date, end_date)).scalars())
+    events.extend(get_recurring_occurrences(db, start_date, end_date))
+    return events
+
+def get_member_events_in_range(db: Session, name: str, start_date: date, end_date: date):
+    """指定されたメンバーの start_date〜end_date の予定 (繰り返し予定の展開分を含む) を返す"""
+    events = list(db.execute(_events_in_range_stmt(start_date, end_date, name=name)).scalars())
+    events.extend(get_recurring_occurrences(db, start_date, end_date, name=name))
+    return events
 
 def create_event(db: Session, event: schemas.EventCreate):
     db_event = models.Event(
@@ -21,10 +206,50 @@ def create_event(db: Session, event: schemas.EventCreate):
         end_time=event.end_time
     )
     db.add(db_event)
+    change_tracker.record_event_changes(db, [(event.name, event.event_date)])
     db.commit()
     db.refresh(db_event)
     return db_event
 
+def create_events_bulk(db: Session, events: list[schemas.EventCreate], commit: bool = True) -> list[schemas.EventResponse]:
+    """
+    複数のイベントを1トランザクション (executemany) でまとめて登録する。
+    IDはクライアント側で生成するため、登録後に refresh で読み直す必要がない。
+    既存の予定と完全に一致して読み飛ばされた行は返さない (INSERT ... RETURNING id、使えなければ id を読み直して確かめる)。
+    """
+    if not events:
+        if commit:
+            db.commit()
+        return []
+    rows = _insert_event_rows(db, _event_rows(events))
+    change_tracker.record_event_changes(db, ((row["name"], row["event_date"]) for row in rows))
+    if commit:
+        db.commit()
+    return [schemas.EventResponse(**row) for row in rows]
+
+def plan_event_inserts(db: Session, events: list[schemas.EventCreate], merge: bool = False) -> interval_index.InsertPlan:
+    """既存の予定 (繰り返し予定の展開分を含む) と照らし合わせ、重複を除いた登録内容と重なりを求める"""
+    if not events:
+        return interval_index.InsertPlan()
+    stored = db.execute(_existing_events_stmt(events)).all()
+    first, last = min(event.event_date for event in events), max(event.event_date for event in events)
+    occurrences = _member_occurrences(get_recurring_occurrences(db, first, last), events)
+    return interval_index.plan_inserts(stored, occurrences, events, merge=merge)
+
+def create_events_checked(
+    db: Session, events: list[schemas.EventCreate], merge: bool = False, commit: bool = True,
+) -> tuple[list[schemas.EventResponse], interval_index.InsertPlan]:
+    """
+    重複を除いてから登録する。merge=True なら重なる既存の予定を削除し、まとめた予定として登録し直す。
+    登録した予定と InsertPlan (重複・重なりの報告用) を返す。
+    """
+    plan = plan_event_inserts(db, events, merge=merge)
+    if plan.replaced_ids:
+        db.execute(delete(models.Event).where(models.Event.id.in_(plan.replaced_ids)))
+    created = create_events_bulk(db, plan.events, commit=commit)
+    _count_skipped_as_duplicates(plan, created)
+    return created, plan
+
 def get_all_events(db: Session):
     return db.query(models.Event).all()
 
@@ -38,8 +263,7 @@ def expand_recurring_event_for_month(
 ) -> list[schemas.EventCreate]:
     """指定された月の繰り返し予定を具体的な日付のイベントリストに展開する"""
     created_events = []
-    day_map = {"monday": 0, "tuesday": 1, "wednesday": 2, "thursday": 3, "friday": 4, "saturday": 5, "sunday": 6}
-    target_day_of_week = day_map.get(day_of_week_str.lower())
+    target_day_of_week = DAY_OF_WEEK_MAP.get(day_of_week_str.lower())
 
     if target_day_of_week is None:
         return []
@@ -56,16 +280,336 @@ def expand_recurring_event_for_month(
         current_date += timedelta(days=1)
     return created_events
 
+# --- 繰り返し予定 (検索時に展開する) ---
+
+def create_recurring_rules(
+    db: Session, rules: list[schemas.RecurringRuleCreate], commit: bool = True,
+) -> list[tuple[models.RecurringRule, Optional[date]]]:
+    """
+    繰り返し予定のルールを登録する。同じ氏名・曜日・時刻の無期限ルールが既にあれば新たには作らず、
+    必要なら適用開始日を前に広げて既存のルールを使う (同じ時間割を再登録しても重複しない)。
+    入力ごとに (ルール, 登録済みだった回の開始日) を返す。新たに作ったルールは None、
+    既存のルール (同じ呼び出しの中で先に作ったものを含む) を使った場合はこの入力より前の適用開始日で、
+    その日以降の回は既に登録されていたことを表す。変更の記録は作成・適用開始日を広げたルールの氏名だけに行う。
+    """
+    results = []
+    changed_names = set()
+    created: dict[tuple, models.RecurringRule] = {}
+    for rule in rules:
+        existing = created.get(_rule_key(rule)) if rule.valid_until is None else None
+        if existing is None and rule.valid_until is None:
+            existing = db.execute(_open_rule_stmt(rule)).scalars().first()
+        results.append(_use_or_create_rule(db, rule, existing, created, changed_names))
+    db.flush()
+    change_tracker.record_rule_changes(db, changed_names)
+    if commit:
+        db.commit()
+    return results
+
+def _rule_key(rule) -> tuple:
+    return (rule.name, rule.weekday, rule.start_time, rule.end_time)
+
+def _use_or_create_rule(db, rule: schemas.RecurringRuleCreate, existing, created: dict, changed_names: set):
+    """
+    existing (同じ無期限ルール) があれば適用開始日を必要なだけ前に広げて使い、なければ新たに作る。
+    (ルール, 登録済みだった回の開始日) を返す。
+    """
+    if existing is not None:
+        covered_from = existing.valid_from
+        if rule.valid_from < existing.valid_from:
+            existing.valid_from = rule.valid_from
+            changed_names.add(rule.name)
+        return existing, covered_from
+    db_rule = models.RecurringRule(id=str(uuid.uuid4()), **rule.model_dump())
+    db.add(db_rule)
+    if rule.valid_until is None:
+        created[_rule_key(rule)] = db_rule
+    changed_names.add(rule.name)
+    return db_rule, None
+
+def split_rule_occurrences(
+    rule_results: list[tuple[models.RecurringRule, Optional[date]]], start_date: date, end_date: date,
+) -> tuple[list[EventOccurrence], list[EventOccurrence]]:
+    """
+    create_recurring_rules の結果を start_date〜end_date に展開し、
+    (今回新たに加わった回, 既存のルールで登録済みだった回) に分ける。
+    """
+    added, existing = [], []
+    for rule, covered_from in rule_results:
+        for occurrence in expand_recurring_rules([rule], start_date, end_date):
+            if covered_from is not None and occurrence.event_date >= covered_from:
+                existing.append(occurrence)
+            else:
+                added.append(occurrence)
+    return added, existing
+
+def get_recurring_rules_in_range(db: Session, start_date: date, end_date: date, name: Optional[str] = None) -> list[models.RecurringRule]:
+    """start_date〜end_date と有効期間が重なるルールを返す"""
+    return list(db.execute(_rules_in_range_stmt(start_date, end_date, name=name)).scalars())
+
+def expand_recurring_rules(rules, start_date: date, end_date: date, exceptions: set = frozenset()) -> list[EventOccurrence]:
+    """ルールを start_date〜end_date の日付に展開する。exceptions は除外する (rule_id, 日付) の集合。"""
+    occurrences = []
+    for rule in rules:
+        first = max(start_date, rule.valid_from)
+        last = end_date if rule.valid_until is None else min(end_date, rule.valid_until)
+        current_date = first + timedelta(days=(rule.weekday - first.weekday()) % 7)
+        while current_date <= last:
+            if (rule.id, current_date) not in exceptions:
+                occurrences.append(EventOccurrence(
+                    id=f"{rule.id}:{current_date.isoformat()}",
+                    name=rule.name,
+                    event_date=current_date,
+                    start_time=rule.start_time,
+                    end_time=rule.end_time,
+                ))
+            current_date += timedelta(days=7)
+    return occurrences
+
+def get_recurring_occurrences(db: Session, start_date: date, end_date: date, name: Optional[str] = None) -> list[EventOccurrence]:
+    """start_date〜end_date の繰り返し予定を、個別に削除された日付を除いて展開する"""
+    rules = get_recurring_rules_in_range(db, start_date, end_date, name=name)
+    if not rules:
+        return []
+    exceptions = {(row.rule_id, row.exception_date) for row in db.execute(_exceptions_in_range_stmt(start_date, end_date))}
+    return expand_recurring_rules(rules, start_date, end_date, exceptions)
+
+def get_event_rows_in_range(db: Session, start_date: date, end_date: date) -> list[tuple]:
+    """
+    start_date〜end_date の予定 (繰り返し予定の展開分を含む) を (name, event_date, start_time, end_time) の
+    タプルで返す。event_store.EventStore.from_rows にそのまま渡せる。
+    """
+    rows = [tuple(row) for row in db.execute(_event_rows_in_range_stmt(start_date, end_date))]
+    rows.extend((o.name, o.event_date, o.start_time, o.end_time) for o in get_recurring_occurrences(db, start_date, end_date))
+    return rows
+
+def get_event_records_in_range(db: Session, start_date: date, end_date: date, name: Optional[str] = None) -> list[tuple]:
+    """
+    start_date〜end_date の予定 (繰り返し予定の展開分を含む) を (id, name, event_date, start_time, end_time) の
+    タプルで返す。name を指定するとそのメンバーの分だけを返す。
+    """
+    rows = [tuple(row) for row in db.execute(_event_records_in_range_stmt(start_date, end_date, name=name))]
+    rows.extend(tuple(o) for o in get_recurring_occurrences(db, start_date, end_date, name=name))
+    return rows
+
+def iter_events_in_range(db: Session, start_date: date, end_date: date, batch_size: int = 500) -> Iterator[tuple]:
+    """
+    start_date〜end_date の予定を (id, name, event_date, start_time, end_time) のタプルとして
+    日付・開始時刻順に返す。ORMオブジェクトは作らず、サーバー側カーソルから batch_size 件ずつ読み出す。
+    繰り返し予定の展開分も同じ順序でマージして返す。
+    """
+    stmt = (
+        select(models.Event.id, models.Event.name, models.Event.event_date, models.Event.start_time, models.Event.end_time)
+        .where(models.Event.event_date >= start_date, models.Event.event_date <= end_date)
+        .order_by(models.Event.event_date, models.Event.start_time)
+        .execution_options(yield_per=batch_size)
+    )
+    stored = (tuple(row) for row in db.execute(stmt))
+    occurrences = sorted(get_recurring_occurrences(db, start_date, end_date), key=lambda o: (o.event_date, o.start_time))
+    return heapq.merge(stored, (tuple(o) for o in occurrences), key=lambda row: (row[2], row[3]))
+
+def delete_all_events(db: Session) -> int:
+    """全てのイベントと繰り返し予定を、行を読み込まずに DELETE 文だけで削除する。削除したイベントの行数を返す。"""
+    deleted_count = db.execute(delete(models.Event)).rowcount
+    db.execute(delete(models.RecurringException))
+    db.execute(delete(models.RecurringRule))
+    change_tracker.record_all_changed(db)
+    db.commit()
+    return deleted_count
+
+def _delete_member_events_in_range(db: Session, name: str, start_date: date, end_date: date) -> int:
+    """
+    指定されたメンバーの start_date〜end_date のイベントを削除し、繰り返し予定はその期間の日付を除外日として登録する。
+    コミットはしない。削除された件数を返す。
+    """
+    stmt = _member_delete_stmt(name, start_date, end_date)
+    changed_dates = set()
+    if db.get_bind().dialect.delete_returning:
+        # 削除した行の日付だけを変更として記録する
+        deleted_dates = db.execute(stmt.returning(models.Event.event_date)).scalars().all()
+        deleted_count = len(deleted_dates)
+        changed_dates.update(deleted_dates)
+    else:
+        deleted_count = db.execute(stmt).rowcount
+        if deleted_count:
+            changed_dates.update(_all_dates(start_date, end_date))
+
+    rules = get_recurring_rules_in_range(db, start_date, end_date, name=name)
+    if rules:
+        existing_stmt = _exceptions_in_range_stmt(start_date, end_date, rule_ids=[rule.id for rule in rules])
+        existing = {(row.rule_id, row.exception_date) for row in db.execute(existing_stmt)}
+        exception_rows = _exception_rows(rules, start_date, end_date, existing)
+        if exception_rows:
+            db.execute(insert(models.RecurringException), exception_rows)
+            changed_dates.update(row["exception_date"] for row in exception_rows)
+            deleted_count += len(exception_rows)
+    if changed_dates:
+        change_tracker.record_event_changes(db, ((name, d) for d in changed_dates))
+    return deleted_count
 
 def delete_events_by_date_and_name(db: Session, event_date: date, name: str) -> int:
     """
     指定された日付と名前の全てのイベントを削除する。
-    削除された行数を返す。
+    繰り返し予定はその日だけを除外日として登録する。
+    削除された件数を返す。
     """
-    events_to_delete = db.query(models.Event).filter(
-        models.Event.event_date == event_date,
-        models.Event.name == name
-    )
-    deleted_count = events_to_delete.delete(synchronize_session=False)
+    deleted_count = _delete_member_events_in_range(db, name, event_date, event_date)
     db.commit()
-    return deleted_count
\ No newline at end of file
+    return deleted_count
+
+def delete_events_batch(db: Session, items: list[tuple[str, date, date]]) -> int:
+    """
+    (氏名, 開始日, 終了日) の組をまとめて1トランザクションで削除する。
+    1日だけ削除する場合は開始日と終了日に同じ日付を指定する。削除された件数の合計を返す。
+    """
+    deleted_count = 0
+    try:
+        for name, start_date, end_date in items:
+            deleted_count += _delete_member_events_in_range(db, name, start_date, end_date)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return deleted_count
+
+# --- 非同期版 (AsyncSession 用) ---
+# 同期版と同じSQL文を await で実行する。イベントループを止めないよう、非同期のエンドポイントからはこちらを使う。
+
+async def get_recurring_occurrences_async(db: AsyncSession, start_date: date, end_date: date, name: Optional[str] = None) -> list[EventOccurrence]:
+    rules = (await db.execute(_rules_in_range_stmt(start_date, end_date, name=name))).scalars().all()
+    if not rules:
+        return []
+    result = await db.execute(_exceptions_in_range_stmt(start_date, end_date))
+    exceptions = {(row.rule_id, row.exception_date) for row in result}
+    return expand_recurring_rules(rules, start_date, end_date, exceptions)
+
+async def get_events_by_month_async(db: AsyncSession, year: int, month: int):
+    start_date, end_date = month_range(year, month)
+    events = list((await db.execute(_events_in_range_stmt(start_date, end_date))).scalars())
+    events.extend(await get_recurring_occurrences_async(db, start_date, end_date))
+    return events
+
+async def get_event_rows_in_range_async(db: AsyncSession, start_date: date, end_date: date) -> list[tuple]:
+    rows = [tuple(row) for row in await db.execute(_event_rows_in_range_stmt(start_date, end_date))]
+    occurrences = await get_recurring_occurrences_async(db, start_date, end_date)
+    rows.extend((o.name, o.event_date, o.start_time, o.end_time) for o in occurrences)
+    return rows
+
+async def get_event_records_in_range_async(db: AsyncSession, start_date: date, end_date: date, name: Optional[str] = None) -> list[tuple]:
+    rows = [tuple(row) for row in await db.execute(_event_records_in_range_stmt(start_date, end_date, name=name))]
+    rows.extend(tuple(o) for o in await get_recurring_occurrences_async(db, start_date, end_date, name=name))
+    return rows
+
+async def get_member_events_in_range_async(db: AsyncSession, name: str, start_date: date, end_date: date):
+    events = list((await db.execute(_events_in_range_stmt(start_date, end_date, name=name))).scalars())
+    events.extend(await get_recurring_occurrences_async(db, start_date, end_date, name=name))
+    return events
+
+async def _insert_event_rows_async(db: AsyncSession, rows: list[dict]) -> list[dict]:
+    dialect = db.get_bind().dialect
+    stmt = _insert_events_stmt(dialect.name)
+    if not _skips_conflicts(dialect):
+        await db.execute(stmt, rows)
+        return rows
+    if dialect.insert_executemany_returning:
+        return _written_rows(rows, (await db.execute(stmt.returning(models.Event.id), rows)).scalars())
+    await db.execute(stmt, rows)
+    inserted_ids = []
+    for select_stmt in _inserted_ids_stmts(rows):
+        inserted_ids.extend((await db.execute(select_stmt)).scalars())
+    return _written_rows(rows, inserted_ids)
+
+async def create_events_bulk_async(db: AsyncSession, events: list[schemas.EventCreate], commit: bool = True) -> list[schemas.EventResponse]:
+    if not events:
+        if commit:
+            await db.commit()
+        return []
+    rows = await _insert_event_rows_async(db, _event_rows(events))
+    change_tracker.record_event_changes(db, ((row["name"], row["event_date"]) for row in rows))
+    if commit:
+        await db.commit()
+    return [schemas.EventResponse(**row) for row in rows]
+
+async def plan_event_inserts_async(db: AsyncSession, events: list[schemas.EventCreate], merge: bool = False) -> interval_index.InsertPlan:
+    if not events:
+        return interval_index.InsertPlan()
+    stored = (await db.execute(_existing_events_stmt(events))).all()
+    first, last = min(event.event_date for event in events), max(event.event_date for event in events)
+    occurrences = _member_occurrences(await get_recurring_occurrences_async(db, first, last), events)
+    return interval_index.plan_inserts(stored, occurrences, events, merge=merge)
+
+async def create_events_checked_async(
+    db: AsyncSession, events: list[schemas.EventCreate], merge: bool = False, commit: bool = True,
+) -> tuple[list[schemas.EventResponse], interval_index.InsertPlan]:
+    plan = await plan_event_inserts_async(db, events, merge=merge)
+    if plan.replaced_ids:
+        await db.execute(delete(models.Event).where(models.Event.id.in_(plan.replaced_ids)))
+    created = await create_events_bulk_async(db, plan.events, commit=commit)
+    _count_skipped_as_duplicates(plan, created)
+    return created, plan
+
+async def create_recurring_rules_async(
+    db: AsyncSession, rules: list[schemas.RecurringRuleCreate], commit: bool = True,
+) -> list[tuple[models.RecurringRule, Optional[date]]]:
+    results = []
+    changed_names = set()
+    created: dict[tuple, models.RecurringRule] = {}
+    for rule in rules:
+        existing = created.get(_rule_key(rule)) if rule.valid_until is None else None
+        if existing is None and rule.valid_until is None:
+            existing = (await db.execute(_open_rule_stmt(rule))).scalars().first()
+        results.append(_use_or_create_rule(db, rule, existing, created, changed_names))
+    await db.flush()
+    change_tracker.record_rule_changes(db, changed_names)
+    if commit:
+        await db.commit()
+    return results
+
+async def delete_all_events_async(db: AsyncSession) -> int:
+    deleted_count = (await db.execute(delete(models.Event))).rowcount
+    await db.execute(delete(models.RecurringException))
+    await db.execute(delete(models.RecurringRule))
+    change_tracker.record_all_changed(db)
+    await db.commit()
+    return deleted_count
+
+async def _delete_member_events_in_range_async(db: AsyncSession, name: str, start_date: date, end_date: date) -> int:
+    stmt = _member_delete_stmt(name, start_date, end_date)
+    changed_dates = set()
+    if db.get_bind().dialect.delete_returning:
+        deleted_dates = (await db.execute(stmt.returning(models.Event.event_date))).scalars().all()
+        deleted_count = len(deleted_dates)
+        changed_dates.update(deleted_dates)
+    else:
+        deleted_count = (await db.execute(stmt)).rowcount
+        if deleted_count:
+            changed_dates.update(_all_dates(start_date, end_date))
+
+    rules = (await db.execute(_rules_in_range_stmt(start_date, end_date, name=name))).scalars().all()
+    if rules:
+        existing_stmt = _exceptions_in_range_stmt(start_date, end_date, rule_ids=[rule.id for rule in rules])
+        existing = {(row.rule_id, row.exception_date) for row in await db.execute(existing_stmt)}
+        exception_rows = _exception_rows(rules, start_date, end_date, existing)
+        if exception_rows:
+            await db.execute(insert(models.RecurringException), exception_rows)
+            changed_dates.update(row["exception_date"] for row in exception_rows)
+            deleted_count += len(exception_rows)
+    if changed_dates:
+        change_tracker.record_event_changes(db, ((name, d) for d in changed_dates))
+    return deleted_count
+
+async def delete_events_by_date_and_name_async(db: AsyncSession, event_date: date, name: str) -> int:
+    deleted_count = await _delete_member_events_in_range_async(db, name, event_date, event_date)
+    await db.commit()
+    return deleted_count
+
+async def delete_events_batch_async(db: AsyncSession, items: list[tuple[str, date, date]]) -> int:
+    deleted_count = 0
+    try:
+        for name, start_date, end_date in items:
+            deleted_count += await _delete_member_events_in_range_async(db, name, start_date, end_date)
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+    return deleted_count
@@ -0,0 +1,222 @@
+"""
+計算用のコンパクトなイベント表現。
+
+クエリ結果 (または busy_cache のメンバーごとの区間) を一度だけ列ごとの NumPy 配列
+(メンバーID int32 / 日付の序数 int32 / 開始分・終了分 int16) に詰め替え、空き時間の計算はこの配列の上で行う。
+(登録時の重複・重なりの検出は、1件ずつ判定して結果を組み立てる必要があるので interval_index で行う)
+ORMオブジェクトや date / time を1件ずつ持たないので、1か月10万件でも数MBに収まる。
+メンバー名は一度だけ登場順に ID を振り (インターン)、配列にはIDだけを持つ。
+"""
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from datetime import date, time
+
+import numpy as np
+
+from free_slots import Interval, MINUTES_PER_DAY, time_to_start_minute, time_to_end_minute
+
+# (メンバー, 日付, 開始時刻, 終了時刻)
+EventRow = Tuple[str, date, time, time]
+
+
+class EventStore:
+    """
+    i 番目の予定は members[member[i]] の date.fromordinal(day[i]) の [start[i], end[i]) 分。
+    終了分は 1440 (24:00) で打ち切る。開始分 >= 終了分の予定は作成時に捨てる (メンバー名は members に残す)。
+    """
+
+    __slots__ = ("members", "member", "day", "start", "end", "_member_ids")
+
+    def __init__(self, members: Sequence[str], member: np.ndarray, day: np.ndarray, start: np.ndarray, end: np.ndarray):
+        self.members = list(members)
+        self.member = member
+        self.day = day
+        self.start = start
+        self.end = end
+        self._member_ids = {name: i for i, name in enumerate(self.members)}
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[EventRow]) -> "EventStore":
+        """(name, event_date, start_time, end_time) のタプルから作る"""
+        member_ids: Dict[str, int] = {}
+        # 同じ日付・時刻は何度も出てくるので、変換結果を使い回す
+        ordinals: Dict[date, int] = {}
+        starts: Dict[time, int] = {}
+        ends: Dict[time, int] = {}
+        member_col: List[int] = []
+        day_col: List[int] = []
+        start_col: List[int] = []
+        end_col: List[int] = []
+        for name, event_date, start_time, end_time in rows:
+            start = starts.get(start_time)
+            if start is None:
+                start = starts[start_time] = time_to_start_minute(start_time)
+            end = ends.get(end_time)
+            if end is None:
+                end = ends[end_time] = min(time_to_end_minute(end_time), MINUTES_PER_DAY)
+            member_id = member_ids.get(name)
+            if member_id is None:
+                member_id = member_ids[name] = len(member_ids)
+            if start >= end:
+                continue
+            ordinal = ordinals.get(event_date)
+            if ordinal is None:
+                ordinal = ordinals[event_date] = event_date.toordinal()
+            member_col.append(member_id)
+            day_col.append(ordinal)
+            start_col.append(start)
+            end_col.append(end)
+        return cls(
+            list(member_ids),
+            np.array(member_col, dtype=np.int32),
+            np.array(day_col, dtype=np.int32),
+            np.array(start_col, dtype=np.int16),
+            np.array(end_col, dtype=np.int16),
+        )
+
+    @classmethod
+    def from_intervals(
+        cls, intervals_by_member: Dict[str, Dict[date, List[Interval]]], members: Optional[Iterable[str]] = None
+    ) -> "EventStore":
+        """
+        メンバー -> 日付 -> マージ済みの区間 (busy_cache の形) から作る。members を指定すればそのメンバーの分だけを詰める
+        (予定のないメンバーは含まない)。
+        """
+        names = list(intervals_by_member) if members is None else [
+            name for name in dict.fromkeys(members) if name in intervals_by_member
+        ]
+        # マージ済みの区間は長さ0のものを含まないので、from_rows のような確認はせずにそのまま詰める
+        member_col: List[int] = []
+        day_col: List[int] = []
+        start_col: List[int] = []
+        end_col: List[int] = []
+        for member_id, name in enumerate(names):
+            for d, day_intervals in intervals_by_member[name].items():
+                ordinal = d.toordinal()
+                for start, end in day_intervals:
+                    member_col.append(member_id)
+                    day_col.append(ordinal)
+                    start_col.append(start)
+                    end_col.append(end)
+        return cls(
+            names,
+            np.array(member_col, dtype=np.int32),
+            np.array(day_col, dtype=np.int32),
+            np.array(start_col, dtype=np.int16),
+            np.minimum(np.array(end_col, dtype=np.int16), MINUTES_PER_DAY),
+        )
+
+    @classmethod
+    def from_events(cls, events: Iterable) -> "EventStore":
+        """イベント (name, event_date, start_time, end_time 属性を持つもの) から作る"""
+        return cls.from_rows((event.name, event.event_date, event.start_time, event.end_time) for event in events)
+
+    def __len__(self) -> int:
+        return len(self.day)
+
+    @property
+    def nbytes(self) -> int:
+        """列の配列が使っているバイト数 (メンバー名の一覧は含まない)"""
+        return self.member.nbytes + self.day.nbytes + self.start.nbytes + self.end.nbytes
+
+    def _member_mask(self, members: Optional[Iterable[str]]) -> Optional[np.ndarray]:
+        """members の予定だけを選ぶブール配列。None なら全員 (マスクなし)。"""
+        if members is None:
+            return None
+        ids = [self._member_ids[name] for name in set(members) if name in self._member_ids]
+        return np.isin(self.member, np.array(ids, dtype=np.int32))
+
+    def _sorted_order(self, mask: Optional[np.ndarray], by_member: bool) -> np.ndarray:
+        keys = (self.start, self.day, self.member) if by_member else (self.start, self.day)
+        order = np.lexsort(keys)
+        if mask is not None:
+            order = order[mask[order]]
+        return order
+
+    def member_busy_by_date(self) -> Dict[str, Dict[date, List[Interval]]]:
+        """メンバー -> 日付 -> マージ済みの区間 (busy_cache のキャッシュの形)。長さ0の予定しかないメンバーは空の辞書になる。"""
+        order = self._sorted_order(None, by_member=True)
+        result: Dict[str, Dict[date, List[Interval]]] = {name: {} for name in self.members}
+        current_member = current_day = None
+        by_date: Dict[date, List[Interval]] = {}
+        merged: List[Interval] = []
+        dates: Dict[int, date] = {}
+        for member, day, start, end in zip(
+            self.member[order].tolist(), self.day[order].tolist(), self.start[order].tolist(), self.end[order].tolist()
+        ):
+            if member != current_member:
+                current_member, current_day = member, None
+                by_date = result[self.members[member]] = {}
+            if day != current_day:
+                current_day = day
+                d = dates.get(day)
+                if d is None:
+                    d = dates[day] = date.fromordinal(day)
+                merged = by_date[d] = []
+            if merged and start <= merged[-1][1]:
+                if end > merged[-1][1]:
+                    merged[-1] = (merged[-1][0], end)
+            else:
+                merged.append((start, end))
+        return result
+
+    def busy_minutes(self, members: Optional[Iterable[str]], dates: Sequence[date]) -> np.ndarray:
+        """(日, 1440分) のブール行列。dates[d] の t 分に members の誰かの予定があれば True。"""
+        width = MINUTES_PER_DAY + 1
+        if not dates or not len(self):
+            return np.zeros((len(dates), MINUTES_PER_DAY), dtype=bool)
+        ordinals = np.array([d.toordinal() for d in dates], dtype=np.int32)
+        first = int(ordinals.min())
+        # 日付の序数 -> 行番号 (dates にない日は -1)
+        rows = np.full(int(ordinals.max()) - first + 1, -1, dtype=np.int64)
+        rows[ordinals - first] = np.arange(len(dates))
+
+        selected = (self.day >= first) & (self.day <= first + len(rows) - 1)
+        mask = self._member_mask(members)
+        if mask is not None:
+            selected &= mask
+        row = rows[self.day[selected] - first]
+        inside = row >= 0
+        offset = row[inside] * width
+        # 開始分に +1、終了分に -1 を置いた差分配列の累積和が正の分が埋まっている
+        # (行列を平らにした添字で数えるので、np.add.at より速い bincount で足し合わせられる)
+        size = len(dates) * width
+        diff = (
+            np.bincount(offset + self.start[selected][inside], minlength=size)
+            - np.bincount(offset + self.end[selected][inside], minlength=size)
+        )
+        return np.cumsum(diff.reshape(len(dates), width), axis=1)[:, :MINUTES_PER_DAY] > 0
+
+    def free_slot_minutes(
+        self,
+        members: Optional[Iterable[str]],
+        target_dates: Sequence[date],
+        duration_minutes: int,
+        work_start: time,
+        work_end: time,
+    ) -> Dict[date, List[Interval]]:
+        """
+        free_slots.compute_free_slot_minutes と同じ結果 ({日付: [(開始分, 終了分), ...]}, 空きのない日は含まない) を、
+        日ごとの分単位のビットマップと累積和で一括して求める。
+        """
+        if duration_minutes <= 0:
+            raise ValueError("最小持続時間は1分以上を指定してください。")
+        target_dates = list(target_dates)
+        work_start_min = time_to_start_minute(work_start)
+        work_end_min = time_to_end_minute(work_end)
+        slot_starts = np.arange(work_start_min, work_end_min - duration_minutes + 1, duration_minutes)
+        if not target_dates or len(slot_starts) == 0:
+            return {}
+
+        busy = self.busy_minutes(members, target_dates)
+        # prefix[d, t] は t 分より前の埋まっている分数。スロット内の分数が0なら空き。
+        prefix = np.zeros((len(target_dates), MINUTES_PER_DAY + 1), dtype=np.int32)
+        np.cumsum(busy, axis=1, out=prefix[:, 1:])
+        free = prefix[:, slot_starts + duration_minutes] == prefix[:, slot_starts]
+
+        starts = slot_starts.tolist()
+        slots_by_date: Dict[date, List[Interval]] = {}
+        for d, row in zip(target_dates, free.tolist()):
+            slots = [(start, start + duration_minutes) for start, ok in zip(starts, row) if ok]
+            if slots:
+                slots_by_date[d] = slots
+        return slots_by_date
@@ -0,0 +1,169 @@
+"""
+AIによる予定抽出結果のキャッシュ。
+
+同じ画像・同じテキストが何度も送られてくることが多いため、
+(氏名, テキスト, 画像バイト列, MIMEタイプ, モデル名, プロンプトのバージョン) のハッシュをキーにして
+抽出済みの EventDetailProcessed のリストを保存する。
+メモリ上では LRU + TTL で管理し、共有ストア (shared_cache) があればそこにも保存して他のワーカーと共有する。
+EXTRACTION_CACHE_DB を指定した場合は、その SQLite ファイルを抽出結果専用のストアとして使う。
+"""
+from typing import Any, Dict, List, Optional
+from collections import OrderedDict
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time as time_module
+
+import shared_cache
+from schemas import EventDetailProcessed
+
+logger = logging.getLogger(__name__)
+
+EXTRACTION_CACHE_MAX_ENTRIES = int(os.getenv("EXTRACTION_CACHE_MAX_ENTRIES", "256"))
+EXTRACTION_CACHE_TTL_SECONDS = float(os.getenv("EXTRACTION_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+EXTRACTION_CACHE_DB = os.getenv("EXTRACTION_CACHE_DB") # 未設定なら共有ストア (なければメモリ上のみ)
+_NAMESPACE = "extraction"
+
+
+def make_key(
+    name: str,
+    schedule_text: Optional[str],
+    image_data_list: Optional[List[bytes]],
+    image_mime_type_list: Optional[List[str]],
+    model_name: str,
+    prompt_version: str,
+) -> str:
+    """入力とモデル設定から sha256 のキャッシュキーを作る。"""
+    h = hashlib.sha256()
+
+    def feed(part: bytes) -> None:
+        # 区切りの曖昧さをなくすため、長さを前置する
+        h.update(len(part).to_bytes(8, "big"))
+        h.update(part)
+
+    feed(model_name.encode())
+    feed(prompt_version.encode())
+    feed(name.encode())
+    feed((schedule_text or "").encode())
+    for image_data, mime_type in zip(image_data_list or [], image_mime_type_list or []):
+        feed(mime_type.encode())
+        feed(image_data)
+    return h.hexdigest()
+
+
+def _dump(value: Dict[str, Any]) -> str:
+    return json.dumps({
+        "name": value["name"],
+        "events": [event.model_dump(mode="json") for event in value["events"]],
+    })
+
+
+def _load(raw: str) -> Dict[str, Any]:
+    data = json.loads(raw)
+    return {
+        "name": data["name"],
+        "events": [EventDetailProcessed.model_validate(event) for event in data["events"]],
+    }
+
+
+class ExtractionCache:
+    def __init__(
+        self,
+        max_entries: int = EXTRACTION_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = EXTRACTION_CACHE_TTL_SECONDS,
+        store: Optional[shared_cache.SharedStore] = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict() # key -> (保存時刻, 値)
+        self._lock = threading.Lock()
+        self._store = store
+
+    def _get_local(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] <= self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return {"name": entry[1]["name"], "events": list(entry[1]["events"])}
+            if entry is not None:
+                del self._entries[key]
+        return None
+
+    def _get_stored(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        """ストアから読む (ブロッキングI/O。ロックの外で行う)。見つからなければ失敗として数える"""
+        if self._store is not None:
+            row = self._store.get(_NAMESPACE, key)
+            if row is not None and now - row[2] <= self.ttl_seconds:
+                value = _load(row[0].decode())
+                with self._lock:
+                    self._remember(key, row[2], value)
+                    self.hits += 1
+                return {"name": value["name"], "events": list(value["events"])}
+            if row is not None:
+                self._store.delete(_NAMESPACE, key)
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time_module.time()
+        value = self._get_local(key, now)
+        return value if value is not None else self._get_stored(key, now)
+
+    async def get_async(self, key: str) -> Optional[Dict[str, Any]]:
+        """get の非同期版。ストアの読み込みはスレッドプールで行う (メモリ上で見つかればそのまま返す)"""
+        now = time_module.time()
+        value = self._get_local(key, now)
+        if value is not None:
+            return value
+        if self._store is None:
+            return self._get_stored(key, now)
+        return await asyncio.to_thread(self._get_stored, key, now)
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        with self._lock:
+            self._remember(key, time_module.time(), value)
+        if self._store is not None:
+            self._store.set(_NAMESPACE, key, _dump(value).encode())
+
+    async def set_async(self, key: str, value: Dict[str, Any]) -> None:
+        """set の非同期版。ストアへの書き込みはスレッドプールで行う"""
+        with self._lock:
+            self._remember(key, time_module.time(), value)
+        if self._store is not None:
+            await asyncio.to_thread(self._store.set, _NAMESPACE, key, _dump(value).encode())
+
+    def _remember(self, key: str, created_at: float, value: Dict[str, Any]) -> None:
+        self._entries[key] = (created_at, {"name": value["name"], "events": list(value["events"])})
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+        if self._store is not None:
+            self._store.clear([_NAMESPACE])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "persistent": self._store is not None,
+            }
+
+
+cache = ExtractionCache(store=shared_cache.SharedStore(EXTRACTION_CACHE_DB) if EXTRACTION_CACHE_DB else shared_cache.store)
@@ -0,0 +1,173 @@
+"""
+空き時間検索エンジン。
+
+イベントを日付ごとに一度だけグループ化し、メンバー全員分の予定を
+ソート＆スイープでマージした「埋まっている区間」を作ってから、
+業務時間内のスロットをその区間と突き合わせる。
+計算量はおおよそ O(イベント数 log イベント数 + 日数 × 1日のスロット数)。
+"""
+from typing import Dict, List, Tuple, Iterable, Optional, Sequence
+from datetime import date, time
+
+# (開始分, 終了分) の半開区間 [start, end)
+Interval = Tuple[int, int]
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def time_to_start_minute(t: time) -> int:
+    """開始時刻を0時からの経過分に変換する (秒は切り捨て)"""
+    return t.hour * 60 + t.minute
+
+
+def time_to_end_minute(t: time) -> int:
+    """終了時刻を0時からの経過分に変換する (秒があれば切り上げ)"""
+    minutes = t.hour * 60 + t.minute
+    if t.second or t.microsecond:
+        minutes += 1
+    return minutes
+
+
+# 0〜1440分の "HH:MM" を前もって作っておき、スロットごとに文字列を組み立てない
+_HHMM = [f"{minute // 60:02d}:{minute % 60:02d}" for minute in range(MINUTES_PER_DAY + 1)]
+
+
+def minute_to_hhmm(minute: int) -> str:
+    if 0 <= minute <= MINUTES_PER_DAY:
+        return _HHMM[minute]
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+
+def merge_intervals(intervals: Iterable[Interval]) -> List[Interval]:
+    """区間をソートし、重なり合う区間をマージする。長さ0以下の区間は捨てる。"""
+    merged: List[Interval] = []
+    for start, end in sorted(iv for iv in intervals if iv[0] < iv[1]):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def busy_intervals_by_date(
+    events: Iterable, members: Optional[Iterable[str]] = None
+) -> Dict[date, List[Interval]]:
+    """
+    イベント (name, event_date, start_time, end_time 属性を持つもの) を日付ごとにまとめ、
+    対象メンバーの埋まっている区間をマージして返す。members が None の場合は全員が対象。
+    """
+    member_set = set(members) if members is not None else None
+    raw: Dict[date, List[Interval]] = {}
+    for event in events:
+        if member_set is not None and event.name not in member_set:
+            continue
+        raw.setdefault(event.event_date, []).append(
+            (time_to_start_minute(event.start_time), time_to_end_minute(event.end_time))
+        )
+    return {d: merge_intervals(intervals) for d, intervals in raw.items()}
+
+
+def common_busy_by_date(
+    intervals_by_member: Dict[str, Dict[date, List[Interval]]], members: Iterable[str]
+) -> Dict[date, List[Interval]]:
+    """メンバーごとのマージ済み区間を、指定メンバー全員分について日付ごとにマージし直す。"""
+    raw: Dict[date, List[Interval]] = {}
+    for member in set(members):
+        for d, intervals in intervals_by_member.get(member, {}).items():
+            raw.setdefault(d, []).extend(intervals)
+    return {d: merge_intervals(intervals) for d, intervals in raw.items()}
+
+
+def common_busy_on_date(
+    intervals_by_member: Dict[str, Dict[date, List[Interval]]], members: Iterable[str], target_date: date
+) -> List[Interval]:
+    """common_busy_by_date の1日分。指定メンバー全員の target_date の区間をマージして返す。"""
+    raw: List[Interval] = []
+    for member in members:
+        raw.extend(intervals_by_member.get(member, {}).get(target_date, ()))
+    return merge_intervals(raw)
+
+
+def free_slots_for_day(
+    busy: Sequence[Interval], work_start: int, work_end: int, duration: int
+) -> List[Interval]:
+    """
+    業務開始時刻から duration 分刻みで並べたスロットのうち、
+    マージ済みの busy 区間のどれとも重ならないものを返す。
+    """
+    slots: List[Interval] = []
+    i = 0
+    n = len(busy)
+    slot_start = work_start
+    while slot_start + duration <= work_end:
+        slot_end = slot_start + duration
+        # スロット開始以前に終わっている区間は以降のスロットとも重ならない
+        while i < n and busy[i][1] <= slot_start:
+            i += 1
+        if i == n or busy[i][0] >= slot_end:
+            slots.append((slot_start, slot_end))
+        slot_start = slot_end
+    return slots
+
+
+def compute_free_slot_minutes(
+    busy_by_date: Dict[date, List[Interval]],
+    target_dates: Iterable[date],
+    duration_minutes: int,
+    work_start: time,
+    work_end: time,
+) -> Dict[date, List[Interval]]:
+    """
+    日付ごとのマージ済み busy 区間から共通の空き時間を計算する。
+    返り値は {日付: [(開始分, 終了分), ...]} の形式 (空きのない日は含まない)。
+    """
+    if duration_minutes <= 0:
+        raise ValueError("最小持続時間は1分以上を指定してください。")
+
+    work_start_min = time_to_start_minute(work_start)
+    work_end_min = time_to_end_minute(work_end)
+
+    slots_by_date: Dict[date, List[Interval]] = {}
+    for target_date in target_dates:
+        slots = free_slots_for_day(
+            busy_by_date.get(target_date, ()), work_start_min, work_end_min, duration_minutes
+        )
+        if slots:
+            slots_by_date[target_date] = slots
+    return slots_by_date
+
+
+def format_free_slots(slots_by_date: Dict[date, List[Interval]]) -> Dict[str, List[Dict[str, str]]]:
+    """{"YYYY-MM-DD": [{"start": "HH:MM", "end": "HH:MM"}, ...], ...} の形式にする"""
+    return {
+        target_date.isoformat(): [{"start": _HHMM[start], "end": _HHMM[end]} for start, end in slots]
+        for target_date, slots in slots_by_date.items()
+    }
+
+
+def compute_free_slots(
+    busy_by_date: Dict[date, List[Interval]],
+    target_dates: Iterable[date],
+    duration_minutes: int,
+    work_start: time,
+    work_end: time,
+) -> Dict[str, List[Dict[str, str]]]:
+    """
+    日付ごとのマージ済み busy 区間から共通の空き時間を計算する。
+    返り値は {"YYYY-MM-DD": [{"start": "HH:MM", "end": "HH:MM"}, ...], ...} の形式。
+    """
+    return format_free_slots(compute_free_slot_minutes(busy_by_date, target_dates, duration_minutes, work_start, work_end))
+
+
+def find_common_free_slots(
+    events: Iterable,
+    members: Iterable[str],
+    target_dates: Iterable[date],
+    duration_minutes: int,
+    work_start: time,
+    work_end: time,
+) -> Dict[str, List[Dict[str, str]]]:
+    """イベント一覧から、指定メンバー全員が空いているスロットを日付ごとに返す。"""
+    busy_by_date = busy_intervals_by_date(events, members)
+    return compute_free_slots(busy_by_date, target_dates, duration_minutes, work_start, work_end)
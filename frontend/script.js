@@ -12,6 +12,7 @@ document.addEventListener('DOMContentLoaded', () => {
     const freeSlotsDisplay = document.getElementById('freeSlotsDisplay');
     const submitButton = document.getElementById('submitButton');
     const loader = document.getElementById('loader');
+    const scheduleProgress = document.getElementById('scheduleProgress');
     const nameSelect = document.getElementById('nameSelect');
     const freeTextInputContainer = document.getElementById('freeTextInputContainer');
     const nameFreeText = document.getElementById('nameFreeText');
@@ -151,6 +152,72 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
 
+    // --- 列形式 (format=columnar) のレスポンスの展開 ---
+    function minutesToTime(minutes) {
+        return `${String(Math.floor(minutes / 60)).padStart(2, '0')}:${String(minutes % 60).padStart(2, '0')}`;
+    }
+
+    function columnarDate(data, i) {
+        return `${data.year}-${String(data.month).padStart(2, '0')}-${String(data.day[i]).padStart(2, '0')}`;
+    }
+
+    // /events/?format=columnar を [{id, name, event_date, start_time, end_time}, ...] に戻す
+    function decodeColumnarEvents(data) {
+        return data.id.map((id, i) => ({
+            id,
+            name: data.members[data.member[i]],
+            event_date: columnarDate(data, i),
+            start_time: minutesToTime(data.start[i]),
+            end_time: minutesToTime(data.end[i]),
+        }));
+    }
+
+    // /free_slots/?format=columnar を {"YYYY-MM-DD": [{start, end}, ...]} に戻す
+    function decodeColumnarFreeSlots(data) {
+        const slotsByDate = {};
+        data.day.forEach((_, i) => {
+            const dateStr = columnarDate(data, i);
+            (slotsByDate[dateStr] = slotsByDate[dateStr] || []).push({
+                start: minutesToTime(data.start[i]),
+                end: minutesToTime(data.end[i]),
+            });
+        });
+        return slotsByDate;
+    }
+
+    // --- 月のデータの取得 (/calendar/{year}/{month}) と前後の月の先読み ---
+    const prefetchedMonths = new Map(); // "YYYY-M" -> 取得中または取得済みの Promise
+
+    async function fetchCalendarMonth(year, month) {
+        const response = await fetch(`${API_BASE_URL}/calendar/${year}/${month}`);
+        if (!response.ok) throw new Error(`カレンダー取得エラー: ${response.statusText}`);
+        return response.json();
+    }
+
+    // 先読みした結果は一度だけ使う (それ以降の表示ではサーバーに最新のデータを問い合わせる)
+    function takeCalendarMonth(year, month) {
+        const key = `${year}-${month}`;
+        const prefetched = prefetchedMonths.get(key);
+        prefetchedMonths.delete(key);
+        return prefetched || fetchCalendarMonth(year, month);
+    }
+
+    function prefetchNeighbourMonths(year, month) {
+        [-1, 1].forEach(offset => {
+            const neighbour = new Date(year, month - 1 + offset, 1);
+            const key = `${neighbour.getFullYear()}-${neighbour.getMonth() + 1}`;
+            if (prefetchedMonths.has(key)) return;
+            const promise = fetchCalendarMonth(neighbour.getFullYear(), neighbour.getMonth() + 1);
+            promise.catch(() => prefetchedMonths.delete(key)); // 失敗したら表示時に取得し直す
+            prefetchedMonths.set(key, promise);
+        });
+    }
+
+    // 予定を登録・削除したら先読みした月のデータは古くなる
+    function clearPrefetchedMonths() {
+        prefetchedMonths.clear();
+    }
+
     // --- カレンダー描画とイベント取得 ---
     async function fetchAndDisplayCalendar(year, month) {
         currentMonthYearSpan.textContent = `${year}年 ${month}月`;
@@ -161,24 +228,19 @@ document.addEventListener('DOMContentLoaded', () => {
         const daysInMonth = new Date(year, month, 0).getDate();
         const firstDayOfMonthIndex = new Date(year, month - 1, 1).getDay();
 
+        // 予定・日ごとのメンバー数・既定の条件の空き時間を1回のリクエストで取得する
+        let freeSlotsData = {};
+        let memberCounts = [];
         try {
-            const response = await fetch(`${API_BASE_URL}/events/?year=${year}&month=${month}`);
-            if (!response.ok) throw new Error(`イベント取得エラー: ${response.statusText}`);
-            currentMonthEvents = await response.json();
+            const calendar = await takeCalendarMonth(year, month);
+            currentMonthEvents = decodeColumnarEvents(calendar.events);
+            memberCounts = calendar.member_counts;
+            freeSlotsData = decodeColumnarFreeSlots(calendar.free_slots);
             populateMemberCheckboxes(currentMonthEvents);
         } catch (error) {
-            console.error('イベント取得失敗:', error);
+            console.error('カレンダー取得失敗:', error);
             errorMessageDiv.textContent = error.message; // ページ上部のエラーメッセージ欄に表示
-            populateMemberCheckboxes([]); 
-        }
-
-        let freeSlotsData = {};
-        try {
-            const response = await fetch(`${API_BASE_URL}/free_slots/?year=${year}&month=${month}`);
-            if (!response.ok) throw new Error(`空き時間取得エラー: ${response.statusText}`);
-            freeSlotsData = await response.json();
-        } catch (error) {
-            console.error('空き時間取得失敗:', error);
+            populateMemberCheckboxes([]);
         }
 
         const dayHeaders = ['日', '月', '火', '水', '木', '金', '土'];
@@ -209,6 +271,14 @@ document.addEventListener('DOMContentLoaded', () => {
             dateNumber.textContent = day;
             dateNumberContainer.appendChild(dateNumber);
 
+            if (memberCounts[day - 1] > 0) {
+                const memberCount = document.createElement('span');
+                memberCount.classList.add('member-count');
+                memberCount.textContent = `${memberCounts[day - 1]}人`;
+                memberCount.title = `${memberCounts[day - 1]}人に予定があります`;
+                dateNumberContainer.appendChild(memberCount);
+            }
+
             const deleteDayButton = document.createElement('button');
             deleteDayButton.classList.add('delete-day-button');
             deleteDayButton.innerHTML = '×';
@@ -246,6 +316,7 @@ document.addEventListener('DOMContentLoaded', () => {
             calendarGrid.appendChild(dayCell);
         }
         displayFreeSlotsForMonth(freeSlotsData, year, month);
+        prefetchNeighbourMonths(year, month);
     }
     // --- 空き時間検索ボタンのイベントリスナー ---
     async function resetFreeSlots() {
@@ -274,7 +345,7 @@ document.addEventListener('DOMContentLoaded', () => {
         const month = currentDate.getMonth() + 1;
         
         // クエリパラメータを構築 (FastAPIは同じキーの複数パラメータをリストとして受け取る)
-        const params = new URLSearchParams({ year, month, duration_minutes: durationMinutes });
+        const params = new URLSearchParams({ year, month, duration_minutes: durationMinutes, format: 'columnar' });
         selectedMembers.forEach(member => params.append('members', member));
 
         try {
@@ -283,7 +354,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 const errorData = await response.json().catch(() => null);
                 throw new Error(errorData?.detail || `空き時間取得エラー: ${response.statusText}`);
             }
-            const freeSlotsData = await response.json();
+            const freeSlotsData = decodeColumnarFreeSlots(await response.json());
             displayFreeSlotsForMonth(freeSlotsData, year, month); // 結果を表示
         } catch (error) {
             console.error('空き時間取得失敗:', error);
@@ -394,7 +465,8 @@ document.addEventListener('DOMContentLoaded', () => {
         }
 
         try {
-            const response = await fetch(`${API_BASE_URL}/schedule/`, {
+            // AIの応答を待たずに、登録された予定から順にカレンダーへ反映する
+            const response = await fetch(`${API_BASE_URL}/schedule/stream`, {
                 method: 'POST',
                 body: formData,
             });
@@ -402,7 +474,29 @@ document.addEventListener('DOMContentLoaded', () => {
                 const errorData = await response.json().catch(() => ({ detail: response.statusText }));
                 throw new Error(errorData.detail || `サーバーエラー: ${response.status}`);
             }
-            alert('予定が登録されました！');
+            let summary = null;
+            let registered = 0;
+            await readServerSentEvents(response, (event, data) => {
+                if (event === 'events') {
+                    registered += data.events.length;
+                    scheduleProgress.textContent = `${registered} 件登録しました…`;
+                    clearPrefetchedMonths();
+                    fetchAndDisplayCalendar(currentViewingYear, currentViewingMonth);
+                } else if (event === 'error') {
+                    throw new Error(data.detail);
+                } else if (event === 'done') {
+                    summary = data;
+                }
+            });
+            if (!summary) throw new Error('サーバーとの接続が途中で切れました。');
+            if (summary.created === 0 && summary.duplicates === 0 && summary.merged === 0) {
+                throw new Error('AIからの情報では登録できる有効な予定がありませんでした。');
+            }
+            const notes = [];
+            if (summary.duplicates > 0) notes.push(`登録済みの予定と重複した ${summary.duplicates} 件は登録しませんでした。`);
+            if (summary.conflicts > 0) notes.push(`${summary.conflicts} 件の予定が同じ人の他の予定と時間が重なっています。`);
+            alert([`${summary.created} 件の予定が登録されました！`, ...notes].join('\n'));
+            clearPrefetchedMonths();
             scheduleForm.reset();
             freeTextInputContainer.style.display = 'none';
             nameFreeText.required = false;
@@ -411,12 +505,41 @@ document.addEventListener('DOMContentLoaded', () => {
         } catch (error) {
             console.error('予定登録失敗:', error);
             errorMessageDiv.textContent = `登録に失敗しました: ${error.message}`;
+            // 途中で失敗しても、それまでに登録された予定は残っている
+            clearPrefetchedMonths();
+            fetchAndDisplayCalendar(currentViewingYear, currentViewingMonth);
         } finally {
             submitButton.disabled = false;
             loader.style.display = 'none';
+            scheduleProgress.textContent = '';
         }
     });
 
+    // fetch のレスポンス本文を Server-Sent Events として読み、イベントごとに onEvent(event, data) を呼ぶ
+    // (EventSource は POST を送れないため自前で解析する)
+    async function readServerSentEvents(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        for (;;) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) >= 0) {
+                const block = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                let event = 'message';
+                const dataLines = [];
+                for (const line of block.split('\n')) {
+                    if (line.startsWith('event: ')) event = line.slice(7);
+                    else if (line.startsWith('data: ')) dataLines.push(line.slice(6));
+                }
+                if (dataLines.length > 0) onEvent(event, JSON.parse(dataLines.join('\n')));
+            }
+        }
+    }
+
     // --- 削除実行ボタンのイベントリスナー ---
     confirmDeleteButton.addEventListener('click', async () => {
         const selectedName = deleteNameSelect.value;
@@ -441,6 +564,7 @@ document.addEventListener('DOMContentLoaded', () => {
             }
             const result = await response.json();
             alert(result.message || '予定が削除されました。');
+            clearPrefetchedMonths();
             closeDeleteModal();
             fetchAndDisplayCalendar(currentDate.getFullYear(), currentDate.getMonth() + 1);
         } catch (error) {
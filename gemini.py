@@ -1,63 +1,185 @@
 import os
 import base64
-import json
-from typing import Optional, List, Union, Dict, Any
-from openai import OpenAI, APIError
-from pydantic import ValidationError # ValidationErrorはPydanticモデルのパースに使う
+from typing import Optional, List, Union, Dict, Any, Tuple, AsyncIterator, Awaitable, Callable
+import asyncio
+import time as time_module
+import httpx
+from openai import AsyncOpenAI, APIError
 import logging
-from datetime import date, time, datetime as dt
 
-# EventDetailProcessed を gemini.py からも参照できるようにする
-# (実際には main.py で使うので、schemas からインポートする)
-from schemas import GeminiResponseEvent as GeminiResponseSchema, EventDetailProcessed # 名前を変更
+import extraction_cache
+import image_processing
+import metrics
+import response_parser
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
 logger = logging.getLogger(__name__)
 
-client = OpenAI(
-    # api_key=OPENAI_API_KEY,
-    api_key=GEMINI_API_KEY,
-    base_url="https://generativelanguage.googleapis.com/v1beta/"
-)
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta/")
+# モデル呼び出しのタイムアウト (秒) と同時実行数の上限。環境変数で変更できる。
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "120"))
+LLM_CONNECT_TIMEOUT_SECONDS = float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", "10"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+# 1 のときは JSON Schema による構造化出力 (response_format) を要求する。対応していないモデルでは 0 にする。
+LLM_STRUCTURED_OUTPUT = os.getenv("LLM_STRUCTURED_OUTPUT", "1") == "1"
+
+# AsyncOpenAI クライアントと同時実行数制限用のセマフォは、イベントループごとに1つだけ作って共有する。
+# (HTTP接続プールを使い回すため、リクエストごとに作り直さない)
+_client: Optional[AsyncOpenAI] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def get_client() -> AsyncOpenAI:
+    """共有の AsyncOpenAI クライアントを返す。初回呼び出し時に接続プール付きで作成する。"""
+    global _client, _semaphore, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client_loop is not loop:
+        http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(LLM_TIMEOUT_SECONDS, connect=LLM_CONNECT_TIMEOUT_SECONDS),
+            limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS),
+        )
+        _client = AsyncOpenAI(
+            # api_key=OPENAI_API_KEY,
+            api_key=GEMINI_API_KEY,
+            base_url=GEMINI_BASE_URL,
+            http_client=http_client,
+            max_retries=LLM_MAX_RETRIES,
+        )
+        _semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+        _client_loop = loop
+    return _client
+
+async def close_client() -> None:
+    """アプリ終了時に共有クライアントの接続プールを閉じる。"""
+    global _client, _semaphore, _client_loop
+    if _client is not None:
+        await _client.close()
+    _client = None
+    _semaphore = None
+    _client_loop = None
+
 MODEL_NAME = "models/gemini-2.0-flash" # または適切なモデル
+# プロンプトや応答の解釈を変えたら上げる (抽出結果キャッシュのキーに含まれる)
+PROMPT_VERSION = "2"
+# 画像を前処理してから送る関数 (画像データ, MIMEタイプ) -> (前処理後の画像データ, MIMEタイプ)。
+# 抽出結果キャッシュのキーは前処理前の画像から作り、キャッシュにない場合だけ前処理する
+ImagePreprocessor = Callable[[List[bytes], List[str]], Awaitable[Tuple[List[bytes], List[str]]]]
 # MODEL_NAME = "gpt-4.1"
 # MODEL_NAME = "models/gemini-2.5-pro-preview-05-06"
 
+# 抽出のルール (1人分のプロンプトと複数人まとめたプロンプトで共通)
+EXTRACTION_RULES = """- 曜日ごとの予定は "day_of_week" フィールド (例: "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday") を使用してください。
+- 年は特に指定がない場合、2025年を想定してください。
+- 時間は特に指定がない場合、「終日」の場合は、時間を0:00から23:59までに指定してください。
+- 画像で時間割が提供されている場合は、"{ "day_of_week": "Monday", "start": "HH:MM", "end": "HH:MM" }"のフォーマットを使用し、各曜日の授業がある時間を画像から推測し、予定として追加してください。
+- カレンダーの画像が提供されている場合は、"{ "date": "YYYY-MM-DD", "start": "HH:MM", "end": "HH:MM" }"のフォーマットを使用し、画像から予定を推測してください。
+- 日付や曜日の指定がない場合は、可能な範囲で内容から推測してください。不明な場合はその予定を含めないでください。"""
+# テキストのみの入力を1回のモデル呼び出しにまとめる人数の上限
+BATCH_TEXT_MEMBERS_PER_REQUEST = int(os.getenv("BATCH_TEXT_MEMBERS_PER_REQUEST", "10"))
+
 def image_to_base64_data_url(image_data: bytes, mime_type: str = "image/jpeg") -> str:
     base64_encoded_data = base64.b64encode(image_data).decode('utf-8')
     return f"data:{mime_type};base64,{base64_encoded_data}"
 
-def _parse_time_str(time_str: Any) -> Optional[time]:
-    if not isinstance(time_str, str):
-        return None
-    try:
-        parts = time_str.split(':')
-        hour = int(parts[0])
-        minute = int(parts[1])
-        second = int(parts[2]) if len(parts) > 2 else 0
-        return time(hour, minute, second)
-    except (ValueError, IndexError, TypeError):
-        logger.warning(f"無効な時間形式をスキップ: {time_str}")
-        return None
-
-def _parse_date_str(date_str: Any) -> Optional[date]:
-    if not isinstance(date_str, str):
-        return None
-    try:
-        return dt.strptime(date_str, "%Y-%m-%d").date()
-    except (ValueError, TypeError):
-        logger.warning(f"無効な日付形式をスキップ: {date_str}")
-        return None
+async def _complete(api_messages: List[Dict[str, Any]], response_schema: Optional[Dict[str, Any]] = None, schema_name: str = "response") -> str:
+    """
+    モデルを呼び出し、応答の本文を返す。応答が空の場合は RuntimeError を送出する。
+    response_schema を渡すと (LLM_STRUCTURED_OUTPUT が有効なら) その JSON Schema に従った出力を要求する。
+    """
+    client = get_client()
+    options: Dict[str, Any] = {}
+    if response_schema is not None and LLM_STRUCTURED_OUTPUT:
+        options["response_format"] = response_parser.response_format(response_schema, schema_name)
+    # 同時に実行するモデル呼び出しの数を LLM_MAX_CONCURRENCY までに制限する
+    async with _semaphore:
+        logger.info(f"Sending request to Gemini (model: {MODEL_NAME})...")
+        t0 = time_module.perf_counter()
+        try:
+            chat_completion = await client.chat.completions.create(
+                messages=api_messages, # type: ignore
+                model=MODEL_NAME,
+                temperature=0.8,
+                **options,
+            )
+        except Exception:
+            metrics.LLM_REQUEST_SECONDS.observe(time_module.perf_counter() - t0, call=schema_name, outcome="error")
+            raise
+        metrics.LLM_REQUEST_SECONDS.observe(time_module.perf_counter() - t0, call=schema_name, outcome="success")
+    metrics.observe_llm_usage(schema_name, chat_completion.usage)
 
-async def process_schedule_input_with_gemini(
+    if not (chat_completion.choices and chat_completion.choices[0].message and
+            chat_completion.choices[0].message.content):
+        error_msg = "Gemini APIから空または無効な応答が返されました。"
+        logger.error(error_msg)
+        raise RuntimeError(error_msg) # API通信自体は成功したが中身がないケース
+
+    raw_response_content = chat_completion.choices[0].message.content
+    logger.info(f"Received Gemini response ({len(raw_response_content)} chars)")
+    logger.debug(f"Raw Gemini response content: {raw_response_content}")
+    return raw_response_content
+
+async def _complete_stream(
+    api_messages: List[Dict[str, Any]], response_schema: Optional[Dict[str, Any]] = None, schema_name: str = "response"
+) -> AsyncIterator[str]:
+    """
+    _complete のストリーミング版。応答の本文を受け取った断片ごとに返す。応答が空の場合は RuntimeError を送出する。
+    同時実行数の枠は応答を最後まで受け取るまで使い続ける。
+    """
+    client = get_client()
+    options: Dict[str, Any] = {}
+    if response_schema is not None and LLM_STRUCTURED_OUTPUT:
+        options["response_format"] = response_parser.response_format(response_schema, schema_name)
+    received = 0
+    usage = None
+    async with _semaphore:
+        logger.info(f"Sending streaming request to Gemini (model: {MODEL_NAME})...")
+        t0 = time_module.perf_counter()
+        outcome = "error"
+        try:
+            stream = await client.chat.completions.create(
+                messages=api_messages, # type: ignore
+                model=MODEL_NAME,
+                temperature=0.8,
+                stream=True,
+                **options,
+            )
+            async with stream:
+                async for chunk in stream:
+                    if getattr(chunk, "usage", None) is not None:
+                        usage = chunk.usage
+                    if not chunk.choices or not chunk.choices[0].delta or not chunk.choices[0].delta.content:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if not received:
+                        metrics.LLM_FIRST_CHUNK_SECONDS.observe(time_module.perf_counter() - t0, call=schema_name)
+                    received += len(delta)
+                    yield delta
+            outcome = "success"
+        except (GeneratorExit, asyncio.CancelledError):
+            outcome = "cancelled"
+            raise
+        finally:
+            metrics.LLM_REQUEST_SECONDS.observe(time_module.perf_counter() - t0, call=schema_name, outcome=outcome)
+    metrics.observe_llm_usage(schema_name, usage)
+
+    if not received:
+        error_msg = "Gemini APIから空または無効な応答が返されました。"
+        logger.error(error_msg)
+        raise RuntimeError(error_msg)
+    logger.info(f"Received streamed Gemini response ({received} chars)")
+
+def _check_extraction_input(
     name: str,
-    schedule_text: Optional[str] = None,
-    image_data_list: Optional[List[bytes]] = None,
-    image_mime_type_list: Optional[List[str]] = None
-) -> Optional[Dict[str, Any]]: # 返り値をDict[str, Any] (nameと処理済みevents) に変更
+    schedule_text: Optional[str],
+    image_data_list: Optional[List[bytes]],
+    image_mime_type_list: Optional[List[str]],
+    prepare_images: Optional[ImagePreprocessor] = None,
+) -> Tuple[bool, bool, str]:
     """
-    Gemini APIを呼び出し、レスポンスをパースして必要な情報を抽出する。
-    Pydanticによる厳密なバリデーションは行わず、キー存在と基本的な型変換を試みる。
+    入力を確認し、(テキストがあるか, 画像があるか, 抽出結果キャッシュのキー) を返す。不正な場合は ValueError を送出する。
+    キーは受け取った (前処理前の) 画像から作り、前処理する場合はその設定もキーに含める。
     """
     if not GEMINI_API_KEY or GEMINI_API_KEY == "YOUR_GEMINI_API_KEY_HERE":
         error_msg = "Gemini APIキーが設定されていません。"
@@ -70,6 +192,25 @@ async def process_schedule_input_with_gemini(
     if not has_text and not has_images:
         raise ValueError("予定テキストまたは画像が提供されていません。")
 
+    cache_key = extraction_cache.make_key(
+        name=name,
+        schedule_text=schedule_text if has_text else None,
+        image_data_list=image_data_list if has_images else None,
+        image_mime_type_list=image_mime_type_list if has_images else None,
+        model_name=MODEL_NAME,
+        prompt_version=PROMPT_VERSION + (f"+{image_processing.PREPROCESS_VERSION}" if has_images and prepare_images else ""),
+    )
+    return has_text, has_images, cache_key
+
+def _extraction_messages(
+    name: str,
+    schedule_text: Optional[str],
+    image_data_list: Optional[List[bytes]],
+    image_mime_type_list: Optional[List[str]],
+    has_text: bool,
+    has_images: bool,
+) -> List[Dict[str, Any]]:
+    """1人分の予定を抽出するプロンプト (system と user のメッセージ) を作る"""
     schedule_info_for_prompt_parts = []
     if has_text:
         schedule_info_for_prompt_parts.append(schedule_text)
@@ -88,12 +229,7 @@ async def process_schedule_input_with_gemini(
     {{ "day_of_week": "Monday", "start": "HH:MM", "end": "HH:MM" }}
   ]
 }}
-- 曜日ごとの予定は "day_of_week" フィールド (例: "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday") を使用してください。
-- 年は特に指定がない場合、2025年を想定してください。
-- 時間は特に指定がない場合、「終日」の場合は、時間を0:00から23:59までに指定してください。
-- 画像で時間割が提供されている場合は、"{{ "day_of_week": "Monday", "start": "HH:MM", "end": "HH:MM" }}"のフォーマットを使用し、各曜日の授業がある時間を画像から推測し、予定として追加してください。
-- カレンダーの画像が提供されている場合は、"{{ "date": "YYYY-MM-DD", "start": "HH:MM", "end": "HH:MM" }}"のフォーマットを使用し、画像から予定を推測してください。
-- 日付や曜日の指定がない場合は、可能な範囲で内容から推測してください。不明な場合はその予定を含めないでください。
+{EXTRACTION_RULES}
     """
     instruction_text = f"""
 氏名: {name}
@@ -115,103 +251,45 @@ async def process_schedule_input_with_gemini(
             else:
                 logger.warning(f"Skipping invalid image data or mime_type at index {i}")
 
-    api_messages = [
+    return [
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": prompt_messages_content}
     ]
-    try:
-        logger.info(f"Sending request to Gemini (model: {MODEL_NAME})...")
-        chat_completion = client.chat.completions.create(
-            messages=api_messages, # type: ignore
-            model=MODEL_NAME,
-            temperature=0.8,
-        )
-
-        if not (chat_completion.choices and chat_completion.choices[0].message and
-                chat_completion.choices[0].message.content):
-            error_msg = "Gemini APIから空または無効な応答が返されました。"
-            logger.error(error_msg)
-            raise RuntimeError(error_msg) # API通信自体は成功したが中身がないケース
-
-        raw_response_content = chat_completion.choices[0].message.content
-        logger.info(f"Raw Gemini response content: {raw_response_content}")
 
-        cleaned_response_content = raw_response_content.strip()
-        if cleaned_response_content.startswith("```json"):
-            cleaned_response_content = cleaned_response_content[7:]
-        if cleaned_response_content.endswith("```"):
-            cleaned_response_content = cleaned_response_content[:-3]
-        cleaned_response_content = cleaned_response_content.strip()
+async def process_schedule_input_with_gemini(
+    name: str,
+    schedule_text: Optional[str] = None,
+    image_data_list: Optional[List[bytes]] = None,
+    image_mime_type_list: Optional[List[str]] = None,
+    prepare_images: Optional[ImagePreprocessor] = None,
+) -> Optional[Dict[str, Any]]: # 返り値をDict[str, Any] (nameと処理済みevents) に変更
+    """
+    Gemini APIを呼び出し、レスポンスをパースして必要な情報を抽出する。
+    Pydanticによる厳密なバリデーションは行わず、キー存在と基本的な型変換を試みる。
+    prepare_images を渡した場合は、キャッシュになかったときだけ画像を前処理してから送る。
+    """
+    has_text, has_images, cache_key = _check_extraction_input(name, schedule_text, image_data_list, image_mime_type_list, prepare_images)
+    # 同じ入力に対する抽出結果があればモデルを呼ばずに返す
+    cached_result = await extraction_cache.cache.get_async(cache_key)
+    if cached_result is not None:
+        logger.info(f"Extraction cache hit for user {name} ({len(cached_result['events'])} events)")
+        return cached_result
+    if has_images and prepare_images is not None:
+        image_data_list, image_mime_type_list = await prepare_images(image_data_list, image_mime_type_list)
 
+    api_messages = _extraction_messages(name, schedule_text, image_data_list, image_mime_type_list, has_text, has_images)
+    try:
+        raw_response_content = await _complete(api_messages, response_parser.EXTRACTION_SCHEMA, "schedule_extraction")
         try:
-            gemini_output_dict = json.loads(cleaned_response_content)
-        except json.JSONDecodeError as e:
-            error_msg = f"Gemini APIがJSON形式でない応答を返しました: {e}. Response: {cleaned_response_content[:200]}..."
-            logger.error(error_msg)
-            raise ValueError(error_msg) from e
+            result, truncated = response_parser.parse_extraction(raw_response_content, fallback_name=name)
+        except ValueError as e:
+            logger.error(str(e))
+            raise
 
-        # GeminiResponseSchema で大枠(name, eventsキーの存在)だけ確認
-        try:
-            # Pydanticモデルを使って、nameとeventsキーの存在、eventsがリストであることを確認
-            parsed_shell = GeminiResponseSchema.model_validate(gemini_output_dict)
-            response_name = parsed_shell.name
-            raw_events_list = parsed_shell.events # この時点では List[dict]
-        except ValidationError as e:
-            error_msg = f"Gemini APIの応答の基本構造が不正です (nameまたはeventsキーがない等): {e}. Response: {cleaned_response_content[:200]}..."
-            logger.error(f"Pydantic shell validation error: \n{e.errors(include_url=False)}")
-            raise ValueError(error_msg) from e
-
-        processed_events: List[EventDetailProcessed] = []
-        for event_dict in raw_events_list:
-            if not isinstance(event_dict, dict):
-                logger.warning(f"イベントリスト内の要素が辞書ではありません、スキップします: {type(event_dict)} - {str(event_dict)[:50]}")
-                continue
-
-            # 必須キー: start, end
-            start_str = event_dict.get("start")
-            end_str = event_dict.get("end")
-
-            start_time_obj = _parse_time_str(start_str)
-            end_time_obj = _parse_time_str(end_str)
-
-            if not start_time_obj or not end_time_obj:
-                logger.warning(f"イベントに必須の開始/終了時刻がないか、形式が不正です。スキップ: {event_dict}")
-                continue # startかendがなければ予定として不完全なのでスキップ
-
-            # オプショナルキー: date, day_of_week
-            date_str = event_dict.get("date")
-            day_of_week_str = event_dict.get("day_of_week") # stringのはず
-
-            date_obj = _parse_date_str(date_str) if date_str else None
-            
-            # date と day_of_week の両方がある場合、date を優先する (あるいはプロンプトで制御)
-            # ここでは、どちらかがあれば採用
-            if not date_obj and (day_of_week_str is None or not isinstance(day_of_week_str, str)):
-                # 日付も曜日もない、または曜日が文字列でない場合はスキップ (あるいはログのみ)
-                # logger.warning(f"イベントに日付または曜日情報がありません: {event_dict}")
-                # このケースを許容するかは要件次第。ここでは、どちらかがないと予定として不完全とみなす。
-                # ただし、start/endがあれば、特定の日付/曜日に紐づかない「タスク」のような扱いも可能
-                pass # ここでは許容する（日付や曜日がなくても時間帯だけのイベントとして登録される可能性）
-
-            if day_of_week_str is not None and not isinstance(day_of_week_str, str):
-                logger.warning(f"day_of_week が文字列ではありません、Noneとして扱います: {day_of_week_str}")
-                day_of_week_str = None
-
-
-            # どちらも設定されていない場合、DBのnot null制約に引っかかる可能性があるため、
-            # main.py側で date か day_of_week がないと登録しないロジックが必要になる
-            # ここではEventDetailProcessedにそのまま渡す
-            processed_events.append(
-                EventDetailProcessed(
-                    event_date=date_obj,
-                    day_of_week=day_of_week_str if isinstance(day_of_week_str, str) else None, # 文字列でなければNone
-                    start_time=start_time_obj,
-                    end_time=end_time_obj
-                )
-            )
-        
-        # 最終的なレスポンスは、名前と処理済みのイベントリスト
-        return {"name": response_name, "events": processed_events}
+        # 途中で切れた応答から読めた分は、予定が欠けている可能性があるのでキャッシュしない
+        if not truncated:
+            await extraction_cache.cache.set_async(cache_key, result)
+        return result
 
 
     except APIError as e:
@@ -221,4 +299,137 @@ async def process_schedule_input_with_gemini(
     except Exception as e:
         error_msg = f"Gemini API処理中に予期せぬエラー: {str(e)}"
         logger.error(error_msg, exc_info=True)
-        raise RuntimeError(error_msg) from e
\ No newline at end of file
+        raise RuntimeError(error_msg) from e
+async def stream_schedule_input_with_gemini(
+    name: str,
+    schedule_text: Optional[str] = None,
+    image_data_list: Optional[List[bytes]] = None,
+    image_mime_type_list: Optional[List[str]] = None,
+    prepare_images: Optional[ImagePreprocessor] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    process_schedule_input_with_gemini のストリーミング版。応答を受け取りながら events の要素が閉じるたびに変換し、
+    受け取った断片ごとに {"name": 氏名, "events": [EventDetailProcessed, ...]} (その断片で読めた分) を返す。
+    氏名は応答の name がそれまでに読めていればそれを、なければ name を使う。
+    最後まで受け取れた場合だけ、全体を process_schedule_input_with_gemini と同じキーでキャッシュする。
+    """
+    has_text, has_images, cache_key = _check_extraction_input(name, schedule_text, image_data_list, image_mime_type_list, prepare_images)
+    cached_result = await extraction_cache.cache.get_async(cache_key)
+    if cached_result is not None:
+        logger.info(f"Extraction cache hit for user {name} ({len(cached_result['events'])} events)")
+        yield cached_result
+        return
+    if has_images and prepare_images is not None:
+        image_data_list, image_mime_type_list = await prepare_images(image_data_list, image_mime_type_list)
+
+    api_messages = _extraction_messages(name, schedule_text, image_data_list, image_mime_type_list, has_text, has_images)
+    parser = response_parser.IncrementalExtractionParser()
+    all_events: List[Any] = []
+    try:
+        async for delta in _complete_stream(api_messages, response_parser.EXTRACTION_SCHEMA, "schedule_extraction_stream"):
+            items = parser.feed(delta)
+            if items:
+                events = response_parser.parse_events(items)
+                all_events.extend(events)
+                if events:
+                    yield {"name": parser.name or name, "events": events}
+    except APIError as e:
+        error_msg = f"Gemini API呼び出しでエラー (APIError): {e.status_code} - {e.message}"
+        logger.error(error_msg, exc_info=True)
+        raise RuntimeError(error_msg) from e
+
+    if not parser.has_events:
+        # 予定の配列が始まらなかった応答は、通常の解析と同じエラーにする (name だけで切れていた場合は予定なし)
+        response_parser.parse_extraction(parser.text, fallback_name=name)
+        return
+    if not parser.done:
+        # 途中で切れた応答から読めた分は、予定が欠けている可能性があるのでキャッシュしない
+        logger.warning(f"ストリーミングの応答が途中で切れていたため、読み取れた {len(all_events)} 件の予定だけを使用します")
+        return
+    await extraction_cache.cache.set_async(cache_key, {"name": parser.name or name, "events": all_events})
+
+async def process_schedule_texts_batch_with_gemini(entries: List[Tuple[str, str]]) -> Dict[str, Dict[str, Any]]:
+    """
+    テキストのみで入力された複数メンバーの予定を、1回のモデル呼び出しでまとめて抽出する。
+    entries は (氏名, 予定テキスト) のリスト (氏名は重複しないこと)。
+    返り値は {氏名: {"name": 氏名, "events": [...]}}。応答に含まれなかったメンバーは含まれないので、
+    呼び出し側で process_schedule_input_with_gemini を使って個別に抽出し直す。
+    抽出結果は1人分で呼び出した場合と同じキーでキャッシュする。
+    """
+    if not GEMINI_API_KEY or GEMINI_API_KEY == "YOUR_GEMINI_API_KEY_HERE":
+        error_msg = "Gemini APIキーが設定されていません。"
+        logger.error(error_msg)
+        raise ValueError(error_msg)
+
+    results: Dict[str, Dict[str, Any]] = {}
+    cache_keys: Dict[str, str] = {}
+    pending: List[Tuple[str, str]] = []
+    for name, schedule_text in entries:
+        cache_keys[name] = extraction_cache.make_key(
+            name=name,
+            schedule_text=schedule_text,
+            image_data_list=None,
+            image_mime_type_list=None,
+            model_name=MODEL_NAME,
+            prompt_version=PROMPT_VERSION,
+        )
+        cached_result = await extraction_cache.cache.get_async(cache_keys[name])
+        if cached_result is not None:
+            results[name] = cached_result
+        else:
+            pending.append((name, schedule_text))
+    if not pending:
+        return results
+
+    system_prompt = f"""
+あなたの役割は、複数の人について与えられた情報を元に、それぞれの予定をJSON形式で出力することです。
+
+出力JSON形式 (この形式に厳密に従ってください。前後に説明文やマークダウン記法（```json ... ```など）を一切含めないでください。純粋なJSONオブジェクトのみを出力してください。):
+{{
+  "members": [
+    {{
+      "name": "氏名 (入力の氏名をそのまま使用)",
+      "events": [
+        {{ "date": "YYYY-MM-DD", "start": "HH:MM", "end": "HH:MM" }},
+        {{ "day_of_week": "Monday", "start": "HH:MM", "end": "HH:MM" }}
+      ]
+    }}
+  ]
+}}
+- 入力された全員について、入力と同じ順序で members に1件ずつ出力してください。予定がない人は events を空にしてください。
+- ある人の予定情報を別の人の予定に含めないでください。
+{EXTRACTION_RULES}
+    """
+    instruction_text = "\n---\n".join(
+        f"氏名: {name}\n予定情報: {[schedule_text]}" for name, schedule_text in pending
+    )
+    api_messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": [{"type": "text", "text": instruction_text}]},
+    ]
+    try:
+        raw_response_content = await _complete(api_messages, response_parser.BATCH_EXTRACTION_SCHEMA, "schedule_batch_extraction")
+    except APIError as e:
+        error_msg = f"Gemini API呼び出しでエラー (APIError): {e.status_code} - {e.message}"
+        logger.error(error_msg, exc_info=True)
+        raise RuntimeError(error_msg) from e
+
+    try:
+        members = response_parser.parse_batch_extraction(raw_response_content)
+    except ValueError as e:
+        error_msg = f"Gemini APIのまとめて抽出した応答が不正です: {e}. Response: {raw_response_content[:200]}..."
+        logger.error(error_msg)
+        raise ValueError(error_msg) from e
+
+    requested = {name for name, _ in pending}
+    for member in members:
+        name = member["name"]
+        if name not in requested:
+            logger.warning(f"まとめて抽出した応答に入力にない氏名が含まれていたためスキップします: {name}")
+            continue
+        await extraction_cache.cache.set_async(cache_keys[name], member)
+        results[name] = member
+    missing = requested - results.keys()
+    if missing:
+        logger.warning(f"まとめて抽出した応答に含まれなかったメンバー: {sorted(missing)}")
+    return results
@@ -0,0 +1,98 @@
+"""
+アップロード画像の前処理。
+
+スマホで撮った写真をそのまま base64 にしてモデルへ送るとリクエストが非常に大きくなるため、
+- アップロードはチャンク単位で読み込み、上限サイズを超えたら打ち切る
+- 長辺を IMAGE_MAX_EDGE px までに縮小し、WebP (または JPEG) で再エンコードする
+- 再エンコード時に EXIF などのメタデータは書き出さない (向きだけは事前に反映する)
+を行う。複数の画像はスレッドプールで並列に処理する。
+Pillow がインストールされていない場合は、元の画像をそのまま使う。
+"""
+from typing import List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import io
+import logging
+import os
+
+from fastapi import UploadFile
+
+try:
+    from PIL import Image, ImageOps
+except ImportError: # Pillow は任意の依存
+    Image = None
+    ImageOps = None
+
+logger = logging.getLogger(__name__)
+
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", "2048"))
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "WEBP").upper() # WEBP または JPEG
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "85"))
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 256 * 1024
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+_FORMAT_MIME_TYPES = {"WEBP": "image/webp", "JPEG": "image/jpeg"}
+# 前処理の設定 (抽出結果キャッシュのキーに含める。設定が変われば前処理後の画像も変わるため)
+PREPROCESS_VERSION = f"{IMAGE_MAX_EDGE}:{IMAGE_FORMAT}:{IMAGE_QUALITY}" if Image is not None else "none"
+
+_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="image")
+
+
+class UploadTooLargeError(ValueError):
+    """アップロードされたファイルが UPLOAD_MAX_BYTES を超えた"""
+
+
+async def read_upload(upload: UploadFile, max_bytes: int = UPLOAD_MAX_BYTES) -> bytes:
+    """アップロードファイルをチャンク単位で読み込む。上限を超えた時点で UploadTooLargeError を送出する。"""
+    buffer = bytearray()
+    while True:
+        chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        buffer.extend(chunk)
+        if len(buffer) > max_bytes:
+            raise UploadTooLargeError(
+                f"ファイル '{upload.filename}' が大きすぎます (上限 {max_bytes // (1024 * 1024)}MB)。"
+            )
+    return bytes(buffer)
+
+
+def preprocess_image(image_data: bytes, mime_type: str) -> Tuple[bytes, str]:
+    """
+    画像を縮小・再エンコードし、(画像データ, MIMEタイプ) を返す。
+    Pillow がない場合や画像を読めない場合は元のデータをそのまま返す。
+    """
+    if Image is None:
+        return image_data, mime_type
+    try:
+        with Image.open(io.BytesIO(image_data)) as img:
+            # JPEG はデコード時点で縮小させる (2のべき乗単位、目標サイズ以上を保つ)
+            img.draft("RGB", (IMAGE_MAX_EDGE, IMAGE_MAX_EDGE))
+            # EXIF の回転情報を画素に反映してから、メタデータなしで書き出す
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((IMAGE_MAX_EDGE, IMAGE_MAX_EDGE), Image.LANCZOS)
+            output_format = IMAGE_FORMAT if IMAGE_FORMAT in _FORMAT_MIME_TYPES else "WEBP"
+            if output_format == "JPEG":
+                img = img.convert("RGB")
+            elif img.mode not in ("RGB", "RGBA"):
+                has_alpha = "A" in img.getbands() or "transparency" in img.info
+                img = img.convert("RGBA" if has_alpha else "RGB")
+            out = io.BytesIO()
+            img.save(out, format=output_format, quality=IMAGE_QUALITY)
+    except Exception as e:
+        logger.warning(f"画像の前処理に失敗したため元の画像を使用します: {e}")
+        return image_data, mime_type
+    return out.getvalue(), _FORMAT_MIME_TYPES[output_format]
+
+
+async def preprocess_images(
+    image_data_list: List[bytes], image_mime_type_list: List[str]
+) -> Tuple[List[bytes], List[str]]:
+    """複数の画像をスレッドプールで並列に前処理する。"""
+    loop = asyncio.get_running_loop()
+    results = await asyncio.gather(*[
+        loop.run_in_executor(_executor, preprocess_image, data, mime_type)
+        for data, mime_type in zip(image_data_list, image_mime_type_list)
+    ])
+    return [data for data, _ in results], [mime_type for _, mime_type in results]
@@ -0,0 +1,189 @@
+"""
+登録時の重複・重なり (コンフリクト) の検出。
+
+(メンバー, 日付) ごとに予定を (開始, 終了) の順に並べたリストを持ち、bisect で検索・挿入する。
+登録しようとする予定を1件ずつ
+- 既存の予定 (DBの行・繰り返し予定の展開分)・同じバッチの予定と完全に一致すれば重複として登録しない
+- 時間が重なれば conflicts として報告する (merge=True なら重なる予定をまとめて1件にする)
+の順に判定する。1件あたり O(log k + 重なる件数) (k はその日のその人の予定数) なので、
+数千件の一括登録でも全体で O(n log n) 程度で済む。
+"""
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass, field
+from datetime import date, time
+
+import schemas
+
+# 予定の出どころ
+STORED = "stored"       # DB に保存済みの予定 (ref は id)
+RECURRING = "recurring" # 繰り返し予定の展開分 (ref は展開後の id)。merge でも変更しない
+NEW = "new"             # 今回登録する予定 (ref は InsertPlan 内の番号)
+
+
+def _seconds(t: time) -> int:
+    return t.hour * 3600 + t.minute * 60 + t.second
+
+
+class Entry(NamedTuple):
+    start: int   # 0時からの秒
+    end: int
+    start_time: time
+    end_time: time
+    source: str
+    ref: Any
+
+
+class Conflict(NamedTuple):
+    """登録する予定と、時間が重なっている別の予定"""
+    name: str
+    event_date: date
+    start_time: time
+    end_time: time
+    other_start_time: time
+    other_end_time: time
+    other_source: str
+
+    def to_dict(self) -> Dict[str, str]:
+        return {
+            "name": self.name,
+            "date": self.event_date.isoformat(),
+            "start": self.start_time.isoformat(timespec="minutes"),
+            "end": self.end_time.isoformat(timespec="minutes"),
+            "conflicts_with": {
+                "start": self.other_start_time.isoformat(timespec="minutes"),
+                "end": self.other_end_time.isoformat(timespec="minutes"),
+                "source": self.other_source,
+            },
+        }
+
+
+class DayIndex:
+    """1人の1日分の予定。keys[i] == (entries[i].start, entries[i].end) で、keys は昇順。"""
+
+    __slots__ = ("keys", "entries", "max_length")
+
+    def __init__(self):
+        self.keys: List[Tuple[int, int]] = []
+        self.entries: List[Entry] = []
+        self.max_length = 0 # これまでに入れた予定の最大の長さ (重なりの探索範囲を絞るのに使う)
+
+    def add(self, entry: Entry) -> None:
+        i = bisect_right(self.keys, (entry.start, entry.end))
+        self.keys.insert(i, (entry.start, entry.end))
+        self.entries.insert(i, entry)
+        self.max_length = max(self.max_length, entry.end - entry.start)
+
+    def remove(self, entry: Entry) -> None:
+        i = bisect_left(self.keys, (entry.start, entry.end))
+        while self.entries[i] is not entry:
+            i += 1
+        del self.keys[i]
+        del self.entries[i]
+
+    def find(self, start: int, end: int) -> Optional[Entry]:
+        """開始・終了が完全に一致する予定"""
+        i = bisect_left(self.keys, (start, end))
+        if i < len(self.keys) and self.keys[i] == (start, end):
+            return self.entries[i]
+        return None
+
+    def overlapping(self, start: int, end: int) -> List[Entry]:
+        """[start, end) と重なる予定 (接しているだけのものは含まない)"""
+        # 開始が end より前の予定のうち、開始が start - max_length より後のものだけが重なりうる
+        i = bisect_left(self.keys, (end,))
+        found = []
+        lower = start - self.max_length
+        while i > 0 and self.keys[i - 1][0] > lower:
+            i -= 1
+            if self.keys[i][1] > start:
+                found.append(self.entries[i])
+        found.reverse()
+        return found
+
+
+@dataclass
+class InsertPlan:
+    """plan_inserts の結果"""
+    events: List[schemas.EventCreate] = field(default_factory=list)     # 登録する予定
+    duplicates: List[schemas.EventCreate] = field(default_factory=list) # 既存の予定と完全に一致したので登録しない予定
+    conflicts: List[Conflict] = field(default_factory=list)
+    replaced_ids: List[str] = field(default_factory=list)               # merge で新しい予定にまとめた既存の予定の id
+    merged: int = 0                                                      # merge で別の予定とまとめた、登録しようとした予定の数
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "duplicates": len(self.duplicates),
+            "merged": self.merged,
+            "replaced": len(self.replaced_ids),
+            "conflicts": [conflict.to_dict() for conflict in self.conflicts],
+        }
+
+
+def plan_inserts(
+    stored: Iterable[Tuple[str, str, date, time, time]],
+    occurrences: Iterable,
+    events: Iterable[schemas.EventCreate],
+    merge: bool = False,
+) -> InsertPlan:
+    """
+    stored は既存の予定の (id, name, event_date, start_time, end_time)、
+    occurrences は繰り返し予定の展開分 (crud.EventOccurrence)。
+    登録する予定は入力の順に判定し、InsertPlan.events も入力の順 (まとめた予定は最初に現れた位置) になる。
+    """
+    days: Dict[Tuple[str, date], DayIndex] = {}
+
+    def day_index(name: str, d: date) -> DayIndex:
+        index = days.get((name, d))
+        if index is None:
+            index = days[(name, d)] = DayIndex()
+        return index
+
+    for event_id, name, event_date, start_time, end_time in stored:
+        day_index(name, event_date).add(Entry(_seconds(start_time), _seconds(end_time), start_time, end_time, STORED, event_id))
+    for o in occurrences:
+        day_index(o.name, o.event_date).add(Entry(_seconds(o.start_time), _seconds(o.end_time), o.start_time, o.end_time, RECURRING, o.id))
+
+    plan = InsertPlan()
+    pending: List[Optional[schemas.EventCreate]] = []
+    for event in events:
+        index = day_index(event.name, event.event_date)
+        start, end = _seconds(event.start_time), _seconds(event.end_time)
+        if index.find(start, end) is not None:
+            plan.duplicates.append(event)
+            continue
+        overlaps = index.overlapping(start, end)
+        if merge:
+            # 既存の予定にすっぽり収まる場合は、既存の予定を作り直さずに登録だけをやめる
+            if any(entry.source != RECURRING and entry.start <= start and end <= entry.end for entry in overlaps):
+                plan.merged += 1
+                continue
+            # 繰り返し予定以外の重なる予定を吸収し、まとめた区間がさらに別の予定と重なれば繰り返す
+            absorbed = False
+            while True:
+                mergeable = [entry for entry in overlaps if entry.source != RECURRING]
+                if not mergeable:
+                    break
+                absorbed = True
+                for entry in mergeable:
+                    index.remove(entry)
+                    if entry.source == STORED:
+                        plan.replaced_ids.append(entry.ref)
+                    else:
+                        pending[entry.ref] = None
+                first = min([(start, event.start_time)] + [(e.start, e.start_time) for e in mergeable])
+                last = max([(end, event.end_time)] + [(e.end, e.end_time) for e in mergeable])
+                start, end = first[0], last[0]
+                event = schemas.EventCreate(name=event.name, event_date=event.event_date, start_time=first[1], end_time=last[1])
+                overlaps = index.overlapping(start, end)
+            if absorbed:
+                plan.merged += 1
+        for entry in overlaps:
+            plan.conflicts.append(Conflict(
+                event.name, event.event_date, event.start_time, event.end_time, entry.start_time, entry.end_time, entry.source,
+            ))
+        index.add(Entry(start, end, event.start_time, event.end_time, NEW, len(pending)))
+        pending.append(event)
+
+    plan.events = [event for event in pending if event is not None]
+    return plan
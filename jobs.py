@@ -0,0 +1,207 @@
+"""
+時間のかかる処理 (AIによる予定の抽出と登録) をバックグラウンドで実行するジョブキュー。
+
+/schedule/ を async_mode で呼ぶとジョブとして登録され、すぐに job_id が返る。
+キューは上限付きで、あふれた場合は QueueFullError を送出する (エンドポイントは 429 を返す)。
+ジョブはイベントループ上の一定数のワーカータスクが順に実行し、結果と所要時間 (キュー待ち・各処理段階・合計) を
+一定時間保持する。状態が変わるたびに通知するので、ポーリングの代わりに SSE で待つこともできる。
+"""
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from dataclasses import dataclass, field
+import asyncio
+import logging
+import os
+import time as time_module
+import uuid
+
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "100"))          # 実行待ちのジョブの上限
+JOB_RESULT_TTL_SECONDS = float(os.getenv("JOB_RESULT_TTL_SECONDS", "3600"))
+JOB_TIMEOUT_SECONDS = float(os.getenv("JOB_TIMEOUT_SECONDS", "300"))
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+FINISHED_STATUSES = (SUCCEEDED, FAILED)
+
+# ジョブ本体: 所要時間を記録する辞書を受け取り、JSONにできる結果を返す
+JobFunc = Callable[[Dict[str, float]], Awaitable[Any]]
+
+
+class QueueFullError(RuntimeError):
+    """実行待ちのジョブが上限に達している"""
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    func: JobFunc
+    status: str = QUEUED
+    created_at: float = field(default_factory=time_module.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Any = None
+    error: Optional[Dict[str, Any]] = None
+    timings: Dict[str, float] = field(default_factory=dict) # 処理段階ごとの所要時間 (秒)
+    version: int = 0                                        # 状態が変わるたびに増える
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "timings": {name: round(seconds, 4) for name, seconds in self.timings.items()},
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobQueue:
+    def __init__(self, workers: int = JOB_WORKERS, max_queued: int = JOB_QUEUE_MAX):
+        self.workers = workers
+        self.max_queued = max_queued
+        self._jobs: Dict[str, Job] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._changed: Optional[asyncio.Condition] = None
+        self._tasks: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.submitted = 0
+        self.rejected = 0
+        self.succeeded = 0
+        self.failed = 0
+        self._durations: Dict[str, List[float]] = {}
+
+    def _ensure_started(self) -> None:
+        """実行中のイベントループ上でワーカーを起動する (ループごとに1回)"""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self._queue = asyncio.Queue()
+        self._changed = asyncio.Condition()
+        self._tasks = [loop.create_task(self._worker(i)) for i in range(self.workers)]
+        self._loop = loop
+        # 前のループで実行待ちだったジョブは実行されないので失敗扱いにする
+        for job in self._jobs.values():
+            if job.status not in FINISHED_STATUSES:
+                job.status = FAILED
+                job.error = {"status_code": 503, "detail": "ジョブの実行中にサーバーが再起動しました。"}
+                job.finished_at = time_module.time()
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._loop = None
+
+    def queued_count(self) -> int:
+        return sum(1 for job in self._jobs.values() if job.status == QUEUED)
+
+    async def submit(self, kind: str, func: JobFunc) -> Job:
+        """ジョブを登録する。実行待ちが上限に達していれば QueueFullError を送出する。"""
+        self._ensure_started()
+        self._prune()
+        if self.queued_count() >= self.max_queued:
+            self.rejected += 1
+            raise QueueFullError(f"実行待ちのジョブが上限 ({self.max_queued} 件) に達しています。")
+        job = Job(id=uuid.uuid4().hex, kind=kind, func=func)
+        self._jobs[job.id] = job
+        self.submitted += 1
+        self._queue.put_nowait(job.id)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    async def wait_for_change(self, job: Job, seen_version: int, timeout: float) -> bool:
+        """job の状態が seen_version から変わるまで最大 timeout 秒待つ。変わったら True。"""
+        self._ensure_started()
+        async with self._changed:
+            try:
+                await asyncio.wait_for(self._changed.wait_for(lambda: job.version != seen_version), timeout)
+            except asyncio.TimeoutError:
+                return False
+        return True
+
+    async def _notify(self, job: Job) -> None:
+        job.version += 1
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def _worker(self, worker_id: int) -> None:
+        while True:
+            job_id = await self._queue.get()
+            job = self._jobs.get(job_id)
+            if job is None or job.status != QUEUED:
+                continue
+            job.status = RUNNING
+            job.started_at = time_module.time()
+            job.timings["queue_wait"] = job.started_at - job.created_at
+            await self._notify(job)
+            t0 = time_module.perf_counter()
+            try:
+                job.result = await asyncio.wait_for(job.func(job.timings), JOB_TIMEOUT_SECONDS)
+                job.status = SUCCEEDED
+                self.succeeded += 1
+            except HTTPException as e:
+                job.status = FAILED
+                job.error = {"status_code": e.status_code, "detail": e.detail}
+                self.failed += 1
+            except asyncio.TimeoutError:
+                job.status = FAILED
+                job.error = {"status_code": 504, "detail": f"ジョブが {JOB_TIMEOUT_SECONDS:.0f} 秒以内に終わりませんでした。"}
+                self.failed += 1
+            except Exception as e:
+                logger.error(f"Job {job.id} ({job.kind}) failed: {e}", exc_info=True)
+                job.status = FAILED
+                job.error = {"status_code": 500, "detail": f"予期せぬエラーが発生しました: {str(e)}"}
+                self.failed += 1
+            job.timings["run"] = time_module.perf_counter() - t0
+            job.finished_at = time_module.time()
+            job.timings["total"] = job.finished_at - job.created_at
+            for name, seconds in job.timings.items():
+                self._durations.setdefault(name, []).append(seconds)
+                del self._durations[name][:-1000] # 直近1000件だけ集計に使う
+            logger.info(f"Job {job.id} ({job.kind}) {job.status} in {job.timings['total']:.3f}s")
+            await self._notify(job)
+
+    def _prune(self) -> None:
+        """保持期間を過ぎた完了済みのジョブを捨てる"""
+        now = time_module.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.status in FINISHED_STATUSES and now - job.finished_at > JOB_RESULT_TTL_SECONDS
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def stats(self) -> Dict[str, Any]:
+        def summary(values: List[float]) -> Dict[str, float]:
+            ordered = sorted(values)
+            return {
+                "count": len(ordered),
+                "avg": round(sum(ordered) / len(ordered), 4),
+                "p50": round(ordered[len(ordered) // 2], 4),
+                "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 4),
+                "max": round(ordered[-1], 4),
+            }
+        return {
+            "workers": self.workers,
+            "max_queued": self.max_queued,
+            "queued": self.queued_count(),
+            "running": sum(1 for job in self._jobs.values() if job.status == RUNNING),
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "timings": {name: summary(values) for name, values in self._durations.items() if values},
+        }
+
+
+queue = JobQueue()
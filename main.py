@@ -1,25 +1,54 @@
 from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Form, Request, Body, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
-from typing import List, Optional, Dict
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from typing import AsyncIterator, Callable, List, Optional, Dict, Tuple, Any, Union
 from datetime import datetime, date, time, timedelta
 import pathlib
+import asyncio
+import json
+import os
+import base64
+import binascii
+import hashlib
+import time as time_module
+from functools import partial
+from email.utils import formatdate, parsedate_to_datetime
+from contextlib import asynccontextmanager
 import logging # ロギングの追加
-from pydantic import BaseModel # Bodyのスキーマ定義用
+from pydantic import BaseModel, model_validator # Bodyのスキーマ定義用
 from schemas import EventCreate, EventResponse, EventDetailProcessed 
-import crud, models, schemas, gemini
-from database import SessionLocal, engine, get_db
+import crud, models, schemas, gemini, free_slots, availability, migrations, extraction_cache, image_processing, change_tracker, busy_cache, jobs, metrics, response_cache, interval_index, calendar_snapshot, shared_cache
+from event_store import EventStore
+from database import SessionLocal, AsyncSessionLocal, engine, async_engine, get_async_db
 
 # ロガーの設定
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-models.Base.metadata.create_all(bind=engine)
+# テーブル作成と未適用のマイグレーション (インデックス追加など) を起動時に実行
+# (serve.py で複数ワーカーを起動する場合は、親プロセスで1回だけ実行して MIGRATE_ON_STARTUP=0 でワーカーを起動する)
+if os.getenv("MIGRATE_ON_STARTUP", "1") == "1":
+    migrations.run_migrations(engine)
 
-app = FastAPI()
+# DBのクエリ時間を /metrics に記録する (非同期エンジンは内部の同期エンジンにイベントを登録する)
+metrics.instrument_engine(engine)
+if async_engine is not None:
+    metrics.instrument_engine(async_engine.sync_engine)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # 終了時にジョブのワーカーを止め、AIサービスとの共有HTTP接続プールとDBの非同期接続プールを閉じる
+    await jobs.queue.stop()
+    await gemini.close_client()
+    if async_engine is not None:
+        await async_engine.dispose()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -29,6 +58,74 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 他のワーカーの変更を取り込む間隔 (ミリ秒)。0 ならリクエストごとに取り込む
+SHARED_SYNC_INTERVAL_MS = int(os.getenv("SHARED_SYNC_INTERVAL_MS", "50"))
+# 予定のキャッシュを使わないパス (変更を取り込まずに処理する)
+_SYNC_SKIP_PREFIXES = ("/static/", "/metrics", "/jobs/")
+_next_shared_sync = 0.0
+
+if shared_cache.store is not None:
+    @app.middleware("http")
+    async def sync_shared_changes(request: Request, call_next):
+        # 他のワーカーがコミットした変更を取り込み、このワーカーのキャッシュを無効化してから処理する。
+        # 変更ログの読み込みは同期I/Oなのでスレッドプールで行い、取り込みは SHARED_SYNC_INTERVAL_MS に1回までにする
+        # (他のワーカーの変更が見えるまで最大でその分遅れる。このワーカー自身の変更はすぐに反映される)
+        global _next_shared_sync
+        path = request.url.path
+        now = time_module.monotonic()
+        if now >= _next_shared_sync and path != "/" and not path.startswith(_SYNC_SKIP_PREFIXES):
+            _next_shared_sync = now + SHARED_SYNC_INTERVAL_MS / 1000
+            await run_in_threadpool(change_tracker.sync)
+        return await call_next(request)
+
+@app.middleware("http")
+async def collect_metrics(request: Request, call_next):
+    """エンドポイントごとのレスポンス時間を記録する。?profile=1 (PROFILING_ENABLED=1 のとき) ならプロファイルを返す。"""
+    if metrics.wants_profile(request.query_params):
+        return await _profile_request(request, call_next)
+    t0 = time_module.perf_counter()
+    response = await call_next(request)
+    # ストリーミングのレスポンスは、本文を送り終わるまでではなくヘッダーを返すまでの時間になる
+    route = request.scope.get("route")
+    metrics.HTTP_REQUEST_SECONDS.observe(
+        time_module.perf_counter() - t0,
+        method=request.method,
+        route=getattr(route, "path", "unmatched"),
+        status=str(response.status_code),
+    )
+    return response
+
+async def _profile_request(request: Request, call_next) -> Response:
+    """リクエストを最後まで (本文の送信まで) 処理してプロファイルを取り、本来のレスポンスの代わりに結果を返す"""
+    if not metrics.profile_lock.acquire(blocking=False):
+        return JSONResponse(status_code=429, content={"detail": "別のリクエストをプロファイル中です。"})
+    try:
+        profiler = metrics.RequestProfiler()
+        profiler.start()
+        try:
+            response = await call_next(request)
+            body_size = 0
+            async for chunk in response.body_iterator:
+                body_size += len(chunk)
+        finally:
+            profiler.stop()
+    finally:
+        metrics.profile_lock.release()
+    return Response(
+        content=profiler.report(),
+        media_type="text/plain; charset=utf-8",
+        headers={"X-Profiled-Status": str(response.status_code), "X-Profiled-Body-Bytes": str(body_size)},
+    )
+
+def _collect_job_metrics() -> List[str]:
+    stats = jobs.queue.stats()
+    lines = ["# HELP beepass_jobs ジョブキューの状態ごとのジョブ数", "# TYPE beepass_jobs gauge"]
+    for status in ("queued", "running"):
+        lines.append(f'beepass_jobs{{status="{status}"}} {stats[status]}')
+    return lines
+
+metrics.registry.add_collector(_collect_job_metrics)
+
 BASE_DIR = pathlib.Path(__file__).resolve().parent
 app.mount("/static", StaticFiles(directory=BASE_DIR / "frontend"), name="static")
 templates = Jinja2Templates(directory=BASE_DIR / "frontend")
@@ -37,51 +134,172 @@ templates = Jinja2Templates(directory=BASE_DIR / "frontend")
 class DeleteEventPayload(BaseModel):
     event_date: date
     name: str
+
+class BatchDeleteItem(BaseModel):
+    """1日分 (event_date) または期間 (start_date〜end_date) のどちらかを指定する"""
+    name: str
+    event_date: Optional[date] = None
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+
+    @model_validator(mode="after")
+    def check_dates(self):
+        if self.event_date is not None:
+            if self.start_date is not None or self.end_date is not None:
+                raise ValueError("event_date と start_date/end_date は同時に指定できません。")
+            self.start_date = self.end_date = self.event_date
+        elif self.start_date is None or self.end_date is None:
+            raise ValueError("event_date または start_date と end_date を指定してください。")
+        if self.start_date > self.end_date:
+            raise ValueError("start_date は end_date 以前の日付を指定してください。")
+        return self
+
+class BatchDeletePayload(BaseModel):
+    items: List[BatchDeleteItem]
+
+# --- 一括登録リクエスト用のスキーマ ---
+class BulkImportImage(BaseModel):
+    mime_type: str
+    data: str # base64 でエンコードした画像
+
+class BulkImportEntry(BaseModel):
+    name: str
+    schedule_text: Optional[str] = None
+    images: List[BulkImportImage] = []
+
+class BulkImportPayload(BaseModel):
+    target_year: int
+    target_month: int
+    entries: List[BulkImportEntry]
+    async_mode: bool = False # True ならジョブとして登録し、すぐに 202 と job_id を返す
+    merge_overlaps: bool = False # True なら同じ人の時間の重なる予定を1件にまとめて登録する
 # --- ここまで ---
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
-@app.post("/schedule/", response_model=List[EventResponse])
-async def create_schedule_entry(
-    name: str = Form(...),
-    schedule_text: Optional[str] = Form(None),
-    images: Optional[List[UploadFile]] = File(None), 
-    target_year: int = Form(...),      # フロントエンドから受け取る年
-    target_month: int = Form(...),     # フロントエンドから受け取る月
-    db: Session = Depends(get_db)
-):
-    image_data_list: List[bytes] = []
-    image_mime_type_list: List[str] = []
-    if images: # images が None でなく、リストが空でもない場合
-        for image_file in images:
-            if image_file.content_type is None or not image_file.content_type.startswith("image/"):
-                # 1つでも不正なファイルがあればエラーとするか、スキップするかは要件による
-                # ここではエラーとする
-                raise HTTPException(status_code=400, detail=f"アップロードされたファイル '{image_file.filename}' は画像ではありません。")
-            image_data_list.append(await image_file.read())
-            image_mime_type_list.append(image_file.content_type)
-            logger.info(f"Image uploaded: {image_file.filename}, type: {image_file.content_type}, size: {len(image_data_list[-1])} bytes")
+def _build_events_and_rules(
+    response_name: str, processed_event_details: List[EventDetailProcessed], target_year: int, target_month: int
+) -> Tuple[List[EventCreate], List[schemas.RecurringRuleCreate]]:
+    """AIが抽出した予定を、日付指定のイベントと繰り返しルールに振り分ける"""
+    events_to_create: List[EventCreate] = []
+    rules_to_create: List[schemas.RecurringRuleCreate] = []
+    # 繰り返し予定はフロントから渡された target_year, target_month の月初から無期限で有効なルールとして登録する
+    target_month_start, target_month_end = crud.month_range(target_year, target_month)
 
+    for event_detail in processed_event_details:
+        if event_detail.event_date:
+            events_to_create.append(EventCreate(
+                name=response_name,
+                event_date=event_detail.event_date,
+                start_time=event_detail.start_time,
+                end_time=event_detail.end_time
+            ))
+        elif event_detail.day_of_week and isinstance(event_detail.day_of_week, str):
+            weekday = crud.DAY_OF_WEEK_MAP.get(event_detail.day_of_week.lower())
+            if weekday is None:
+                logger.warning(f"無効な曜日のためスキップ: name={response_name}, day_of_week={event_detail.day_of_week}")
+                continue
+            logger.info(f"Registering recurring rule for {response_name} on {event_detail.day_of_week} from {target_year}-{target_month}")
+            rules_to_create.append(schemas.RecurringRuleCreate(
+                name=response_name,
+                weekday=weekday,
+                start_time=event_detail.start_time,
+                end_time=event_detail.end_time,
+                valid_from=target_month_start
+            ))
+        else:
+            logger.warning(f"イベントに日付または有効な曜日情報がないためスキップ: name={response_name}, start={event_detail.start_time}")
+            continue
+    return events_to_create, rules_to_create
 
-    if not schedule_text and not image_data_list: # テキストも画像リストも空の場合
-         raise HTTPException(status_code=400, detail="予定テキストまたは画像を1つ以上入力/選択してください。")
+async def _preprocess_schedule_images(
+    image_data_list: List[bytes], image_mime_type_list: List[str], timings: Dict[str, float]
+) -> Tuple[List[bytes], List[str]]:
+    """縮小・再エンコードしてモデルへ送るデータ量を減らす (画像ごとに並列処理)"""
+    if not image_data_list:
+        return image_data_list, image_mime_type_list
+    t0 = time_module.perf_counter()
+    original_bytes = sum(len(data) for data in image_data_list)
+    image_data_list, image_mime_type_list = await image_processing.preprocess_images(image_data_list, image_mime_type_list)
+    processed_bytes = sum(len(data) for data in image_data_list)
+    timings["preprocess"] = time_module.perf_counter() - t0
+    logger.info(f"Preprocessed {len(image_data_list)} images: {original_bytes} -> {processed_bytes} bytes")
+    return image_data_list, image_mime_type_list
 
-    # target_yearとtarget_monthのバリデーション (任意だが推奨)
-    try:
-        # 有効な日付か確認 (例: 2024年2月30日は無効)
-        datetime(target_year, target_month, 1) # 月の初日でテスト
-    except ValueError:
-        raise HTTPException(status_code=400, detail="無効な対象年月が指定されました。")
+async def _insert_events_and_rules(
+    db: AsyncSession,
+    events_to_create: List[EventCreate],
+    rules_to_create: List[schemas.RecurringRuleCreate],
+    target_year: int,
+    target_month: int,
+    merge_overlaps: bool,
+) -> Tuple[List[Any], interval_index.InsertPlan]:
+    """
+    繰り返しルールと日付指定のイベントを登録し (コミットはしない)、登録した予定と重複・重なりの報告を返す。
+    登録した予定には、対象月に展開した繰り返し予定のうち今回新たに加わった回も含める。
+    既存のルールで既に登録されていた回は登録した予定に含めず、重複として数える。
+    """
+    target_month_start, target_month_end = crud.month_range(target_year, target_month)
+    rule_results = await crud.create_recurring_rules_async(db=db, rules=rules_to_create, commit=False)
+    added_occurrences, existing_occurrences = crud.split_rule_occurrences(rule_results, target_month_start, target_month_end)
+    # 既存の予定と完全に一致するものは登録せず、時間の重なりは報告する
+    created_db_events, plan = await crud.create_events_checked_async(db=db, events=events_to_create, merge=merge_overlaps)
+    created_db_events.extend(added_occurrences)
+    plan.duplicates.extend(
+        EventCreate(name=o.name, event_date=o.event_date, start_time=o.start_time, end_time=o.end_time)
+        for o in existing_occurrences
+    )
+    return created_db_events, plan
 
+async def _insert_extracted_events(
+    db: AsyncSession,
+    response_name: str,
+    processed_event_details: List[EventDetailProcessed],
+    target_year: int,
+    target_month: int,
+    merge_overlaps: bool,
+) -> Tuple[List[Any], interval_index.InsertPlan]:
+    """
+    抽出した予定を繰り返しルールと日付指定のイベントに振り分けて1トランザクションで登録し、
+    登録した予定 (対象月に展開した繰り返し予定を含む) と重複・重なりの報告を返す。
+    """
+    events_to_create, rules_to_create = _build_events_and_rules(response_name, processed_event_details, target_year, target_month)
+    created_db_events, plan = await _insert_events_and_rules(
+        db, events_to_create, rules_to_create, target_year, target_month, merge_overlaps
+    )
+    if plan.duplicates or plan.merged or plan.conflicts:
+        logger.info(
+            f"Insert check for {response_name}: {len(plan.duplicates)} duplicates skipped, "
+            f"{plan.merged} merged, {len(plan.conflicts)} conflicts"
+        )
+    return created_db_events, plan
 
+async def _process_schedule(
+    db: AsyncSession,
+    name: str,
+    schedule_text: Optional[str],
+    image_data_list: List[bytes],
+    image_mime_type_list: List[str],
+    target_year: int,
+    target_month: int,
+    timings: Dict[str, float],
+    merge_overlaps: bool = False,
+) -> Tuple[List[Any], interval_index.InsertPlan]:
+    """
+    AIによる予定の抽出 (抽出結果がキャッシュになければ画像を前処理してから)、DBへの登録を行い、
+    登録した予定と重複・重なりの報告 (InsertPlan) を返す。
+    timings には各段階の所要時間 (秒) を記録する。失敗した場合は HTTPException を送出する。
+    """
+    t0 = time_module.perf_counter()
     try:
         logger.info(f"Calling Gemini for user: {name} (target: {target_year}-{target_month})")
         gemini_processed_data = await gemini.process_schedule_input_with_gemini(
             name=name,
             schedule_text=schedule_text,
             image_data_list=image_data_list,         # 変更
-            image_mime_type_list=image_mime_type_list # 変更
+            image_mime_type_list=image_mime_type_list, # 変更
+            prepare_images=partial(_preprocess_schedule_images, timings=timings),
         )
     # ... (ValueError, RuntimeError, Exception handling as before)
     except ValueError as e:
@@ -93,6 +311,8 @@ async def create_schedule_entry(
     except Exception as e:
         logger.error(f"Unexpected error during Gemini processing: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"予期せぬエラーが発生しました: {str(e)}")
+    finally:
+        timings["llm"] = time_module.perf_counter() - t0 - timings.get("preprocess", 0.0)
 
 
     if not gemini_processed_data:
@@ -104,77 +324,548 @@ async def create_schedule_entry(
 
     if not processed_event_details:
         logger.info(f"Gemini found no processable events for user {response_name}.")
-        return []
+        return [], interval_index.InsertPlan()
 
-    created_db_events = []
-    # 繰り返し予定展開の基準日はフロントから渡された target_year, target_month を使用
-
-    for event_detail in processed_event_details:
-        if event_detail.event_date:
-            event_to_create = EventCreate(
-                name=response_name,
-                event_date=event_detail.event_date,
-                start_time=event_detail.start_time,
-                end_time=event_detail.end_time
-            )
-            db_event = crud.create_event(db=db, event=event_to_create)
-            created_db_events.append(db_event)
-        elif event_detail.day_of_week and isinstance(event_detail.day_of_week, str):
-            logger.info(f"Expanding recurring event for {response_name} on {event_detail.day_of_week} for month {target_year}-{target_month}")
-            expanded_events = crud.expand_recurring_event_for_month(
-                name=response_name,
-                day_of_week_str=event_detail.day_of_week,
-                start_time=event_detail.start_time,
-                end_time=event_detail.end_time,
-                target_year=target_year,      # ★ ここで受け取った年を使用
-                target_month=target_month     # ★ ここで受け取った月を使用
-            )
-            for single_event_data in expanded_events:
-                db_event = crud.create_event(db=db, event=single_event_data)
-                created_db_events.append(db_event)
-        else:
-            logger.warning(f"イベントに日付または有効な曜日情報がないためスキップ: name={response_name}, start={event_detail.start_time}")
-            continue
+    t0 = time_module.perf_counter()
+    created_db_events, plan = await _insert_extracted_events(
+        db, response_name, processed_event_details, target_year, target_month, merge_overlaps
+    )
+    timings["db"] = time_module.perf_counter() - t0
 
+    if not created_db_events and (plan.duplicates or plan.merged):
+        logger.info(f"All extracted events for user {response_name} were already registered.")
+        return [], plan
     if not created_db_events:
         logger.info(f"No events were ultimately created for user {response_name} after processing Gemini response.")
         raise HTTPException(status_code=400, detail="AIからの情報では登録できる有効な予定がありませんでした。")
 
     logger.info(f"Successfully created {len(created_db_events)} events for user {response_name}.")
-    return created_db_events
+    metrics.EVENTS_PER_REQUEST.observe(len(created_db_events), endpoint="schedule")
+    return created_db_events, plan
 
-# (他のエンドポイント /events/, /free_slots/ は変更なし)
-@app.get("/events/", response_model=List[schemas.EventResponse])
-def read_events_for_month(
-    year: int = datetime.now().year,
-    month: int = datetime.now().month,
-    db: Session = Depends(get_db)
+async def _read_schedule_uploads(
+    schedule_text: Optional[str], images: Optional[List[UploadFile]], target_year: int, target_month: int
+) -> Tuple[List[bytes], List[str]]:
+    """予定登録の入力を確認し、アップロードされた画像の (データ, MIMEタイプ) のリストを返す。不正な場合は HTTPException を送出する。"""
+    image_data_list: List[bytes] = []
+    image_mime_type_list: List[str] = []
+    if images: # images が None でなく、リストが空でもない場合
+        for image_file in images:
+            if image_file.content_type is None or not image_file.content_type.startswith("image/"):
+                # 1つでも不正なファイルがあればエラーとするか、スキップするかは要件による
+                # ここではエラーとする
+                raise HTTPException(status_code=400, detail=f"アップロードされたファイル '{image_file.filename}' は画像ではありません。")
+            try:
+                image_data_list.append(await image_processing.read_upload(image_file))
+            except image_processing.UploadTooLargeError as e:
+                raise HTTPException(status_code=413, detail=str(e))
+            image_mime_type_list.append(image_file.content_type)
+            logger.info(f"Image uploaded: {image_file.filename}, type: {image_file.content_type}, size: {len(image_data_list[-1])} bytes")
+
+    if not schedule_text and not image_data_list: # テキストも画像リストも空の場合
+         raise HTTPException(status_code=400, detail="予定テキストまたは画像を1つ以上入力/選択してください。")
+
+    # target_yearとtarget_monthのバリデーション (任意だが推奨)
+    try:
+        # 有効な日付か確認 (例: 2024年2月30日は無効)
+        datetime(target_year, target_month, 1) # 月の初日でテスト
+    except ValueError:
+        raise HTTPException(status_code=400, detail="無効な対象年月が指定されました。")
+    return image_data_list, image_mime_type_list
+
+@app.post("/schedule/", response_model=List[EventResponse])
+async def create_schedule_entry(
+    response: Response,
+    name: str = Form(...),
+    schedule_text: Optional[str] = Form(None),
+    images: Optional[List[UploadFile]] = File(None), 
+    target_year: int = Form(...),      # フロントエンドから受け取る年
+    target_month: int = Form(...),     # フロントエンドから受け取る月
+    async_mode: bool = Form(False),    # True ならジョブとして登録し、すぐに 202 と job_id を返す
+    merge_overlaps: bool = Form(False),  # True なら同じ人の時間の重なる予定を1件にまとめて登録する
+    db: AsyncSession = Depends(get_async_db)
 ):
-    events = crud.get_events_by_month(db, year=year, month=month)
-    return events
+    image_data_list, image_mime_type_list = await _read_schedule_uploads(schedule_text, images, target_year, target_month)
 
-@app.get("/free_slots/")
-def get_free_slots(
-    year: int = Query(default_factory=lambda: datetime.now().year, description="対象年"),
-    month: int = Query(default_factory=lambda: datetime.now().month, description="対象月"),
-    members: Optional[List[str]] = Query(None, description="空き時間を検索するメンバーのリスト (指定しない場合は全イベント参加者)"), # ★追加
+    if async_mode:
+        async def run_job(timings: Dict[str, float]) -> List[Dict[str, Any]]:
+            # リクエストのセッションはレスポンスを返した時点で閉じられるので、ジョブ用に開き直す
+            async with AsyncSessionLocal() as job_db:
+                created, _ = await _process_schedule(
+                    job_db, name, schedule_text, image_data_list, image_mime_type_list, target_year, target_month, timings,
+                    merge_overlaps,
+                )
+            return [EventResponse.model_validate(event).model_dump(mode="json") for event in created]
 
-    # day: Optional[int] = Query(None, description="対象日 (指定しない場合は月全体)"), # dayパラメータは一旦削除（月単位でのみ検索）
-    duration_minutes: int = Query(60, description="空き時間とみなす最小持続時間 (分)"),
-    work_start_time: str = Query("07:00", description="検索対象の業務開始時刻 (HH:MM)"),
-    work_end_time: str = Query("22:00", description="検索対象の業務終了時刻 (HH:MM)"),
-    db: Session = Depends(get_db)
-) -> Dict[str, List[Dict[str, str]]]: # 返り値の型アノテーションを明確化
+        try:
+            job = await jobs.queue.submit("schedule", run_job)
+        except jobs.QueueFullError as e:
+            raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+        logger.info(f"Queued schedule job {job.id} for user: {name}")
+        return JSONResponse(
+            status_code=202,
+            content={
+                "job_id": job.id,
+                "status": job.status,
+                "status_url": f"/jobs/{job.id}",
+                "events_url": f"/jobs/{job.id}/events",
+            },
+            headers={"Location": f"/jobs/{job.id}"},
+        )
+
+    created, plan = await _process_schedule(
+        db, name, schedule_text, image_data_list, image_mime_type_list, target_year, target_month, {}, merge_overlaps
+    )
+    # レスポンスの本文 (登録した予定のリスト) の形は変えず、重複・重なりの件数はヘッダーで返す
+    response.headers["X-Duplicates-Skipped"] = str(len(plan.duplicates))
+    response.headers["X-Merged"] = str(plan.merged)
+    response.headers["X-Conflicts"] = str(len(plan.conflicts))
+    return created
+
+# ストリーミング登録で、まとめて登録する予定の件数と、溜まった予定を登録するまでの最大の待ち時間 (秒)
+STREAM_INSERT_BATCH_SIZE = int(os.getenv("STREAM_INSERT_BATCH_SIZE", "20"))
+STREAM_INSERT_MAX_DELAY_SECONDS = float(os.getenv("STREAM_INSERT_MAX_DELAY_SECONDS", "0.5"))
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+# _iterate_until_idle が、期限までに次の要素が来なかったときに返す値
+_IDLE = object()
+
+async def _iterate_until_idle(source: AsyncIterator[Any], deadline: Callable[[], Optional[float]]) -> AsyncIterator[Any]:
     """
-    指定された月の中で、全メンバーが共通して空いている時間帯を検索する。
-    返り値は {"YYYY-MM-DD": [{"start": "HH:MM", "end": "HH:MM"}, ...], ...} の形式。
+    source の要素を順に返す。deadline() の時刻 (perf_counter) までに次の要素が来なければ _IDLE を返し、
+    呼び出し側が処理を済ませた後で、取り消さずに続けて次の要素を待つ。deadline() が None なら期限なしで待つ。
+    (asyncio.wait_for で待つと、期限切れのときに source の途中の読み取りごと取り消されてしまう)
+    """
+    next_item: Optional[asyncio.Future] = None
+    try:
+        while True:
+            if next_item is None:
+                next_item = asyncio.ensure_future(source.__anext__())
+            due = deadline()
+            timeout = None if due is None else max(0.0, due - time_module.perf_counter())
+            done, _ = await asyncio.wait((next_item,), timeout=timeout)
+            if not done:
+                yield _IDLE
+                continue
+            task, next_item = next_item, None
+            try:
+                item = task.result()
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        if next_item is not None:
+            next_item.cancel()
+            await asyncio.gather(next_item, return_exceptions=True)
+        await source.aclose()
+
+@app.post("/schedule/stream")
+async def create_schedule_entry_stream(
+    name: str = Form(...),
+    schedule_text: Optional[str] = Form(None),
+    images: Optional[List[UploadFile]] = File(None),
+    target_year: int = Form(...),
+    target_month: int = Form(...),
+    merge_overlaps: bool = Form(False),
+):
     """
+    /schedule/ のストリーミング版。モデルの応答を受け取りながら、閉じた予定から少しずつ (STREAM_INSERT_BATCH_SIZE 件か
+    STREAM_INSERT_MAX_DELAY_SECONDS 秒ごとに) 登録し、Server-Sent Events で返す。
+    - event: events ... 登録した予定と重複・重なりの報告 (InsertPlan.report()) (登録するたび)
+    - event: done   ... 合計の件数と各段階の所要時間
+    - event: error  ... {"status_code", "detail"}。それまでに登録した予定は残る
+    """
+    image_data_list, image_mime_type_list = await _read_schedule_uploads(schedule_text, images, target_year, target_month)
+
+    async def event_stream():
+        timings: Dict[str, float] = {"db": 0.0}
+        totals = {"created": 0, "duplicates": 0, "merged": 0, "conflicts": 0}
+        pending: List[EventDetailProcessed] = []
+        response_name: Optional[str] = None
+        t_start = time_module.perf_counter()
+
+        async def flush(db: AsyncSession) -> str:
+            batch = list(pending)
+            pending.clear()
+            t0 = time_module.perf_counter()
+            created, plan = await _insert_extracted_events(db, response_name, batch, target_year, target_month, merge_overlaps)
+            timings["db"] += time_module.perf_counter() - t0
+            timings.setdefault("first_event", time_module.perf_counter() - t_start)
+            report = plan.report()
+            totals["created"] += len(created)
+            totals["duplicates"] += report["duplicates"]
+            totals["merged"] += report["merged"]
+            totals["conflicts"] += len(report["conflicts"])
+            return _sse("events", {
+                "events": [EventResponse.model_validate(event).model_dump(mode="json") for event in created],
+                **report,
+            })
+
+        # リクエストのセッションはレスポンスを返し始める前に閉じられることがあるので、ストリーム用に開き直す
+        async with AsyncSessionLocal() as stream_db:
+            try:
+                last_flush = time_module.perf_counter()
+                extraction = gemini.stream_schedule_input_with_gemini(
+                    name=name, schedule_text=schedule_text, image_data_list=image_data_list, image_mime_type_list=image_mime_type_list,
+                    prepare_images=partial(_preprocess_schedule_images, timings=timings),
+                )
+                # 溜まった予定があれば、モデルの応答が止まっていても前回の登録から STREAM_INSERT_MAX_DELAY_SECONDS 秒で登録する
+                async for extracted in _iterate_until_idle(
+                    extraction, lambda: last_flush + STREAM_INSERT_MAX_DELAY_SECONDS if pending else None
+                ):
+                    if extracted is not _IDLE:
+                        response_name = response_name or extracted.get("name", name)
+                        pending.extend(extracted["events"])
+                    if pending and (
+                        extracted is _IDLE
+                        or len(pending) >= STREAM_INSERT_BATCH_SIZE
+                        or time_module.perf_counter() - last_flush >= STREAM_INSERT_MAX_DELAY_SECONDS
+                    ):
+                        yield await flush(stream_db)
+                        last_flush = time_module.perf_counter()
+                if pending:
+                    yield await flush(stream_db)
+            except HTTPException as e:
+                yield _sse("error", {"status_code": e.status_code, "detail": e.detail})
+                return
+            except ValueError as e:
+                logger.error(f"ValueError from Gemini streaming: {str(e)}")
+                yield _sse("error", {"status_code": 400, "detail": f"AI処理エラー: {str(e)}"})
+                return
+            except RuntimeError as e:
+                logger.error(f"RuntimeError from Gemini streaming: {str(e)}")
+                yield _sse("error", {"status_code": 503, "detail": f"AIサービスとの通信に失敗しました: {str(e)}"})
+                return
+            except Exception as e:
+                logger.error(f"Unexpected error during schedule streaming: {str(e)}", exc_info=True)
+                yield _sse("error", {"status_code": 500, "detail": f"予期せぬエラーが発生しました: {str(e)}"})
+                return
+
+        timings["total"] = time_module.perf_counter() - t_start
+        logger.info(f"Streamed {totals['created']} events for user {response_name or name} ({timings})")
+        metrics.EVENTS_PER_REQUEST.observe(totals["created"], endpoint="schedule_stream")
+        yield _sse("done", {**totals, "timings": timings})
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+# 一括登録で受け付ける人数の上限と、同時に実行する抽出の数
+BULK_IMPORT_MAX_ENTRIES = int(os.getenv("BULK_IMPORT_MAX_ENTRIES", "200"))
+BULK_IMPORT_CONCURRENCY = int(os.getenv("BULK_IMPORT_CONCURRENCY", "8"))
+
+async def _process_bulk_import(
+    db: AsyncSession,
+    entries: List[Tuple[str, Optional[str], List[bytes], List[str]]],
+    target_year: int,
+    target_month: int,
+    timings: Dict[str, float],
+    merge_overlaps: bool = False,
+) -> Dict[str, Any]:
+    """
+    複数メンバーの予定を抽出し、全員分を1トランザクションで登録する。
+    entries は (氏名, 予定テキスト, 画像データ, MIMEタイプ) のリスト。
+    テキストのみのメンバーは gemini.BATCH_TEXT_MEMBERS_PER_REQUEST 人ずつ1回のモデル呼び出しにまとめ、
+    画像のあるメンバーは1人ずつ抽出する。抽出は BULK_IMPORT_CONCURRENCY 件まで同時に実行する。
+    抽出に失敗したメンバーはエラーとして返し、他のメンバーの登録は続ける。
+    """
+    semaphore = asyncio.Semaphore(BULK_IMPORT_CONCURRENCY)
+    extracted: Dict[str, Dict[str, Any]] = {}
+    errors: Dict[str, str] = {}
+
+    async def extract_one(name: str, schedule_text: Optional[str], image_data_list: List[bytes], image_mime_type_list: List[str]):
+        async with semaphore:
+            try:
+                extracted[name] = await gemini.process_schedule_input_with_gemini(
+                    name=name,
+                    schedule_text=schedule_text,
+                    image_data_list=image_data_list,
+                    image_mime_type_list=image_mime_type_list,
+                    prepare_images=image_processing.preprocess_images,
+                )
+            except Exception as e:
+                logger.error(f"Extraction failed for {name} in bulk import: {e}")
+                errors[name] = str(e)
+
+    async def extract_pack(pack: List[Tuple[str, str]]):
+        results: Dict[str, Dict[str, Any]] = {}
+        if len(pack) > 1:
+            async with semaphore:
+                try:
+                    results = await gemini.process_schedule_texts_batch_with_gemini(pack)
+                except Exception as e:
+                    logger.warning(f"Batched extraction of {len(pack)} members failed, retrying one by one: {e}")
+        extracted.update(results)
+        # まとめた応答に含まれなかったメンバーは1人ずつ抽出し直す
+        await asyncio.gather(*(extract_one(name, text, [], []) for name, text in pack if name not in results))
+
+    text_only = [(name, text) for name, text, images, _ in entries if not images]
+    pack_size = max(1, gemini.BATCH_TEXT_MEMBERS_PER_REQUEST)
+    packs = [text_only[i:i + pack_size] for i in range(0, len(text_only), pack_size)]
+    t0 = time_module.perf_counter()
+    await asyncio.gather(
+        *(extract_pack(pack) for pack in packs),
+        *(extract_one(name, text, images, mimes) for name, text, images, mimes in entries if images),
+    )
+    timings["llm"] = time_module.perf_counter() - t0
+
+    events_to_create: List[EventCreate] = []
+    rules_to_create: List[schemas.RecurringRuleCreate] = []
+    member_results: List[Dict[str, Any]] = []
+    for name, *_ in entries:
+        if name in errors or name not in extracted or not extracted[name]:
+            member_results.append({"name": name, "events": 0, "rules": 0, "error": errors.get(name, "AIが予定情報を抽出できませんでした。")})
+            continue
+        data = extracted[name]
+        member_events, member_rules = _build_events_and_rules(data.get("name", name), data.get("events", []), target_year, target_month)
+        events_to_create.extend(member_events)
+        rules_to_create.extend(member_rules)
+        member_results.append({"name": name, "events": len(member_events), "rules": len(member_rules), "error": None})
+
+    # 全員分の繰り返しルールとイベントを1トランザクションで登録する
+    t0 = time_module.perf_counter()
+    created_db_events, plan = await _insert_events_and_rules(
+        db, events_to_create, rules_to_create, target_year, target_month, merge_overlaps
+    )
+    timings["db"] = time_module.perf_counter() - t0
+    metrics.EVENTS_PER_REQUEST.observe(len(created_db_events), endpoint="schedule_bulk")
+
     logger.info(
-        f"Searching for free slots in {year}-{month}, duration: {duration_minutes}min, "
-        f"work hours: {work_start_time}-{work_end_time}"
+        f"Bulk import: {len(entries)} members, {len(errors)} failed, {len(created_db_events)} events created, "
+        f"{len(plan.duplicates)} duplicates skipped, {len(plan.conflicts)} conflicts "
+        f"(llm {timings['llm']:.2f}s, db {timings['db']:.3f}s)"
     )
+    return {
+        "created": len(created_db_events),
+        "failed_members": len(errors),
+        "members": member_results,
+        **plan.report(),
+        "events": [EventResponse.model_validate(event).model_dump(mode="json") for event in created_db_events],
+    }
 
-    # 対象となる日付リストを生成 (指定された月全体)
+@app.post("/schedule/bulk/")
+async def create_schedule_entries_bulk(payload: BulkImportPayload, db: AsyncSession = Depends(get_async_db)):
+    """
+    複数メンバーの予定をまとめて登録する。テキストのみのメンバーは複数人を1回のモデル呼び出しにまとめる。
+    返り値は {"created": 件数, "failed_members": 件数, "members": [{"name", "events", "rules", "error"}],
+    "duplicates": 登録しなかった重複の件数, "merged": まとめた件数, "replaced": まとめて作り直した既存の予定の件数,
+    "conflicts": [{"name", "date", "start", "end", "conflicts_with": {"start", "end", "source"}}], "events": [...]}。
+    """
+    if not payload.entries:
+        raise HTTPException(status_code=400, detail="登録するメンバーを1人以上指定してください。")
+    if len(payload.entries) > BULK_IMPORT_MAX_ENTRIES:
+        raise HTTPException(status_code=400, detail=f"一度に登録できるのは{BULK_IMPORT_MAX_ENTRIES}人までです。")
+    try:
+        datetime(payload.target_year, payload.target_month, 1)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="無効な対象年月が指定されました。")
+
+    entries: List[Tuple[str, Optional[str], List[bytes], List[str]]] = []
+    seen_names = set()
+    for entry in payload.entries:
+        if entry.name in seen_names:
+            raise HTTPException(status_code=400, detail=f"氏名 '{entry.name}' が重複しています。")
+        seen_names.add(entry.name)
+        if not entry.schedule_text and not entry.images:
+            raise HTTPException(status_code=400, detail=f"{entry.name} さんの予定テキストまたは画像がありません。")
+        image_data_list: List[bytes] = []
+        image_mime_type_list: List[str] = []
+        for image in entry.images:
+            if not image.mime_type.startswith("image/"):
+                raise HTTPException(status_code=400, detail=f"{entry.name} さんのファイルは画像ではありません: {image.mime_type}")
+            try:
+                data = base64.b64decode(image.data, validate=True)
+            except (binascii.Error, ValueError):
+                raise HTTPException(status_code=400, detail=f"{entry.name} さんの画像データが base64 ではありません。")
+            if len(data) > image_processing.UPLOAD_MAX_BYTES:
+                raise HTTPException(status_code=413, detail=f"{entry.name} さんの画像が大きすぎます (上限 {image_processing.UPLOAD_MAX_BYTES} バイト)。")
+            image_data_list.append(data)
+            image_mime_type_list.append(image.mime_type)
+        entries.append((entry.name, entry.schedule_text, image_data_list, image_mime_type_list))
+
+    if payload.async_mode:
+        async def run_job(timings: Dict[str, float]) -> Dict[str, Any]:
+            async with AsyncSessionLocal() as job_db:
+                return await _process_bulk_import(
+                    job_db, entries, payload.target_year, payload.target_month, timings, payload.merge_overlaps)
+
+        try:
+            job = await jobs.queue.submit("bulk_import", run_job)
+        except jobs.QueueFullError as e:
+            raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+        return JSONResponse(
+            status_code=202,
+            content={"job_id": job.id, "status": job.status, "status_url": f"/jobs/{job.id}", "events_url": f"/jobs/{job.id}/events"},
+            headers={"Location": f"/jobs/{job.id}"},
+        )
+
+    return await _process_bulk_import(db, entries, payload.target_year, payload.target_month, {}, payload.merge_overlaps)
+
+@app.get("/jobs/stats")
+def get_job_stats() -> Dict[str, Any]:
+    """ジョブキューの状態と、処理段階ごとの所要時間の集計を返す"""
+    return jobs.queue.stats()
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str) -> Dict[str, Any]:
+    """ジョブの状態を返す。完了していれば result (登録した予定) または error を含む。"""
+    job = jobs.queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="ジョブが見つかりません。")
+    return job.to_dict()
+
+JOB_SSE_HEARTBEAT_SECONDS = 15
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, request: Request):
+    """ジョブの状態が変わるたびに Server-Sent Events で通知し、完了したら接続を閉じる"""
+    job = jobs.queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="ジョブが見つかりません。")
+
+    async def event_stream():
+        seen_version = -1
+        while True:
+            if job.version != seen_version:
+                seen_version = job.version
+                yield f"event: {job.status}\ndata: {json.dumps(job.to_dict(), ensure_ascii=False)}\n\n"
+                if job.status in jobs.FINISHED_STATUSES:
+                    return
+            elif await request.is_disconnected():
+                return
+            if not await jobs.queue.wait_for_change(job, seen_version, JOB_SSE_HEARTBEAT_SECONDS):
+                yield ": keep-alive\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+def _versioned_etag(version: str, cache_key: Tuple) -> str:
+    """月のバージョンとリクエストのパラメータから ETag を作る"""
+    return '"' + hashlib.sha1(f"{version}|{cache_key!r}".encode()).hexdigest() + '"'
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return False
+    return etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+
+def _event_dicts(events) -> List[Dict[str, Any]]:
+    """
+    DBから読んだ予定 (models.Event / EventOccurrence) を EventResponse と同じ形の辞書にする。
+    DBの値は検証済みなので、EventResponse による検証は省く。date / time はシリアライズ時に ISO 形式になる。
+    """
+    return [
+        {"name": event.name, "event_date": event.event_date, "start_time": event.start_time, "end_time": event.end_time, "id": event.id}
+        for event in events
+    ]
+
+RESPONSE_FORMAT_PATTERN = "^(json|columnar)$"
+
+@app.get("/events/", responses={200: {
+    "model": Union[List[schemas.EventResponse], schemas.ColumnarEventsResponse],
+    "description": "format=json なら予定の配列、format=columnar なら列ごとの配列",
+}})
+async def read_events_for_month(
+    request: Request,
+    year: int = datetime.now().year,
+    month: int = datetime.now().month,
+    format: str = Query("json", pattern=RESPONSE_FORMAT_PATTERN, description="json (予定の配列) または columnar (列ごとの配列)"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    指定された月の予定を返す。シリアライズ済みの本文を月のバージョンごとにキャッシュし、
+    変更がなければDBに触れずに返す (If-None-Match が一致すれば 304)。
+    """
+    try:
+        crud.month_range(year, month)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"無効な年月です: {e}")
+    # バージョンはDBを読む前に取得する (キャッシュする本文がこのバージョンより古くならないように)
+    version = change_tracker.month_version(year, month)
+    cache_key = ("events", year, month, format)
+    headers = {"ETag": _versioned_etag(version, cache_key), "Cache-Control": "no-cache"}
+    if _etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    body = await response_cache.cache.get_async(cache_key, version)
+    if body is None:
+        events = await crud.get_events_by_month_async(db, year=year, month=month)
+        # 件数はDBから読み込んだとき (キャッシュにない場合) だけ記録する
+        metrics.EVENTS_PER_REQUEST.observe(len(events), endpoint="events")
+        payload = response_cache.columnar_events(events, year, month) if format == "columnar" else _event_dicts(events)
+        body = response_cache.dumps(payload)
+        await response_cache.cache.set_async(cache_key, version, body)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+EVENTS_RANGE_MAX_DAYS = 366 * 5
+
+def _event_row_to_json(row: tuple) -> str:
+    event_id, name, event_date, start_time, end_time = row
+    return json.dumps({
+        "id": event_id,
+        "name": name,
+        "event_date": event_date.isoformat(),
+        "start_time": start_time.isoformat(),
+        "end_time": end_time.isoformat(),
+    }, ensure_ascii=False)
+
+def _stream_events_in_range(start_date: date, end_date: date, as_ndjson: bool):
+    """サーバー側カーソルから読み出しながら、1件ずつ NDJSON または JSON 配列の断片として返す"""
+    db = SessionLocal()
+    try:
+        rows = crud.iter_events_in_range(db, start_date, end_date)
+        if as_ndjson:
+            for row in rows:
+                yield _event_row_to_json(row) + "\n"
+        else:
+            yield "["
+            for i, row in enumerate(rows):
+                yield ("," if i else "") + _event_row_to_json(row)
+            yield "]"
+    finally:
+        db.close()
+
+@app.get("/events/range")
+def read_events_in_range(
+    request: Request,
+    start_date: date = Query(..., description="開始日 (YYYY-MM-DD)"),
+    end_date: date = Query(..., description="終了日 (YYYY-MM-DD、この日を含む)"),
+    format: str = Query("ndjson", pattern="^(ndjson|json)$", description="ndjson (1行1件) または json (配列)"),
+):
+    """
+    複数月にまたがる期間の予定をストリーミングで返す。
+    月ごとの変更カウンタから ETag / Last-Modified を付け、変更がなければDBに触れずに 304 を返す。
+    """
+    if start_date > end_date:
+        raise HTTPException(status_code=400, detail="開始日が終了日より後になっています。")
+    if (end_date - start_date).days > EVENTS_RANGE_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"期間は{EVENTS_RANGE_MAX_DAYS}日以内で指定してください。")
+
+    etag = change_tracker.range_etag(start_date, end_date, variant=format)
+    last_modified = change_tracker.range_last_modified(start_date, end_date)
+    # Last-Modified は秒単位なので、最後の変更から1秒経つまでは同じ秒の中でまた変更されうる。
+    # その間は Last-Modified を付けず、If-Modified-Since でも 304 を返さない (ETag だけで判定する)
+    last_modified_settled = time_module.time() - last_modified > 1
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if last_modified_settled:
+        headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+
+    # 両方あれば If-None-Match を優先し、If-Modified-Since は無視する (RFC 9110 13.2.2)
+    if request.headers.get("if-none-match") is not None:
+        if _etag_matches(request, etag):
+            return Response(status_code=304, headers=headers)
+    elif request.headers.get("if-modified-since") and last_modified_settled:
+        try:
+            if_modified_since = parsedate_to_datetime(request.headers["if-modified-since"]).timestamp()
+        except (TypeError, ValueError):
+            if_modified_since = None
+        if if_modified_since is not None and int(last_modified) <= if_modified_since:
+            return Response(status_code=304, headers=headers)
+
+    media_type = "application/x-ndjson" if format == "ndjson" else "application/json"
+    return StreamingResponse(_stream_events_in_range(start_date, end_date, format == "ndjson"), media_type=media_type, headers=headers)
+
+def _month_target_dates(year: int, month: int) -> List[date]:
+    """指定された月の全日付のリストを返す。無効な年月の場合は400を返す。"""
     target_dates: List[date] = []
     try:
         # 月の初日
@@ -184,15 +875,36 @@ def get_free_slots(
             target_dates.append(current_d)
             current_d += timedelta(days=1)
     except ValueError: # 無効な年月が指定された場合
-        logger.error(f"Invalid year/month provided for free_slots: {year}-{month}")
+        logger.error(f"Invalid year/month provided: {year}-{month}")
         raise HTTPException(status_code=400, detail=f"無効な年月です: {year}-{month}")
+    return target_dates
 
-    if not target_dates: # 通常は到達しないはず
-        return {}
+def _parse_work_hours(work_start_time: str, work_end_time: str) -> Tuple[time, time]:
+    """HH:MM 形式の業務開始・終了時刻をtimeオブジェクトに変換する。不正な場合は400を返す。"""
+    try:
+        work_start_t = datetime.strptime(work_start_time, "%H:%M").time()
+        work_end_t = datetime.strptime(work_end_time, "%H:%M").time()
+        if work_start_t >= work_end_t:
+            raise ValueError("業務開始時刻が終了時刻以降です。")
+    except ValueError as e:
+        logger.error(f"Invalid work_start_time or work_end_time: {e}")
+        raise HTTPException(status_code=400, detail=f"無効な業務時間形式です: {e}")
+    return work_start_t, work_end_t
 
-    # 指定された月の全イベントを取得
-    all_events_this_month = crud.get_events_by_month(db, year=year, month=month)
-    if not all_events_this_month:
+async def _search_free_slots(
+    db: AsyncSession,
+    year: int,
+    month: int,
+    members: Optional[List[str]],
+    target_dates: List[date],
+    duration_minutes: int,
+    work_start_t: time,
+    work_end_t: time,
+) -> Dict[date, List[free_slots.Interval]]:
+    """/free_slots/ の本体。全メンバーが共通して空いているスロットを {日付: [(開始分, 終了分), ...]} で返す。"""
+    # 指定された月のメンバーごとの予定区間を取得 (キャッシュ済みならDBには触れない)
+    month_busy = await busy_cache.cache.get_month_async(db, year=year, month=month)
+    if not month_busy.intervals:
         logger.info(f"No events found in {year}-{month}. All work hours are considered free.")
         # イベントがない場合、全業務時間が空きスロットとなる
         # ただし、メンバーが存在しないと「全員が空いている」とは言えないので、
@@ -212,10 +924,10 @@ def get_free_slots(
              logger.info("Empty member list provided. No common free slots possible.")
              return {}
     else: # メンバーリストが指定されなかった場合 (従来の動作)
-        if not all_events_this_month:
+        if not month_busy.intervals:
             logger.info(f"No events found in {year}-{month}. Cannot determine common free slots without specified members.")
             return {}
-        target_members = list(set(event.name for event in all_events_this_month))
+        target_members = month_busy.members
         if not target_members:
             logger.info(f"No members with events in {year}-{month} (and no specific members requested).")
             return {}
@@ -223,65 +935,201 @@ def get_free_slots(
 
     logger.info(f"Found members for {year}-{month}: {members}")
 
+    try:
+        with metrics.FREE_SLOTS_SECONDS.time(endpoint="free_slots"):
+            # 月全体の配列があれば対象メンバーで絞って使い、なければ (読み込み後に一部が変わった月)
+            # 対象メンバーのキャッシュ済みの区間を配列に詰めて、分単位のビットマップで一括して計算する
+            if month_busy.store is not None:
+                store, store_members = month_busy.store, target_members
+            else:
+                store, store_members = EventStore.from_intervals(month_busy.intervals, target_members), None
+            slots_by_date = store.free_slot_minutes(
+                members=store_members,
+                target_dates=target_dates,
+                duration_minutes=duration_minutes,
+                work_start=work_start_t,
+                work_end=work_end_t,
+            )
+    except ValueError as e:
+        logger.error(f"Invalid duration_minutes: {duration_minutes}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+    logger.info(f"Found free slots on {len(slots_by_date)} days in {year}-{month}")
+    logger.debug(f"Found free slots by date: {slots_by_date}")
+    return slots_by_date
+
+@app.get("/free_slots/")
+async def get_free_slots(
+    request: Request,
+    year: int = Query(default_factory=lambda: datetime.now().year, description="対象年"),
+    month: int = Query(default_factory=lambda: datetime.now().month, description="対象月"),
+    members: Optional[List[str]] = Query(None, description="空き時間を検索するメンバーのリスト (指定しない場合は全イベント参加者)"), # ★追加
+
+    # day: Optional[int] = Query(None, description="対象日 (指定しない場合は月全体)"), # dayパラメータは一旦削除（月単位でのみ検索）
+    duration_minutes: int = Query(60, description="空き時間とみなす最小持続時間 (分)"),
+    work_start_time: str = Query("07:00", description="検索対象の業務開始時刻 (HH:MM)"),
+    work_end_time: str = Query("22:00", description="検索対象の業務終了時刻 (HH:MM)"),
+    format: str = Query("json", pattern=RESPONSE_FORMAT_PATTERN, description="json (日付ごとのスロット) または columnar (列ごとの配列)"),
+    db: AsyncSession = Depends(get_async_db)
+) -> Dict[str, List[Dict[str, str]]]: # 返り値の型アノテーションを明確化
+    """
+    指定された月の中で、全メンバーが共通して空いている時間帯を検索する。
+    返り値は {"YYYY-MM-DD": [{"start": "HH:MM", "end": "HH:MM"}, ...], ...} の形式。
+    シリアライズ済みの本文を (年, 月, パラメータ) ごとに月のバージョン付きでキャッシュする。
+    """
+    logger.info(
+        f"Searching for free slots in {year}-{month}, duration: {duration_minutes}min, "
+        f"work hours: {work_start_time}-{work_end_time}"
+    )
+
+    # 対象となる日付リストを生成 (指定された月全体)
+    target_dates = _month_target_dates(year, month)
     # 業務開始時刻と終了時刻をtimeオブジェクトに変換
+    work_start_t, work_end_t = _parse_work_hours(work_start_time, work_end_time)
+
+    # バージョンはDBを読む前に取得する (キャッシュする本文がこのバージョンより古くならないように)
+    version = change_tracker.month_version(year, month)
+    member_key = tuple(sorted(set(members))) if members else None
+    cache_key = ("free_slots", year, month, member_key, duration_minutes, work_start_t, work_end_t, format)
+    headers = {"ETag": _versioned_etag(version, cache_key), "Cache-Control": "no-cache"}
+    if _etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    body = await response_cache.cache.get_async(cache_key, version)
+    if body is None:
+        slots_by_date = await _search_free_slots(
+            db, year, month, members, target_dates, duration_minutes, work_start_t, work_end_t
+        )
+        if format == "columnar":
+            payload = response_cache.columnar_free_slots(slots_by_date, year, month)
+        else:
+            payload = free_slots.format_free_slots(slots_by_date)
+        body = response_cache.dumps(payload)
+        await response_cache.cache.set_async(cache_key, version, body)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@app.get("/calendar/{year}/{month}")
+async def read_calendar_month(request: Request, year: int, month: int, db: AsyncSession = Depends(get_async_db)):
+    """
+    カレンダー画面の1か月分を1回のリクエストで返す。返り値は
+    {"year", "month", "events": (/events/?format=columnar と同じ形), "member_counts": [1日から順に予定のあるメンバー数],
+    "free_slots": (/free_slots/?format=columnar と同じ形, 全員・既定の条件), "free_slot_params": {...}}。
+    変更のない月はスナップショットの本文をそのまま返す (If-None-Match が一致すれば 304)。
+    """
     try:
-        work_start_t = datetime.strptime(work_start_time, "%H:%M").time()
-        work_end_t = datetime.strptime(work_end_time, "%H:%M").time()
-        if work_start_t >= work_end_t:
-            raise ValueError("業務開始時刻が終了時刻以降です。")
+        crud.month_range(year, month)
     except ValueError as e:
-        logger.error(f"Invalid work_start_time or work_end_time: {e}")
-        raise HTTPException(status_code=400, detail=f"無効な業務時間形式です: {e}")
+        raise HTTPException(status_code=400, detail=f"無効な年月です: {e}")
+    etag, body = await calendar_snapshot.snapshots.get_async(db, year, month)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+NEXT_SLOTS_MAX_COUNT = 500
+NEXT_SLOTS_MAX_DAYS = 366 * 5
+
+@app.get("/free_slots/next")
+async def get_next_free_slots(
+    start_date: date = Query(default_factory=date.today, description="この日以降を検索する (YYYY-MM-DD)"),
+    count: int = Query(5, ge=1, le=NEXT_SLOTS_MAX_COUNT, description="返すスロットの件数"),
+    members: Optional[List[str]] = Query(None, description="対象メンバーのリスト (指定しない場合は start_date の月に予定がある全員)"),
+    duration_minutes: int = Query(60, ge=1, description="スロットの長さ (分)"),
+    work_start_time: str = Query("07:00", description="検索対象の業務開始時刻 (HH:MM)"),
+    work_end_time: str = Query("22:00", description="検索対象の業務終了時刻 (HH:MM)"),
+    max_days: int = Query(366, ge=1, le=NEXT_SLOTS_MAX_DAYS, description="検索する最大の日数"),
+    db: AsyncSession = Depends(get_async_db)
+) -> Dict[str, Any]:
+    """
+    start_date から1日ずつ先へ進み、全メンバーが共通して空いているスロットを count 件見つけた時点で返す。
+    月や年をまたいでもよく、月のデータは検索がその月に入ったときに初めて読み込む。
+    返り値は {"members": [...], "slots": [{"date", "start", "end"}], "searched_until": "YYYY-MM-DD", "complete": bool}。
+    complete が false の場合は max_days 日以内に count 件見つからなかった。
+    """
+    work_start_t, work_end_t = _parse_work_hours(work_start_time, work_end_time)
+    if members:
+        target_members = list(dict.fromkeys(members))
+    else:
+        target_members = (await busy_cache.cache.get_month_async(db, start_date.year, start_date.month)).members
+    if not target_members:
+        logger.info(f"No members for next free slot search from {start_date}.")
+        return {"members": [], "slots": [], "searched_until": None, "complete": False}
+
+    work_start_min = free_slots.time_to_start_minute(work_start_t)
+    work_end_min = free_slots.time_to_end_minute(work_end_t)
+    end_date = start_date + timedelta(days=max_days - 1)
+    found: List[Dict[str, str]] = []
+    searched_until = start_date
+    async for day, busy in busy_cache.cache.iter_common_busy_days_async(db, target_members, start_date, end_date):
+        searched_until = day
+        for start, end in free_slots.free_slots_for_day(busy, work_start_min, work_end_min, duration_minutes):
+            found.append({"date": day.isoformat(), "start": free_slots.minute_to_hhmm(start), "end": free_slots.minute_to_hhmm(end)})
+            if len(found) == count:
+                break
+        if len(found) == count:
+            break
+    logger.info(f"Found {len(found)} next free slots from {start_date} (searched until {searched_until})")
+    return {
+        "members": target_members,
+        "slots": found,
+        "searched_until": searched_until.isoformat(),
+        "complete": len(found) == count,
+    }
+
+@app.get("/availability/")
+async def get_availability(
+    year: int = Query(default_factory=lambda: datetime.now().year, description="対象年"),
+    month: int = Query(default_factory=lambda: datetime.now().month, description="対象月"),
+    members: Optional[List[str]] = Query(None, description="対象メンバーのリスト (指定しない場合は全イベント参加者)"),
+    duration_minutes: int = Query(60, description="スロットの長さ (分)"),
+    min_attendees: Optional[int] = Query(None, description="最低参加人数 (指定しない場合は全員)"),
+    work_start_time: str = Query("07:00", description="検索対象の業務開始時刻 (HH:MM)"),
+    work_end_time: str = Query("22:00", description="検索対象の業務終了時刻 (HH:MM)"),
+    limit: int = Query(10, ge=0, description="参加可能人数順に返すスロットの件数"),
+    db: AsyncSession = Depends(get_async_db)
+) -> Dict[str, Any]:
+    """
+    メンバー × 日 × 分 の空き状況行列から、min_attendees 人以上が参加できるスロットを検索する。
+    返り値は {"members": [...], "slots": {"YYYY-MM-DD": [{"start", "end", "attendees"}]},
+    "best": [{"date", "start", "end", "attendees", "absent"}]} の形式。
+    """
+    target_dates = _month_target_dates(year, month)
+    work_start_t, work_end_t = _parse_work_hours(work_start_time, work_end_time)
+
+    # ORMオブジェクトを作らずに列だけを読み、整数の配列に詰め替える
+    store = EventStore.from_rows(await crud.get_event_rows_in_range_async(db, *crud.month_range(year, month)))
+    if members:
+        target_members = list(dict.fromkeys(members))
+    else:
+        target_members = sorted(store.members)
+    if not target_members:
+        logger.info(f"No members for availability search in {year}-{month}.")
+        return {"members": [], "slots": {}, "best": []}
 
-    free_slots_by_date: Dict[str, List[Dict[str, str]]] = {}
-    slot_duration = timedelta(minutes=duration_minutes)
-
-    for target_date_obj in target_dates:
-        daily_free_slots_for_all_members: List[Dict[str, str]] = []
-
-        # その日のタイムスロットを生成 (例: 09:00, 09:30, 10:00, ...)
-        current_slot_start_dt = datetime.combine(target_date_obj, work_start_t)
-        work_end_dt_for_day = datetime.combine(target_date_obj, work_end_t)
-
-        while current_slot_start_dt + slot_duration <= work_end_dt_for_day:
-            current_slot_end_dt = current_slot_start_dt + slot_duration
-            slot_is_free_for_all = True
-
-            for member_name in target_members: # ★ 決定されたメンバーリストを使用
-                member_is_busy_in_slot = False
-                for event in all_events_this_month: # この月の全イベントから探す
-                    if event.name == member_name and event.event_date == target_date_obj:
-                        event_start_dt = datetime.combine(event.event_date, event.start_time)
-                        event_end_dt = datetime.combine(event.event_date, event.end_time)
-                        if max(current_slot_start_dt, event_start_dt) < min(current_slot_end_dt, event_end_dt):
-                            member_is_busy_in_slot = True
-                            break
-                if member_is_busy_in_slot:
-                    slot_is_free_for_all = False
-                    break
-            
-            if slot_is_free_for_all:
-                daily_free_slots_for_all_members.append({
-                    "start": current_slot_start_dt.time().strftime("%H:%M"),
-                    "end": current_slot_end_dt.time().strftime("%H:%M")
-                })
-            current_slot_start_dt = current_slot_end_dt
-
-        if daily_free_slots_for_all_members:
-            free_slots_by_date[target_date_obj.isoformat()] = daily_free_slots_for_all_members
-
-    logger.info(f"Found free_slots_by_date: {free_slots_by_date}")
-    return free_slots_by_date
+    required = len(target_members) if min_attendees is None else min_attendees
+    if not 1 <= required <= len(target_members):
+        raise HTTPException(status_code=400, detail=f"最低参加人数は1から{len(target_members)}の範囲で指定してください。")
+
+    def search() -> Dict[str, Any]:
+        with metrics.FREE_SLOTS_SECONDS.time(endpoint="availability"):
+            matrix = availability.AvailabilityMatrix.from_store(store, target_members, target_dates)
+            return matrix.search(duration_minutes, work_start_t, work_end_t, required, limit)
+
+    try:
+        # 行列の計算はCPUを使うので、イベントループを止めないようスレッドプールで実行する
+        return await run_in_threadpool(search)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 # --- 新しい削除エンドポイント ---
 @app.delete("/events/delete_by_date_name/")
 async def delete_events_by_date_and_name(
     payload: DeleteEventPayload, # リクエストボディとして受け取る
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
-        deleted_count = crud.delete_events_by_date_and_name(
+        deleted_count = await crud.delete_events_by_date_and_name_async(
             db=db,
             event_date=payload.event_date,
             name=payload.name
@@ -293,13 +1141,38 @@ async def delete_events_by_date_and_name(
     except Exception as e:
         logger.error(f"Error deleting events for {payload.name} on {payload.event_date}: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"予定の削除中にエラーが発生しました: {str(e)}")
+
+@app.delete("/events/batch_delete/")
+async def delete_events_batch(payload: BatchDeletePayload, db: AsyncSession = Depends(get_async_db)):
+    """複数の (氏名, 日付 or 期間) の予定を1トランザクションでまとめて削除する。途中で失敗した場合は何も削除しない。"""
+    items = [(item.name, item.start_date, item.end_date) for item in payload.items]
+    try:
+        deleted_count = await crud.delete_events_batch_async(db, items)
+    except Exception as e:
+        logger.error(f"Error deleting events in batch ({len(items)} items): {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"予定の削除中にエラーが発生しました: {str(e)}")
+    return {"deleted": deleted_count, "message": f"{len(items)} 件の指定から予定を {deleted_count} 件削除しました。"}
 # --- ここまで ---
 
 @app.get("/all_delete")
-def delete_all_events(db: Session = Depends(get_db)):
+async def delete_all_events(db: AsyncSession = Depends(get_async_db)):
     """全てのイベントを削除するエンドポイント"""
-    all_events = crud.get_all_events(db)
-    for event in all_events:
-        db.delete(event)
-    db.commit()
-    return {"message": "All events deleted."}
\ No newline at end of file
+    deleted_count = await crud.delete_all_events_async(db)
+    logger.info(f"Deleted all events ({deleted_count} rows)")
+    return {"message": "All events deleted."}
+
+@app.get("/metrics")
+def get_metrics() -> Response:
+    """Prometheus 形式のメトリクス"""
+    return Response(content=metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/cache/stats")
+def get_cache_stats() -> Dict[str, Any]:
+    """キャッシュのサイズとヒット率を返す"""
+    return {
+        "extraction": extraction_cache.cache.stats(),
+        "busy_intervals": busy_cache.cache.stats(),
+        "responses": response_cache.cache.stats(),
+        "calendar": calendar_snapshot.snapshots.stats(),
+        "shared": shared_cache.store.stats() if shared_cache.store is not None else None,
+    }
@@ -0,0 +1,264 @@
+"""
+Prometheus 形式のメトリクス (/metrics) と、リクエスト単位のプロファイル。
+
+外部ライブラリを使わずに、カウンターとヒストグラムをプロセス内で集計し、
+テキスト形式 (text/plain; version=0.0.4) で出力する。値の更新はスレッドプールからも行われるのでロックで守る。
+- LLM の呼び出し時間 (ストリーミングでは最初の断片までの時間も) と使用トークン数
+- DB のクエリ時間 (SQLAlchemy のカーソル実行イベントで計測)
+- 空き時間の計算時間
+- 1リクエストで登録・返却した予定の件数
+- エンドポイントごとのレスポンス時間
+
+PROFILING_ENABLED=1 のときは、任意のリクエストに ?profile=1 を付けると、レスポンスの代わりに
+そのリクエストのプロファイル (pyinstrument があればその出力、なければ cProfile の集計) を返す。
+"""
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time as time_module
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+try:
+    import pyinstrument
+except ImportError: # pyinstrument は任意の依存
+    pyinstrument = None
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+PROFILE_SORT = os.getenv("PROFILE_SORT", "cumulative")   # cProfile の集計の並び順
+PROFILE_LIMIT = int(os.getenv("PROFILE_LIMIT", "40"))   # cProfile の集計に出す関数の数
+# プロファイラは同時に1つしか動かせないので、プロファイル中のリクエストは1件に限る
+profile_lock = threading.Lock()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ヒストグラムのバケット (秒・件数)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LLM_LATENCY_BUCKETS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0, 120.0)
+DB_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+TOKEN_BUCKETS = (64, 256, 1024, 2048, 4096, 8192, 16384, 32768)
+COUNT_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(pairs: Iterable[Tuple[str, str]]) -> str:
+    body = ",".join(f'{key}="{_escape(str(value))}"' for key, value in pairs)
+    return "{" + body + "}" if body else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(zip(self.labelnames, key))} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float], labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        self.labelnames = tuple(labelnames)
+        # ラベルの組ごとに [バケットごとの件数..., 合計, 件数]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def time(self, **labels: str) -> "_Timer":
+        """with 文で囲んだ区間の所要時間 (秒) を記録する"""
+        return _Timer(self, labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        for key, series in items:
+            label_pairs = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(label_pairs + [('le', _format_value(bound))])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(label_pairs + [('le', '+Inf')])} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(label_pairs)} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(label_pairs)} {series[-1]}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.t0 = time_module.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time_module.perf_counter() - self.t0, **self.labels)
+        return False
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[Any] = []
+        self._collectors: List[Callable[[], List[str]]] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], List[str]]) -> None:
+        """出力のたびに呼ばれ、その時点の値 (ゲージなど) を Prometheus 形式の行で返す関数を登録する"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HTTP_REQUEST_SECONDS = registry.register(Histogram(
+    "beepass_http_request_duration_seconds", "エンドポイントごとのレスポンス時間 (秒)",
+    LATENCY_BUCKETS, ("method", "route", "status"),
+))
+LLM_REQUEST_SECONDS = registry.register(Histogram(
+    "beepass_llm_request_duration_seconds", "LLM の呼び出し時間 (秒)",
+    LLM_LATENCY_BUCKETS, ("call", "outcome"),
+))
+LLM_FIRST_CHUNK_SECONDS = registry.register(Histogram(
+    "beepass_llm_first_chunk_seconds", "ストリーミングの LLM 呼び出しで最初の断片を受け取るまでの時間 (秒)",
+    LLM_LATENCY_BUCKETS, ("call",),
+))
+LLM_TOKENS = registry.register(Histogram(
+    "beepass_llm_tokens", "LLM の1回の呼び出しで使用したトークン数",
+    TOKEN_BUCKETS, ("call", "kind"),
+))
+LLM_TOKENS_TOTAL = registry.register(Counter(
+    "beepass_llm_tokens_total", "LLM で使用したトークン数の合計", ("kind",),
+))
+DB_QUERY_SECONDS = registry.register(Histogram(
+    "beepass_db_query_duration_seconds", "DB のクエリ1回の実行時間 (秒)",
+    DB_LATENCY_BUCKETS, ("operation",),
+))
+FREE_SLOTS_SECONDS = registry.register(Histogram(
+    "beepass_free_slots_compute_seconds", "空き時間の計算時間 (秒, DBの読み込みを除く)",
+    LATENCY_BUCKETS, ("endpoint",),
+))
+EVENTS_PER_REQUEST = registry.register(Histogram(
+    "beepass_events_per_request", "1リクエストで登録・返却した予定の件数",
+    COUNT_BUCKETS, ("endpoint",),
+))
+
+
+def observe_llm_usage(call: str, usage: Any) -> None:
+    """OpenAI 互換の usage (prompt_tokens, completion_tokens) を記録する"""
+    if usage is None:
+        return
+    for kind in ("prompt", "completion"):
+        tokens = getattr(usage, f"{kind}_tokens", None)
+        if tokens is not None:
+            LLM_TOKENS.observe(tokens, call=call, kind=kind)
+            LLM_TOKENS_TOTAL.inc(tokens, kind=kind)
+
+
+_QUERY_OPERATIONS = ("SELECT", "INSERT", "UPDATE", "DELETE")
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_query_start", []).append(time_module.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("metrics_query_start")
+    if not starts:
+        return
+    elapsed = time_module.perf_counter() - starts.pop()
+    operation = statement.lstrip()[:6].upper()
+    DB_QUERY_SECONDS.observe(elapsed, operation=operation if operation in _QUERY_OPERATIONS else "OTHER")
+
+
+def instrument_engine(engine: Engine) -> None:
+    """engine (非同期エンジンの場合は sync_engine) のクエリ時間を記録する"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class RequestProfiler:
+    """1リクエスト分のプロファイルを取る。pyinstrument があればそれを、なければ cProfile を使う。"""
+
+    def __init__(self):
+        if pyinstrument is not None:
+            # async_mode="enabled" で、await 中に他のタスクが動いた時間をこのリクエストに含めない
+            self._profiler = pyinstrument.Profiler(async_mode="enabled")
+        else:
+            self._profiler = cProfile.Profile()
+
+    def start(self) -> None:
+        if isinstance(self._profiler, cProfile.Profile):
+            self._profiler.enable()
+        else:
+            self._profiler.start()
+
+    def stop(self) -> None:
+        if isinstance(self._profiler, cProfile.Profile):
+            self._profiler.disable()
+        else:
+            self._profiler.stop()
+
+    def report(self) -> str:
+        if not isinstance(self._profiler, cProfile.Profile):
+            return self._profiler.output_text(unicode=True, color=False)
+        stream = io.StringIO()
+        stats = pstats.Stats(self._profiler, stream=stream)
+        stats.sort_stats(PROFILE_SORT).print_stats(PROFILE_LIMIT)
+        # cProfile はイベントループのスレッドで動いた全ての処理を含む (同時に処理中の他のリクエストも含まれる)
+        return stream.getvalue()
+
+
+def wants_profile(query_params: Any) -> bool:
+    return PROFILING_ENABLED and query_params.get("profile") in ("1", "true")
@@ -0,0 +1,128 @@
+"""
+起動時に実行する簡易マイグレーション。
+
+models に定義されたテーブルを create_all で作成したうえで、
+schema_migrations テーブルに記録されていない番号のマイグレーションだけを順に適用する。
+既存の scheduler.db もアプリ起動時に最新のスキーマへ更新される。
+複数のワーカーが同時に起動しても二重に適用しないよう、全体をファイルロック (fcntl.flock) の中で実行する。
+"""
+from typing import Callable, Iterator, List, Tuple
+from contextlib import contextmanager
+from datetime import datetime
+import hashlib
+import logging
+import os
+import tempfile
+
+try:
+    import fcntl
+except ImportError: # fcntl のない環境 (Windows) ではロックせずに実行する
+    fcntl = None
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, delete, func, select
+from sqlalchemy.engine import Connection, Engine
+
+import models
+
+logger = logging.getLogger(__name__)
+
+# ロックファイルのパス。未設定なら SQLite はDBファイルの隣、それ以外は一時ディレクトリ (接続先ごとに別のファイル)
+MIGRATION_LOCK_PATH = os.getenv("MIGRATION_LOCK_PATH")
+
+_migration_metadata = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations",
+    _migration_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def _create_index_if_missing(index_name: str) -> Callable[[Connection], None]:
+    def apply(conn: Connection) -> None:
+        index = next(ix for ix in models.Event.__table__.indexes if ix.name == index_name)
+        index.create(bind=conn, checkfirst=True)
+    return apply
+
+
+def _create_table_if_missing(model) -> Callable[[Connection], None]:
+    def apply(conn: Connection) -> None:
+        model.__table__.create(bind=conn, checkfirst=True)
+    return apply
+
+
+def _dedupe_events_and_add_unique_index(conn: Connection) -> None:
+    """同じ (氏名, 日付, 開始, 終了) の予定を1件 (id の最小のもの) だけ残して削除してから、一意インデックスを作る"""
+    Event = models.Event
+    keep = select(func.min(Event.id)).group_by(Event.name, Event.event_date, Event.start_time, Event.end_time)
+    removed = conn.execute(delete(Event).where(Event.id.not_in(keep))).rowcount
+    if removed:
+        logger.info(f"Removed {removed} duplicate events before adding the unique index")
+    _create_index_if_missing("ux_events_name_date_time")(conn)
+
+
+# (バージョン, 名前, 適用関数)。番号は単調増加させ、一度リリースしたものは変更しないこと。
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "add events (event_date, name) index", _create_index_if_missing("ix_events_event_date_name")),
+    (2, "add events (name, event_date) index", _create_index_if_missing("ix_events_name_event_date")),
+    (3, "add recurring_rules table", _create_table_if_missing(models.RecurringRule)),
+    (4, "add recurring_exceptions table", _create_table_if_missing(models.RecurringException)),
+    (5, "dedupe events and add unique (name, event_date, start_time, end_time) index", _dedupe_events_and_add_unique_index),
+]
+
+
+def applied_versions(conn: Connection) -> set:
+    return set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+
+def _lock_path(engine: Engine) -> str:
+    if MIGRATION_LOCK_PATH:
+        return MIGRATION_LOCK_PATH
+    url = engine.url
+    if url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:"):
+        return os.path.abspath(url.database) + ".migrate.lock"
+    digest = hashlib.sha1(url.render_as_string(hide_password=True).encode()).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), f"beepass-migrate-{digest}.lock")
+
+
+@contextmanager
+def migration_lock(engine: Engine) -> Iterator[None]:
+    """同じDBに対するマイグレーションを、同時に1プロセスだけが実行するための排他ロック"""
+    if fcntl is None:
+        yield
+        return
+    with open(_lock_path(engine), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def run_migrations(engine: Engine) -> List[int]:
+    """未適用のマイグレーションを適用し、適用したバージョン番号のリストを返す。"""
+    with migration_lock(engine):
+        return _run_migrations(engine)
+
+
+def _run_migrations(engine: Engine) -> List[int]:
+    models.Base.metadata.create_all(bind=engine)
+    _migration_metadata.create_all(bind=engine)
+
+    newly_applied: List[int] = []
+    with engine.begin() as conn:
+        done = applied_versions(conn)
+    for version, name, apply in MIGRATIONS:
+        if version in done:
+            continue
+        # マイグレーション1件ごとに1トランザクション
+        with engine.begin() as conn:
+            logger.info(f"Applying migration {version}: {name}")
+            apply(conn)
+            conn.execute(schema_migrations.insert().values(
+                version=version, name=name, applied_at=datetime.now()
+            ))
+        newly_applied.append(version)
+    return newly_applied
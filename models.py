@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Date, Time
+from sqlalchemy import Column, String, Date, Time, Integer, Index, ForeignKey
 from sqlalchemy.dialects.postgresql import UUID # UUIDはSQLiteではTEXTとして扱われる
 import uuid
 from database import Base
@@ -10,4 +10,43 @@ class Event(Base):
     name = Column(String, index=True, nullable=False)
     event_date = Column(Date, nullable=False) # YYYY-MM-DD
     start_time = Column(Time, nullable=False) # HH:MM
-    end_time = Column(Time, nullable=False)   # HH:MM
\ No newline at end of file
+    end_time = Column(Time, nullable=False)   # HH:MM
+
+    __table_args__ = (
+        # 月単位の範囲検索 (get_events_by_month, 空き時間検索) 用
+        Index("ix_events_event_date_name", "event_date", "name"),
+        # 名前 + 日付での削除・検索用
+        Index("ix_events_name_event_date", "name", "event_date"),
+        # 同じ予定の二重登録を防ぐ (登録時は interval_index で重複を除き、ON CONFLICT DO NOTHING で挿入する)
+        Index("ux_events_name_date_time", "name", "event_date", "start_time", "end_time", unique=True),
+    )
+
+class RecurringRule(Base):
+    """
+    毎週の繰り返し予定。月ごとに行を展開して保存せず、検索時に valid_from〜valid_until の範囲で展開する。
+    """
+    __tablename__ = "recurring_rules"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    name = Column(String, nullable=False)
+    weekday = Column(Integer, nullable=False)   # 0=月曜 ... 6=日曜 (date.weekday() と同じ)
+    start_time = Column(Time, nullable=False)
+    end_time = Column(Time, nullable=False)
+    valid_from = Column(Date, nullable=False)
+    valid_until = Column(Date, nullable=True)   # None の場合は無期限
+
+    __table_args__ = (
+        Index("ix_recurring_rules_name_weekday", "name", "weekday"),
+        Index("ix_recurring_rules_valid_from", "valid_from"),
+    )
+
+class RecurringException(Base):
+    """繰り返し予定のうち、個別に削除された日付"""
+    __tablename__ = "recurring_exceptions"
+
+    rule_id = Column(String, ForeignKey("recurring_rules.id", ondelete="CASCADE"), primary_key=True)
+    exception_date = Column(Date, primary_key=True)
+
+    __table_args__ = (
+        Index("ix_recurring_exceptions_exception_date", "exception_date"),
+    )
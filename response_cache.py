@@ -0,0 +1,156 @@
+"""
+月単位の読み取りエンドポイント (/events/, /free_slots/) のレスポンス本文のキャッシュ。
+
+(エンドポイント, 年, 月, パラメータ) をキーに、シリアライズ済みの JSON のバイト列を保持する。
+各エントリにはその時点の月のバージョン (change_tracker.month_version) を記録し、
+読み取り時にバージョンが変わっていれば古いものとして捨てる (明示的な無効化は不要)。
+バージョンはDBを読む前に取得するので、キャッシュされる本文は常にそのバージョン以降のデータになる。
+共有ストア (shared_cache) があれば本文をバージョン付きでそこにも保存し、他のワーカーが作った本文も使う。
+
+シリアライズには orjson を使う (インストールされていなければ標準の json)。
+列形式 (format=columnar) の本文もここで組み立てる。
+"""
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+from collections import OrderedDict
+from datetime import date
+import asyncio
+import json
+import os
+import threading
+
+try:
+    import orjson
+except ImportError: # orjson は任意の依存
+    orjson = None
+
+import free_slots
+import shared_cache
+
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "256"))
+_NAMESPACE = "responses"
+
+
+def _default(value: Any) -> Any:
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value: Any) -> bytes:
+    """JSON のバイト列にする。date / time はそのまま渡してよい (ISO 形式になる)。"""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=_default).encode()
+
+
+def columnar_events(events: Iterable, year: int, month: int) -> Dict[str, Any]:
+    """
+    予定を列ごとの配列にする。members は氏名の一覧で、member はその添字。
+    day は日 (1〜31)、start / end は0時からの経過分 (終了時刻の秒は切り上げ)。
+    """
+    member_index: Dict[str, int] = {}
+    member, day, start, end, ids = [], [], [], [], []
+    for event in events:
+        member.append(member_index.setdefault(event.name, len(member_index)))
+        day.append(event.event_date.day)
+        start.append(free_slots.time_to_start_minute(event.start_time))
+        end.append(free_slots.time_to_end_minute(event.end_time))
+        ids.append(event.id)
+    return {
+        "format": "columnar", "year": year, "month": month,
+        "members": list(member_index), "member": member, "day": day, "start": start, "end": end, "id": ids,
+    }
+
+
+def columnar_free_slots(slots_by_date: Dict[date, List[free_slots.Interval]], year: int, month: int) -> Dict[str, Any]:
+    """空きスロットを列ごとの配列にする。day は日 (1〜31)、start / end は0時からの経過分。"""
+    day, start, end = [], [], []
+    for target_date, slots in slots_by_date.items():
+        for slot_start, slot_end in slots:
+            day.append(target_date.day)
+            start.append(slot_start)
+            end.append(slot_end)
+    return {"format": "columnar", "year": year, "month": month, "day": day, "start": start, "end": end}
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES, store: Optional[shared_cache.SharedStore] = None):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[str, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._store = store
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def _get_local(self, key: Hashable, version: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+        return None
+
+    def _get_shared(self, key: Hashable, version: str) -> Optional[bytes]:
+        """共有ストアから読む (ブロッキングI/O)。見つからなければ失敗として数える"""
+        if self._store is not None:
+            row = self._store.get(_NAMESPACE, repr(key))
+            if row is not None and row[1] == version:
+                self._remember(key, version, row[0])
+                with self._lock:
+                    self.shared_hits += 1
+                return row[0]
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def get(self, key: Hashable, version: str) -> Optional[bytes]:
+        body = self._get_local(key, version)
+        return body if body is not None else self._get_shared(key, version)
+
+    async def get_async(self, key: Hashable, version: str) -> Optional[bytes]:
+        """get の非同期版。共有ストアの読み込みはスレッドプールで行う (メモリ上で見つかればそのまま返す)"""
+        body = self._get_local(key, version)
+        if body is not None:
+            return body
+        if self._store is None:
+            return self._get_shared(key, version)
+        return await asyncio.to_thread(self._get_shared, key, version)
+
+    def set(self, key: Hashable, version: str, body: bytes) -> None:
+        self._remember(key, version, body)
+        if self._store is not None:
+            self._store.set(_NAMESPACE, repr(key), body, tag=version)
+
+    async def set_async(self, key: Hashable, version: str, body: bytes) -> None:
+        """set の非同期版。共有ストアへの書き込みはスレッドプールで行う"""
+        self._remember(key, version, body)
+        if self._store is not None:
+            await asyncio.to_thread(self._store.set, _NAMESPACE, repr(key), body, tag=version)
+
+    def _remember(self, key: Hashable, version: str, body: bytes) -> None:
+        with self._lock:
+            self._entries[key] = (version, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "bytes": sum(len(body) for _, body in self._entries.values()),
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.shared_hits) / lookups if lookups else 0.0,
+            }
+
+
+cache = ResponseCache(store=shared_cache.store)
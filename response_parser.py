@@ -0,0 +1,370 @@
+"""
+モデルの応答 (予定の抽出結果) の解析。
+
+- モデルには JSON Schema による構造化出力を要求し (response_format)、応答を1回で解析する
+- JSON の解析には orjson を使う (インストールされていなければ標準の json)
+- 時刻・日付はコンパイル済みの正規表現で解析し、同じ文字列の結果はキャッシュする
+- 応答が途中で切れていた場合は、最後に閉じた要素までで JSON を閉じ直して読めた分だけを使う
+- ストリーミングの応答は IncrementalExtractionParser で、events の要素が閉じるたびに1件ずつ取り出す
+- 不正な要素のログは1件ずつではなく、応答ごとにまとめて出す
+"""
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import date, time
+from functools import lru_cache
+import json
+import logging
+import re
+
+try:
+    import orjson
+except ImportError: # orjson は任意の依存
+    orjson = None
+
+from schemas import EventDetailProcessed
+
+logger = logging.getLogger(__name__)
+
+WEEKDAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+EVENT_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "date": {"type": "string", "description": "YYYY-MM-DD"},
+        "day_of_week": {"type": "string", "enum": WEEKDAY_NAMES},
+        "start": {"type": "string", "description": "HH:MM"},
+        "end": {"type": "string", "description": "HH:MM"},
+    },
+    "required": ["start", "end"],
+}
+
+EXTRACTION_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "name": {"type": "string"},
+        "events": {"type": "array", "items": EVENT_SCHEMA},
+    },
+    "required": ["name", "events"],
+}
+
+BATCH_EXTRACTION_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "members": {"type": "array", "items": EXTRACTION_SCHEMA},
+    },
+    "required": ["members"],
+}
+
+
+def response_format(schema: Dict[str, Any], name: str) -> Dict[str, Any]:
+    """chat.completions.create の response_format に渡す構造化出力の指定"""
+    return {"type": "json_schema", "json_schema": {"name": name, "schema": schema}}
+
+
+def loads(text: str) -> Any:
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def strip_code_fence(raw_response_content: str) -> str:
+    cleaned_response_content = raw_response_content.strip()
+    if cleaned_response_content.startswith("```json"):
+        cleaned_response_content = cleaned_response_content[7:]
+    elif cleaned_response_content.startswith("```"):
+        cleaned_response_content = cleaned_response_content[3:]
+    if cleaned_response_content.endswith("```"):
+        cleaned_response_content = cleaned_response_content[:-3]
+    return cleaned_response_content.strip()
+
+
+def close_truncated_json(text: str) -> Optional[str]:
+    """
+    途中で切れた (または後ろに余計な文字がある) JSON を、最後に閉じたオブジェクト・配列の直後で切り、
+    開いたままの括弧を閉じた文字列を返す。オブジェクトや配列が1つもなければ None。
+    """
+    start = min((i for i in (text.find("{"), text.find("[")) if i >= 0), default=-1)
+    if start < 0:
+        return None
+    stack: List[str] = []
+    in_string = False
+    escaped = False
+    safe_end = -1
+    safe_stack: List[str] = []
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch == "{" or ch == "[":
+            stack.append(ch)
+            # 開いた直後で切っても空のオブジェクト・配列として閉じられる
+            safe_end = i + 1
+            safe_stack = list(stack)
+        elif ch == "}" or ch == "]":
+            if not stack:
+                break
+            stack.pop()
+            if not stack:
+                # 全体が閉じた (後ろに余計な文字がある場合)
+                return text[start:i + 1]
+            safe_end = i + 1
+            safe_stack = list(stack)
+    if safe_end < 0:
+        return None
+    closing = "".join("}" if bracket == "{" else "]" for bracket in reversed(safe_stack))
+    return text[start:safe_end] + closing
+
+
+def loads_tolerant(text: str) -> Tuple[Any, bool]:
+    """JSON を解析する。そのままでは読めない場合は close_truncated_json で修復して読む。(値, 修復したか) を返す。"""
+    try:
+        return loads(text), False
+    except ValueError as original_error:
+        repaired = close_truncated_json(text)
+        if repaired is None:
+            raise
+        try:
+            value = loads(repaired)
+        except ValueError:
+            raise original_error
+        logger.warning(f"JSON応答が不完全だったため、読み取れた部分だけを使用します ({len(repaired)}/{len(text)} 文字)")
+        return value, True
+
+
+_TIME_RE = re.compile(r"\s*(\d{1,2}):(\d{1,2})(?::(\d{1,2}))?\s*")
+_DATE_RE = re.compile(r"\s*(\d{4})-(\d{1,2})-(\d{1,2})\s*")
+
+
+@lru_cache(maxsize=4096)
+def _parse_time(value: str) -> Optional[time]:
+    match = _TIME_RE.fullmatch(value)
+    if match is None:
+        return None
+    hour, minute, second = int(match[1]), int(match[2]), int(match[3] or 0)
+    if hour < 24 and minute < 60 and second < 60:
+        return time(hour, minute, second)
+    return None
+
+
+@lru_cache(maxsize=4096)
+def _parse_date(value: str) -> Optional[date]:
+    match = _DATE_RE.fullmatch(value)
+    if match is None:
+        return None
+    try:
+        return date(int(match[1]), int(match[2]), int(match[3]))
+    except ValueError:
+        return None
+
+
+def parse_time(value: Any) -> Optional[time]:
+    """"HH:MM" または "HH:MM:SS" を time に変換する。不正な場合は None。"""
+    return _parse_time(value) if isinstance(value, str) else None
+
+
+def parse_date(value: Any) -> Optional[date]:
+    """"YYYY-MM-DD" を date に変換する。不正な場合は None。"""
+    return _parse_date(value) if isinstance(value, str) else None
+
+
+def parse_events(raw_events_list: List[Any]) -> List[EventDetailProcessed]:
+    """
+    モデルが返したイベントの辞書を変換する。開始・終了時刻のないものはスキップする。
+    値は変換済みなので、EventDetailProcessed は検証を省いて作る。
+    """
+    construct = EventDetailProcessed.model_construct
+    processed_events: List[EventDetailProcessed] = []
+    skipped = 0
+    invalid_dates = 0
+    for event_dict in raw_events_list:
+        if type(event_dict) is not dict:
+            skipped += 1
+            continue
+        start_time_obj = parse_time(event_dict.get("start"))
+        end_time_obj = parse_time(event_dict.get("end"))
+        if start_time_obj is None or end_time_obj is None:
+            skipped += 1
+            continue
+        date_str = event_dict.get("date")
+        date_obj = None
+        if date_str:
+            date_obj = parse_date(date_str)
+            if date_obj is None:
+                invalid_dates += 1
+        day_of_week_str = event_dict.get("day_of_week")
+        if not isinstance(day_of_week_str, str):
+            day_of_week_str = None
+        processed_events.append(construct(
+            event_date=date_obj,
+            day_of_week=day_of_week_str,
+            start_time=start_time_obj,
+            end_time=end_time_obj,
+        ))
+    if skipped or invalid_dates:
+        logger.warning(
+            f"{len(raw_events_list)} 件中 {skipped} 件のイベントを開始/終了時刻の不備などでスキップし、"
+            f"{invalid_dates} 件の不正な日付を無視しました"
+        )
+    return processed_events
+
+
+def _load_object(raw_response_content: str) -> Tuple[Dict[str, Any], bool]:
+    cleaned_response_content = strip_code_fence(raw_response_content)
+    try:
+        data, recovered = loads_tolerant(cleaned_response_content)
+    except ValueError as e:
+        raise ValueError(f"Gemini APIがJSON形式でない応答を返しました: {e}. Response: {cleaned_response_content[:200]}...") from e
+    if not isinstance(data, dict):
+        raise ValueError(f"Gemini APIの応答がJSONオブジェクトではありません. Response: {cleaned_response_content[:200]}...")
+    return data, recovered
+
+
+def parse_extraction(raw_response_content: str, fallback_name: Optional[str] = None) -> Tuple[Dict[str, Any], bool]:
+    """
+    1人分の抽出結果を {"name": 氏名, "events": [EventDetailProcessed, ...]} に変換し、(結果, 途中で切れていたか) を返す。
+    応答が途中で切れていて name が読めなかった場合は fallback_name を使う。
+    """
+    data, recovered = _load_object(raw_response_content)
+    if recovered and "name" not in data and "events" not in data:
+        raise ValueError(f"Gemini APIの応答が途中で切れていて、予定を読み取れませんでした. Response: {raw_response_content[:200]}...")
+    name = data.get("name")
+    if not isinstance(name, str):
+        if recovered and fallback_name is not None:
+            name = fallback_name
+        else:
+            raise ValueError(f"Gemini APIの応答の基本構造が不正です (nameがない等). Response: {raw_response_content[:200]}...")
+    events = data.get("events")
+    if not isinstance(events, list):
+        if not recovered:
+            raise ValueError(f"Gemini APIの応答の基本構造が不正です (eventsがない等). Response: {raw_response_content[:200]}...")
+        events = []
+    return {"name": name, "events": parse_events(events)}, recovered
+
+
+# 文字列 (閉じたもの / 断片の終わりで切れているもの) と、構造を表す文字
+_TOKEN_RE = re.compile(r'(?P<string>"[^"\\]*(?:\\.[^"\\]*)*")|(?P<partial>"[^"\\]*(?:\\.[^"\\]*)*\\?\Z)|[{}\[\],]')
+
+
+class IncrementalExtractionParser:
+    """
+    1人分の抽出結果 ({"name": ..., "events": [...]}) を、ストリーミングの断片ごとに読み進める。
+    feed() は、その断片で閉じた events の要素 (辞書のまま) を返す。文字列と括弧だけを字句として読んで入れ子の深さを追い、
+    閉じた要素の部分だけを loads で解析するので、全体の解析をやり直さない。
+    前後のマークダウン記法や説明文は、最初の "{" より前と最上位のオブジェクトが閉じた後として無視する。
+    """
+
+    def __init__(self):
+        self._chunks: List[str] = [] # 受け取った断片 (応答の全体は text で取り出す)
+        self._buffer = "" # まだ使い終わっていない部分 (読みかけの要素・文字列から後ろ)
+        self.name: Optional[str] = None
+        self.started = False # 最上位のオブジェクトが始まったか
+        self.done = False # 最上位のオブジェクトが閉じたか
+        self.has_events = False # "events" の配列が始まったか
+        self._pos = 0
+        self._stack: List[str] = []
+        self._expect_key = False # 最上位のオブジェクトで、次の文字列がキーか
+        self._key: Optional[str] = None # 最上位のオブジェクトで値を読んでいるキー
+        self._in_events = False
+        self._item_start = -1
+
+    def feed(self, chunk: str) -> List[Any]:
+        self._chunks.append(chunk)
+        text = self._buffer + chunk
+        stack = self._stack
+        items: List[Any] = []
+        i = self._pos
+        for match in _TOKEN_RE.finditer(text, i):
+            if self.done:
+                break
+            token = match.group()
+            i = match.end()
+            if match.lastgroup == "string":
+                if len(stack) == 1:
+                    self._on_top_level_string(token)
+            elif match.lastgroup == "partial":
+                # 断片の終わりで切れた文字列は、次の断片と合わせて読み直す
+                i = match.start()
+                break
+            elif token == "{" or token == "[":
+                depth = len(stack)
+                if depth == 0:
+                    if token == "{":
+                        self.started = True
+                        self._expect_key = True
+                        stack.append(token)
+                else:
+                    if depth == 1 and token == "[" and self._key == "events":
+                        self._in_events = True
+                        self.has_events = True
+                    elif depth == 2 and self._in_events:
+                        self._item_start = match.start()
+                    stack.append(token)
+            elif token == "}" or token == "]":
+                if stack:
+                    stack.pop()
+                    depth = len(stack)
+                    if depth == 0:
+                        self.done = True
+                    elif depth == 1:
+                        self._in_events = False
+                    elif depth == 2 and self._in_events and self._item_start >= 0:
+                        items.append(self._load_item(text[self._item_start:i]))
+                        self._item_start = -1
+            elif len(stack) == 1: # ","
+                self._expect_key = True
+                self._key = None
+        else:
+            i = len(text)
+        # 読みかけの要素・文字列より前は二度と参照しないので捨てる (位置はバッファの先頭からの相対位置)
+        keep = min(i, self._item_start) if self._item_start >= 0 else i
+        self._buffer = text[keep:]
+        self._pos = i - keep
+        if self._item_start >= 0:
+            self._item_start -= keep
+        return items
+
+    @property
+    def text(self) -> str:
+        """受け取った応答の全体"""
+        return "".join(self._chunks)
+
+    def _on_top_level_string(self, literal: str) -> None:
+        if self._expect_key:
+            self._key = loads(literal)
+            self._expect_key = False
+        elif self._key == "name" and self.name is None:
+            self.name = loads(literal)
+
+    @staticmethod
+    def _load_item(literal: str) -> Any:
+        try:
+            return loads(literal)
+        except ValueError:
+            return None # parse_events で不正な要素としてスキップされる
+
+
+def parse_batch_extraction(raw_response_content: str) -> List[Dict[str, Any]]:
+    """
+    複数人分の抽出結果を [{"name": 氏名, "events": [...]}, ...] に変換する。不正な要素はスキップする。
+    応答が途中で切れていた場合、最後のメンバーは予定が欠けている可能性があるので含めない。
+    """
+    data, recovered = _load_object(raw_response_content)
+    members = data.get("members")
+    if not isinstance(members, list):
+        raise ValueError("members がリストではありません。")
+    if recovered:
+        members = members[:-1]
+    results = []
+    for member in members:
+        if not isinstance(member, dict) or not isinstance(member.get("name"), str) or not isinstance(member.get("events"), list):
+            logger.warning(f"まとめて抽出した応答の要素が不正なためスキップします: {str(member)[:100]}")
+            continue
+        results.append({"name": member["name"], "events": parse_events(member["events"])})
+    return results
@@ -31,6 +31,25 @@ class EventResponse(EventBase):
         "from_attributes": True
     }
 
+class ColumnarEventsResponse(BaseModel): # /events/?format=columnar の本文 (response_cache.columnar_events)
+    format: str = "columnar"
+    year: int
+    month: int
+    members: List[str] # 氏名の一覧 (member はその添字)
+    member: List[int]
+    day: List[int]     # 日 (1〜31)
+    start: List[int]   # 0時からの経過分
+    end: List[int]
+    id: List[str]
+
+class RecurringRuleCreate(BaseModel):
+    name: str
+    weekday: int # 0=月曜 ... 6=日曜
+    start_time: time
+    end_time: time
+    valid_from: date
+    valid_until: Optional[date] = None
+
 class ScheduleInput(BaseModel):
     name: str
     schedule_text: Optional[str] = None
\ No newline at end of file
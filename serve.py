@@ -0,0 +1,70 @@
+"""
+本番用の起動スクリプト (複数ワーカー)。
+
+    python serve.py --workers 4 --port 8000                  # uvicorn のマルチプロセス
+    python serve.py --workers 4 --server gunicorn            # gunicorn + UvicornWorker (要 gunicorn, uvicorn-worker)
+
+- マイグレーションは親プロセスで1回だけ (ファイルロック付きで) 実行し、ワーカーは MIGRATE_ON_STARTUP=0 で起動する
+- ワーカーが2つ以上のときは共有ストア (SHARED_CACHE_BACKEND、未指定なら shm) を使い、
+  変更の通知・抽出結果・空き時間の区間・レスポンス本文をワーカー間で共有する。
+  共有ストアは起動時に空にする (抽出結果は DB の内容によらないので残す)
+  他のワーカーの変更は SHARED_SYNC_INTERVAL_MS (既定 50 ms) ごとに取り込むので、見えるまで最大でその分遅れる
+- ジョブキュー (/jobs/) と /metrics の値はワーカーごと。async_mode のジョブの状態は、登録したワーカーにしか問い合わせられない
+"""
+import argparse
+import logging
+import os
+import shutil
+import sys
+
+logger = logging.getLogger("serve")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "1")))
+    parser.add_argument("--server", choices=("uvicorn", "gunicorn"), default="uvicorn")
+    parser.add_argument("--worker-class", default="uvicorn_worker.UvicornWorker", help="gunicorn のワーカークラス")
+    parser.add_argument("--shared-cache", default=None,
+                        help="共有ストアのバックエンド (shm / sqlite / none)。未指定なら SHARED_CACHE_BACKEND、"
+                             "それもなければワーカーが2つ以上のとき shm")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level.upper())
+
+    # 設定は各モジュールの読み込み時に環境変数から読まれるので、読み込む前に決める (ワーカーにも引き継がれる)
+    backend = args.shared_cache or os.getenv("SHARED_CACHE_BACKEND") or ("shm" if args.workers > 1 else "none")
+    os.environ["SHARED_CACHE_BACKEND"] = backend
+    if args.workers > 1 and backend == "none":
+        logger.warning("Running multiple workers without a shared cache: caches are not invalidated across workers")
+
+    import database
+    import migrations
+    import shared_cache
+
+    applied = migrations.run_migrations(database.engine)
+    logger.info(f"Migrations applied: {applied or 'none'}")
+    database.engine.dispose()
+    if shared_cache.store is not None:
+        shared_cache.store.reset()
+    os.environ["MIGRATE_ON_STARTUP"] = "0"
+
+    if args.server == "gunicorn":
+        if shutil.which("gunicorn") is None:
+            sys.exit("gunicorn が見つかりません (pip install gunicorn uvicorn-worker)")
+        os.execvp("gunicorn", [
+            "gunicorn", "main:app",
+            "--worker-class", args.worker_class,
+            "--workers", str(args.workers),
+            "--bind", f"{args.host}:{args.port}",
+            "--log-level", args.log_level,
+        ])
+
+    import uvicorn
+    uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers, log_level=args.log_level)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+複数ワーカー (プロセス) で共有するキャッシュと変更ログ。
+
+SHARED_CACHE_BACKEND で保存先を選ぶ。未設定ならワーカーごとのメモリ上のキャッシュだけを使う (1プロセスで動かす場合)。
+- shm:    /dev/shm (tmpfs = 共有メモリ) 上の SQLite ファイル。ディスクに書かずにプロセス間で共有できる
+- sqlite: SHARED_CACHE_PATH の SQLite ファイル
+どちらも WAL モードで開くので、書き込み中も他のワーカーの読み取りは止まらない。外部のサービスは不要。
+保存先を増やす場合は BACKENDS に (パス -> SharedStore を作る関数) を登録する。
+
+保存するもの
+- キャッシュ: (名前空間, キー) -> (値のバイト列, タグ, 保存時刻)。タグには月のバージョンなどを入れ、読み取り側で照合する
+- 変更ログ: change_tracker がコミットされた変更を書き込み、他のワーカーは次のリクエストの最初に読み取って
+  自分のキャッシュを無効化する。古いログは CHANGE_LOG_MAX_ROWS 件を超えたら捨てる
+- 変更カウンタ (月ごとの最後の変更の番号) と、ETag に含めるエポック (起動時に reset() で作り直す)
+"""
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import hashlib
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time as time_module
+import uuid
+
+from database import DATABASE_URL
+
+logger = logging.getLogger(__name__)
+
+SHARED_CACHE_BACKEND = os.getenv("SHARED_CACHE_BACKEND", "").lower() # "" / "shm" / "sqlite"
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH", "")               # 未設定なら DATABASE_URL ごとに決まるパス
+SHARED_CACHE_BUSY_TIMEOUT_SECONDS = float(os.getenv("SHARED_CACHE_BUSY_TIMEOUT_SECONDS", "5"))
+# 名前空間ごとに保持するキャッシュの件数 (超えたら古いものから捨てる)
+SHARED_CACHE_MAX_ENTRIES = int(os.getenv("SHARED_CACHE_MAX_ENTRIES", "10000"))
+CHANGE_LOG_MAX_ROWS = int(os.getenv("CHANGE_LOG_MAX_ROWS", "10000"))
+# この回数の書き込みごとに、件数の上限を超えた古いキャッシュを捨てる
+_PRUNE_EVERY = 100
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS cache (namespace TEXT NOT NULL, key TEXT NOT NULL, tag TEXT NOT NULL, "
+    "value BLOB NOT NULL, created_at REAL NOT NULL, PRIMARY KEY (namespace, key))",
+    "CREATE INDEX IF NOT EXISTS ix_cache_namespace_created_at ON cache (namespace, created_at)",
+    "CREATE TABLE IF NOT EXISTS change_log (seq INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL, created_at REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS change_versions (key TEXT PRIMARY KEY, seq INTEGER NOT NULL, modified REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)",
+)
+
+
+class SharedStore:
+    """SQLite ファイルを使ったプロセス間で共有するストア。接続はスレッドごと (プロセスごと) に開く。"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._sets = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            # isolation_level=None: 自動コミット。複数の文をまとめる場合だけ BEGIN IMMEDIATE を明示する
+            conn = sqlite3.connect(self.path, timeout=SHARED_CACHE_BUSY_TIMEOUT_SECONDS, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    # --- キャッシュ
+
+    def get(self, namespace: str, key: str) -> Optional[Tuple[bytes, str, float]]:
+        """(値, タグ, 保存時刻)。なければ None。"""
+        row = self._conn().execute(
+            "SELECT value, tag, created_at FROM cache WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()
+        return (bytes(row[0]), row[1], row[2]) if row is not None else None
+
+    def set(self, namespace: str, key: str, value: bytes, tag: str = "") -> None:
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (namespace, key, tag, value, created_at) VALUES (?, ?, ?, ?, ?)",
+            (namespace, key, tag, value, time_module.time()),
+        )
+        self._sets += 1
+        if self._sets % _PRUNE_EVERY == 0:
+            self.prune(namespace)
+
+    def delete(self, namespace: str, key: str) -> None:
+        self._conn().execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def prune(self, namespace: str, max_entries: int = SHARED_CACHE_MAX_ENTRIES) -> None:
+        self._conn().execute(
+            "DELETE FROM cache WHERE namespace = ? AND rowid IN "
+            "(SELECT rowid FROM cache WHERE namespace = ? ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (namespace, namespace, max_entries),
+        )
+
+    def clear(self, namespaces: Optional[Iterable[str]] = None) -> None:
+        """namespaces のキャッシュを消す。None なら全て。"""
+        conn = self._conn()
+        if namespaces is None:
+            conn.execute("DELETE FROM cache")
+        else:
+            conn.executemany("DELETE FROM cache WHERE namespace = ?", [(namespace,) for namespace in namespaces])
+
+    # --- 変更ログ
+
+    def publish_changes(self, payload: str, version_keys: Iterable[str], everything: bool, now: float) -> int:
+        """変更をログに追加し、version_keys のカウンタをその番号にする。追加した番号を返す。"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            seq = conn.execute("INSERT INTO change_log (payload, created_at) VALUES (?, ?)", (payload, now)).lastrowid
+            if everything:
+                conn.execute("DELETE FROM change_versions WHERE key LIKE 'm:%'")
+            conn.executemany(
+                "INSERT OR REPLACE INTO change_versions (key, seq, modified) VALUES (?, ?, ?)",
+                [(key, seq, now) for key in version_keys],
+            )
+            if seq % _PRUNE_EVERY == 0:
+                conn.execute("DELETE FROM change_log WHERE seq <= ?", (seq - CHANGE_LOG_MAX_ROWS,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return seq
+
+    def changes_since(self, seq: int) -> List[Tuple[int, str, float]]:
+        """seq より後の変更 (番号, 内容, 時刻) を番号順に返す"""
+        return self._conn().execute(
+            "SELECT seq, payload, created_at FROM change_log WHERE seq > ? ORDER BY seq", (seq,)
+        ).fetchall()
+
+    def version_snapshot(self) -> Tuple[str, float, int, Dict[str, Tuple[int, float]]]:
+        """(エポック, エポックの作成時刻, 最新の変更の番号, {カウンタ名: (番号, 時刻)}) を1つのトランザクションで読む"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            epoch = dict(conn.execute("SELECT key, value FROM meta WHERE key IN ('epoch', 'epoch_time')").fetchall())
+            if "epoch" not in epoch:
+                epoch = self._new_epoch(conn)
+            last_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+            versions = {key: (seq, modified) for key, seq, modified in conn.execute("SELECT key, seq, modified FROM change_versions")}
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return epoch["epoch"], float(epoch["epoch_time"]), last_seq, versions
+
+    @staticmethod
+    def _new_epoch(conn: sqlite3.Connection) -> Dict[str, str]:
+        epoch = {"epoch": uuid.uuid4().hex[:12], "epoch_time": repr(time_module.time())}
+        conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", list(epoch.items()))
+        return epoch
+
+    def reset(self, keep_namespaces: Iterable[str] = ("extraction",)) -> None:
+        """
+        変更ログ・カウンタと、keep_namespaces 以外のキャッシュを消してエポックを作り直す。
+        サーバーの起動時 (ワーカーを起動する前) に呼ぶ。停止中にDBが変わっていても古いキャッシュを使わないようにする。
+        """
+        keep = list(keep_namespaces)
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM change_log")
+            conn.execute("DELETE FROM change_versions")
+            conn.execute(f"DELETE FROM cache WHERE namespace NOT IN ({','.join('?' * len(keep))})", keep)
+            self._new_epoch(conn)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def stats(self) -> Dict[str, object]:
+        conn = self._conn()
+        namespaces = {
+            namespace: {"entries": entries, "bytes": size}
+            for namespace, entries, size in conn.execute(
+                "SELECT namespace, COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM cache GROUP BY namespace"
+            )
+        }
+        return {
+            "path": self.path,
+            "namespaces": namespaces,
+            "change_log_rows": conn.execute("SELECT COUNT(*) FROM change_log").fetchone()[0],
+        }
+
+
+def _default_file_name() -> str:
+    # 同じマシンで別の DB を使うアプリ同士がストアを共有しないよう、DATABASE_URL から名前を決める
+    database_url = DATABASE_URL
+    if database_url.startswith("sqlite:///") and not database_url.startswith("sqlite:////"):
+        database_url = "sqlite:///" + os.path.abspath(database_url[len("sqlite:///"):])
+    return f"beepass-cache-{hashlib.sha1(database_url.encode()).hexdigest()[:12]}.db"
+
+
+def _shm_store(path: str) -> SharedStore:
+    shm_dir = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return SharedStore(path or os.path.join(shm_dir, _default_file_name()))
+
+
+def _sqlite_store(path: str) -> SharedStore:
+    return SharedStore(path or os.path.join(tempfile.gettempdir(), _default_file_name()))
+
+
+# バックエンド名 -> (SHARED_CACHE_PATH -> SharedStore)
+BACKENDS: Dict[str, Callable[[str], SharedStore]] = {
+    "shm": _shm_store,
+    "sqlite": _sqlite_store,
+}
+
+
+def open_store(backend: str = SHARED_CACHE_BACKEND, path: str = SHARED_CACHE_PATH) -> Optional[SharedStore]:
+    """設定されたバックエンドのストアを開く。backend が空または "none" なら None (共有しない)。"""
+    if not backend or backend == "none":
+        return None
+    factory = BACKENDS.get(backend)
+    if factory is None:
+        raise ValueError(f"未知の SHARED_CACHE_BACKEND です: {backend} (選択肢: {', '.join(BACKENDS)})")
+    store = factory(path)
+    logger.info(f"Using shared cache backend {backend}: {store.path}")
+    return store
+
+
+store = open_store()